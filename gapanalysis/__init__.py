@@ -1,3 +1,5 @@
-from gapanalysis import landcover, misc, richness, data, habitat, docs
+from gapanalysis import landcover, misc, richness, data, habitat, docs, raster, rat, \
+    tiff
 
-__all__ = ['landcover', 'misc', 'richness', 'data', 'habitat', 'docs']
\ No newline at end of file
+__all__ = ['landcover', 'misc', 'richness', 'data', 'habitat', 'docs', 'raster', 
+           'rat', 'tiff']
\ No newline at end of file
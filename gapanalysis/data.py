@@ -1,7 +1,8 @@
 # A module of functions related to managing the data needed for analyses.
 
 def CheckHabMaps(rasters, nodata=0, Format="TIFF", pixel_type="U2", maximum=3,
-                 minimum=3, zero=False):
+                 minimum=3, zero=False, engine="arcpy", workers=1, tileSize=4096,
+                 statistics=True, cache=None, hashing=False):
     '''
     (list) -> dictionary
     
@@ -28,21 +29,50 @@ def CheckHabMaps(rasters, nodata=0, Format="TIFF", pixel_type="U2", maximum=3,
         "Zeros" -- The value "0" exists in the table.
     
     Argument:
-    rasters -- A list of rasters to check.
+    rasters -- A list of rasters to check.  With the numpy engine, these can include
+        raster.VirtualExtent handles, to check range-extent maps as the CONUS extent
+        maps they stand in for.  Those have no nodata value, so they're never listed
+        in "WrongNoDataValue".
     nodata -- Designate a desired nodata value.
     Format -- The desired format (i.e., "TIFF" or "GRID") 
     maximum -- Allowable max value for the raster.
     minimum -- Allowable min value for the raster.
     zero -- True or False on whether to check for the existence of 0 values in the table.
-    
+    engine -- How to check the rasters.  "arcpy" (the default) describes each raster
+        and reads its attribute table with a search cursor, one raster at a time.
+        "numpy" reads the projection, format, pixel type, and nodata value from the
+        file header (GeoTIFF tags are parsed directly, see tiff.Describe, and other
+        formats are opened with GDAL) and tallies a histogram of the cells in 
+        windows (see rat.Histogram), on a pool of processes.  The minimum, maximum,
+        and table checks then use the histogram, or the raster attribute table GDAL
+        finds for the raster if there is one, and "CursorProblem" lists rasters that
+        can't be read.  Results are the same lists, in the order the rasters were
+        passed.  See IterCheckHabMaps for a record per raster as each is checked.
+    workers -- Number of processes the numpy engine checks rasters with.
+    tileSize -- Width and height, in cells, of the windows the numpy engine reads.
+    statistics -- With the numpy engine, False skips reading cells, so only the
+        header properties are checked and the minimum, maximum, and table lists
+        stay empty.  Checking the headers of thousands of GeoTIFFs takes seconds.
+    cache -- With the numpy engine, optionally the path to a SQLite database to 
+        cache what's found about each raster (its header properties, histogram, 
+        and attribute table) in, keyed by its absolute path, size, and modification
+        time.  Later calls only inspect rasters that are new or have changed, and 
+        since the checks are made from the cached facts, changing the desired 
+        properties doesn't invalidate the cache.  Entries for files that no longer
+        exist are deleted whenever the cache is opened.
+    hashing -- With a cache, True to also key entries by a hash of the file's 
+        contents, for files that may change without their size or modification time
+        changing.  This reads every file, but is still much faster than decoding it.
 
     Examples:
     >>> BadProperties = CheckHabMaps(arcpy.ListRasters())
     >>> a = BadProperties["WrongNoDataValue"]
     >>> a
     ['amwlfx.tif', 'andsax.tif']
+    >>> BadProperties = CheckHabMaps(rasters, engine="numpy", workers=8)
     '''
-    import arcpy, time
+    if engine not in ("arcpy", "numpy"):
+        raise ValueError('engine must be "arcpy" or "numpy", not {0}'.format(engine))
     
     #######################################  Initialize dictionaries for collection
     ###############################################################################
@@ -56,13 +86,30 @@ def CheckHabMaps(rasters, nodata=0, Format="TIFF", pixel_type="U2", maximum=3,
     badCount = []
     cursorProblem = []
     overMax = []
-    zero = []
+    zeros = []
+    results = {"WrongProjection":WrongProjection, "WrongNoDataValue":WrongNoDataValue,
+               "WrongPixelType":WrongPixelType, "WrongFormat":WrongFormat, 
+               "WrongMinimum":WrongMinimum, "WrongMaximum":WrongMaximum, 
+               "BadCount":badCount, "CursorProblem":cursorProblem, "overMax":overMax,
+               "NoRows":noRows, "Zeros":zeros}
+
+    ################################################# Check the rasters with GDAL
+    ###############################################################################
+    if engine == "numpy":
+        found = dict(_InspectHabMaps(rasters, workers, tileSize, statistics, cache, 
+                                     hashing, report=True))
+        for r in rasters:
+            for key, name in _CheckHabMap(r, found[r], nodata, Format, pixel_type, 
+                                          maximum, minimum, zero):
+                results[key].append(name)
+        return results
+    
+    import arcpy
 
     ########################################################### Examine each raster
     ###############################################################################
     for r in rasters:
         print(r)
-        time.sleep(.1)
         rasObj = arcpy.Raster(r)
         desObj = arcpy.Describe(rasObj)
         ######################################## Examine describe object properties
@@ -100,7 +147,6 @@ def CheckHabMaps(rasters, nodata=0, Format="TIFF", pixel_type="U2", maximum=3,
                         RowsOK = True
                     else:
                         pass
-                    time.sleep(.1)
                     value = c.getValue("VALUE")
                     if value > maximum:
                         print(r + " - has a value greater than {0}".format(maximum))
@@ -108,236 +154,749 @@ def CheckHabMaps(rasters, nodata=0, Format="TIFF", pixel_type="U2", maximum=3,
                     if zero == True:
                         if value == 0:
                             print(r + " - has a value equal to 0")
-                            zero.append(rasObj.name)
+                            zeros.append(rasObj.name)
                 if RowsOK == False:
                     noRows.append(rasObj.name)
         except:
             print("No Cursor")
             cursorProblem.append(rasObj.name)
             
-    return {"WrongProjection":WrongProjection, "WrongNoDataValue":WrongNoDataValue,
-            "WrongPixelType":WrongPixelType, "WrongFormat":WrongFormat, 
-            "WrongMinimum":WrongMinimum, "WrongMaximum":WrongMaximum, 
-            "BadCount":badCount, "CursorProblem":cursorProblem, "overMax":overMax,
-            "NoRows":noRows, "Zeros":zero}
-
-# def Make01Seasonal(rasters, seasons, from_dir, to_dir, CONUS_extent, 
-#                    log="P:/Proj3/USGap/Vert/Model/Output/CONUS/log.txt"):
-#     '''
-#     (list, list, string, string, raster) -> saved rasters
+    return results
+
+def _Describe(dataset):
+    '''
+    (gdal dataset) -> dictionary
+
+    Returns the projection name, format, pixel type, and nodata value of a raster 
+        from its header, named and coded the way arcpy.Describe reports them (e.g., 
+        "Albers", "TIFF", "U2").
+    '''
+    from osgeo import gdal, osr
+    srs = osr.SpatialReference(wkt=dataset.GetProjection())
+    projection = srs.GetAttrValue("PROJECTION") or ""
+    if projection.startswith("Albers"):
+        projection = "Albers"
     
-#     Copies a GAP habitat map that is in the format of values 1-3 and nodata (no zeros) 
-#         and with an extent defined by the species range to a full CONUS extent version
-#         with zero's and 1's throughout. A raster is saved for each season in "Summer", 
-#         "Winter", or "Any" directory.  Also adds 9 pixels to the upper left corner of 
-#         the map if the conus raster has them.  Runtime for 1 species creating each season
-#         is around 2 hours.  Consider 
-        
-#     Arguments:
-#     rasters -- A list of rasters to copy.
-#     seasons -- A list of seasons create rasters for.
-#     from_dir -- Directory to copy rasters from.
-#     to_dir -- Directory to create seasonal subdirectories into and save to.
-#     log -- The log file to record progress to.
-#     CONUS_extent -- A full continental extent raster (30m, albers), composed entirely of
-#         zeros and counter pixels with value "1" in the top left corner if desired.  This
-#         layer is used for setting the extent, snapgrid, and adding the counter pixels.
+    driver = dataset.GetDriver().ShortName
+    formats = {"GTiff": "TIFF", "AIG": "GRID", "HFA": "IMAGINE Image", 
+               "JPEG": "JPEG", "PNG": "PNG", "BMP": "BMP"}
     
-#     Examples:
-#     >>> gapanalysis.data.MakeSeasonalBinary(rasters=arcpy.ListRasters(),
-#                                             seasons=["any", "Summer", "w"],
-#                                             from_dir="C:/data/maps/"
-#                                             to_dir="C:/data/Output/",
-#                                             CONUS_extent="C:/data/conus_ext_cnt",
-#                                             log="P:/Proj3/USGap/Vert/Model/Output/Conus/log.txt")
-#     >>>
-#     '''
-#     ################################################### import packages, set environments
-#     #####################################################################################
-#     import arcpy, os, datetime
-#     arcpy.ResetEnvironments()
-#     arcpy.CheckOutExtension("Spatial")
-#     arcpy.env.overwriteOutput=True
-#     arcpy.env.snapRaster = CONUS_extent
-#     arcpy.env.pyramid = 'PYRAMIDS'
-#     arcpy.env.rasterStatistics = "STATISTICS"
-#     arcpy.env.cellSize = 30
-#     arcpy.env.scratchworkspace = to_dir
-#     arcpy.env.extent = CONUS_extent
-#     arcpy.env.workspace = to_dir
+    band = dataset.GetRasterBand(1)
+    pixelTypes = {gdal.GDT_Byte: "U8", gdal.GDT_UInt16: "U16", 
+                  gdal.GDT_Int16: "S16", gdal.GDT_UInt32: "U32", 
+                  gdal.GDT_Int32: "S32", gdal.GDT_Float32: "F32", 
+                  gdal.GDT_Float64: "F64"}
+    pixelType = pixelTypes.get(band.DataType, gdal.GetDataTypeName(band.DataType))
+    if band.DataType == gdal.GDT_Byte:
+        nbits = band.GetMetadataItem("NBITS", "IMAGE_STRUCTURE")
+        if band.GetMetadataItem("PIXELTYPE", "IMAGE_STRUCTURE") == "SIGNEDBYTE":
+            pixelType = "S8"
+        elif nbits in ("1", "2", "4"):
+            pixelType = "U" + nbits
     
-#     ################################################### create directories for the output
-#     #####################################################################################
-#     summerDir = os.path.join(to_dir, 'Summer') 
-#     winterDir = os.path.join(to_dir,'Winter')
-#     anyDir = os.path.join(to_dir, 'Any')
-#     for x in [summerDir, winterDir, anyDir]:
-#         if not os.path.exists(x):
-#             os.makedirs(x)
-#     logg = open(log, "a")
-#     logg.close()
+    return {"projectionName": projection, "format": formats.get(driver, driver),
+            "pixelType": pixelType, "nodataValue": band.GetNoDataValue()}
+
+def _ReadGDALRAT(band):
+    '''
+    (gdal band) -> list, list
+
+    Returns the values and counts in a band's raster attribute table, as GDAL reads
+        it, or None if GDAL finds no table with value and count fields.
+    '''
+    from osgeo import gdal
+    table = band.GetDefaultRAT()
+    if table is None:
+        return None
+    value, count = None, None
+    for i in range(table.GetColumnCount()):
+        name = table.GetNameOfCol(i).upper()
+        usage = table.GetUsageOfCol(i)
+        if name == "VALUE" or (value is None and usage == gdal.GFU_MinMax):
+            value = i
+        if name == "COUNT" or (count is None and usage == gdal.GFU_PixelCount):
+            count = i
+    if value is None or count is None:
+        return None
+    rows = range(table.GetRowCount())
+    return ([table.GetValueAsDouble(row, value) for row in rows],
+            [table.GetValueAsDouble(row, count) for row in rows])
+
+def IterCheckHabMaps(rasters, nodata=0, Format="TIFF", pixel_type="U2", maximum=3,
+                     minimum=3, zero=False, workers=1, tileSize=4096, statistics=True,
+                     cache=None, hashing=False, fail_fast=False):
+    '''
+    (list) -> generator
     
-#     ############################################## Function to write data to the log file
-#     #####################################################################################
-#     def __Log(content):
-#         print(content)
-#         with open(log, 'a') as logDoc:
-#             logDoc.write(content + '\n')
-            
-#     ############################################################################  Process
-#     #####################################################################################
-#     for raster in rasters:
-#         start1 = datetime.datetime.now()
-#         date = start1.strftime('%Y,%m,%d')
-#         print(raster)
-#         print(str(rasters.index(raster) + 1) + " of " + str(len(rasters)))
-#         rangewide = arcpy.Raster(from_dir + raster)
-#         ############################################### expand, fill with zeros, and copy
-#         #################################################################################
-#         # Summer
-#         if "Summer" in seasons or "s" in seasons or "S" in seasons or "summer" in seasons:
-#             print("\tSummer")
-#             try:
-#                 print("\tReclassifying")
-#                 summer = arcpy.sa.Con(rangewide, 1, where_clause="VALUE = 1 OR VALUE = 3")
-#                 print("\tAdding 0's")            
-#                 summer_0 = arcpy.sa.Con(arcpy.sa.IsNull(summer), 0, summer)
-#                 print("\tAdding count pixels")            
-#                 summer_cnt = summer_0 + CONUS_extent
-#                 print("\tSaving")            
-#                 arcpy.management.CopyRaster(in_raster=summer_cnt, 
-#                                             out_rasterdataset=to_dir + "Summer/" + raster, 
-#                                             pixel_type="1_BIT", 
-#                                             nodata_value="")
-#                 print("\tBuilding table")
-#                 arcpy.management.BuildRasterAttributeTable(to_dir + "Summer/" + raster,
-#                                                            overwrite=True)
-#                 __Log(raster[:6] + "," + from_dir + raster + "," + summerDir + "/" + raster + "," + date)
-#             except Exception as e:
-#                 print(e)
-
-#                 __Log(raster[:6] + "," + from_dir + raster + "," + summerDir + "/" + raster + "," + date + ",FAILED")
-                                                         
-#         # Winter
-#         if "Winter" in seasons or "winter" in seasons or "W" in seasons or "w" in seasons:
-#             print("\tWinter")
-#             try:
-#                 print("\tReclassifying")
-#                 winter = arcpy.sa.Con(rangewide, 1, where_clause="VALUE = 2 OR VALUE = 3")
-#                 print("\tAdding 0's")                 
-#                 winter_0 = arcpy.sa.Con(arcpy.sa.IsNull(winter), 0, winter)
-#                 print("\tAdding count pixels")                     
-#                 winter_cnt = winter_0 + CONUS_extent
-#                 print("\tSaving")            
-#                 arcpy.management.CopyRaster(in_raster=winter_cnt, 
-#                                             out_rasterdataset=to_dir + "Winter/" + raster, 
-#                                             pixel_type="1_BIT", 
-#                                             nodata_value="")
-#                 print("\tBuilding table")
-#                 arcpy.management.BuildRasterAttributeTable(to_dir + "Winter/" + raster,
-#                                                            overwrite=True)
-#                 __Log(raster[:6] + "," + from_dir + raster + "," + winterDir + "/" + raster + "," + date)
-#             except Exception as e:
-#                 print(e)
-#                 __Log(raster[:6] + "," + from_dir + raster + "," + winterDir + "/" + raster + "," + date + ",FAILED")
-                
-#         # Any season
-#         if "Any" in seasons or "any" in seasons or "a" in seasons or "A" in seasons:
-#             print("\tAny")
-#             try:
-#                 print("\tReclassifying")            
-#                 Any = arcpy.sa.Con(rangewide, 1, where_clause="VALUE > 0")
-#                 print("\tAdding 0's")                 
-#                 any_0 = arcpy.sa.Con(arcpy.sa.IsNull(Any), 0, Any)
-#                 print("\tAdding count pixels")                     
-#                 any_cnt = any_0 + CONUS_extent
-#                 print("\tSaving")            
-#                 arcpy.management.CopyRaster(in_raster=any_cnt, 
-#                                             out_rasterdataset=to_dir + "Any/" + raster, 
-#                                             pixel_type="1_BIT", 
-#                                             nodata_value="")
-#                 print("\tBuilding table")
-#                 arcpy.management.BuildRasterAttributeTable(to_dir + "Any/" + raster,
-#                                                            overwrite=True)
-#                 __Log(raster[:6] + "," + from_dir + raster + "," + anyDir + "/" + raster + "," + date)
-#             except Exception as e:
-#                 print(e)
-#                 __Log(raster[:6] + "," + from_dir + raster + "," + anyDir + "/" + raster + "," + date + ",FAILED")
+    Checks rasters like CheckHabMaps' numpy engine, but yields a record for each 
+        raster as soon as it has been checked instead of returning lists at the 
+        end, so a long validation can be monitored, piped into other tools (see 
+        WriteCheckReport), or stopped early.  Rasters found in the cache come first,
+        then the rest in the order they finish.
+
+        Record keys:
+        "raster" -- The raster's path.
+        "ok" -- True if the raster passed every check.
+        "errors" -- The CheckHabMaps keys of the checks it failed, e.g., 
+            ["WrongNoDataValue", "overMax"].
+        "projectionName", "format", "pixelType", "nodataValue" -- The header 
+            properties, coded like arcpy.Describe, or None if it couldn't be read.
+        "minimum", "maximum", "cells" -- The smallest and largest values and the 
+            number of cells that aren't nodata, or None without statistics.
+    
+    Arguments:
+    rasters -- A list of rasters to check.
+    nodata, Format, pixel_type, maximum, minimum, zero, workers, tileSize, 
+        statistics, cache, hashing -- See CheckHabMaps.
+    fail_fast -- True to stop after the first raster that fails a check.
+
+    Example:
+    >>> for record in IterCheckHabMaps(rasters, workers=8, fail_fast=True):
+            print(record["raster"], record["errors"])
+    '''
+    keys = ["WrongProjection", "WrongNoDataValue", "WrongPixelType", "WrongFormat", 
+            "WrongMinimum", "WrongMaximum", "BadCount", "CursorProblem", "overMax",
+            "NoRows", "Zeros"]
+    inspections = _InspectHabMaps(rasters, workers, tileSize, statistics, cache, 
+                                  hashing)
+    try:
+        for r, facts in inspections:
+            failed = set(key for key, name in _CheckHabMap(r, facts, nodata, Format, 
+                                                           pixel_type, maximum, 
+                                                           minimum, zero))
+            record = {"raster": getattr(r, "path", r), "ok": len(failed) == 0, 
+                      "errors": [key for key in keys if key in failed]}
+            header = facts["header"] or {}
+            for key in ["projectionName", "format", "pixelType", "nodataValue"]:
+                record[key] = header.get(key)
+            values = facts["values"]
+            record["minimum"] = min(values) if values else None
+            record["maximum"] = max(values) if values else None
+            record["cells"] = sum(facts["counts"]) if values is not None else None
+            yield record
+            if fail_fast and not record["ok"]:
+                return
+    finally:
+        inspections.close()
+
+def WriteCheckReport(records, path):
+    '''
+    (iterable, string) -> integer
+
+    Writes validation records from IterCheckHabMaps to a csv or, if the path ends
+        in ".jsonl", a JSON lines file, one line per record as each arrives.  Lines
+        are flushed as they're written so the report can be followed while the 
+        validation runs.  A path of "-" writes JSON lines to standard output for
+        piping.  Returns the number of records written.
+
+    Arguments:
+    records -- An iterable of records, e.g., from IterCheckHabMaps.
+    path -- Path of the report.
+
+    Example:
+    >>> WriteCheckReport(IterCheckHabMaps(rasters, workers=8), "C:/Data/checks.csv")
+    2012
+    '''
+    import sys, csv, json
+    fields = ["raster", "ok", "errors", "projectionName", "format", "pixelType", 
+              "nodataValue", "minimum", "maximum", "cells"]
+    jsonl = path == "-" or path.endswith(".jsonl")
+    f = sys.stdout if path == "-" else open(path, "w", newline="")
+    try:
+        if not jsonl:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+        n = 0
+        for record in records:
+            if jsonl:
+                f.write(json.dumps(record) + "\n")
+            else:
+                writer.writerow(dict(record, errors=";".join(record["errors"])))
+            f.flush()
+            n += 1
+    finally:
+        if f is not sys.stdout:
+            f.close()
+    return n
+
+def _InspectHabMaps(rasters, workers=1, tileSize=4096, statistics=True, cache=None,
+                    hashing=False, report=False):
+    '''
+    (list, [int], [int], [boolean], [string], [boolean], [boolean]) -> generator
+
+    Yields (raster, facts) tuples (see _InspectHabMap) for each distinct raster, 
+        first those found in the cache, then the rest as the pool of workers
+        finishes them, writing them to the cache as they come.  With report, prints 
+        each raster as it's inspected.
+    '''
+    from gapanalysis import raster as ras
+    unique = list(dict.fromkeys(rasters))
+    found, connection = {}, None
+    if cache is not None:
+        connection = _OpenCheckCache(cache)
+        found, keys = _ReadCheckCache(connection, unique, statistics, hashing)
+    missing = [r for r in unique if r not in found]
+    inspected = ras.MapWindows(_InspectHabMap, missing, args=(tileSize, statistics),
+                               workers=min(workers, len(missing)))
+    try:
+        for r in unique:
+            if r in found:
+                yield r, found[r]
+        for r, facts in inspected:
+            if report:
+                print(r)
+            if connection is not None and r in keys:
+                _WriteCheckCache(connection, r, keys[r], facts, hashing)
+            yield r, facts
+    finally:
+        inspected.close()
+        if connection is not None:
+            connection.commit()
+            connection.close()
+
+def _InspectHabMap(raster, tileSize=4096, statistics=True):
+    '''
+    (string or VirtualExtent, [int], [boolean]) -> dictionary
+
+    Gathers what CheckHabMaps' numpy engine checks about one raster: its header 
+        properties (see _Describe) and, with statistics, a histogram of its cells 
+        and the raster attribute table GDAL finds for it.  GeoTIFF headers are 
+        parsed directly (see tiff.Describe), so GDAL only opens the raster to read
+        cells or when the header is something the tiff module can't describe.  The
+        result holds plain lists so it can be cached as JSON.  Runs in the worker
+        processes.
+
+        A raster.VirtualExtent is described by its map's header, but with no nodata
+        value, and its cells are counted as the virtual raster reads them: zero 
+        outside the map and in its nodata cells.  Only the windows the map reaches
+        are read.
+    '''
+    from gapanalysis import raster as ras, rat, tiff
+    facts = {"header": None, "statistics": statistics, "values": None, 
+             "counts": None, "table": None}
+    virtual = isinstance(raster, ras.VirtualExtent)
+    path = raster.path if virtual else raster
+    dataset = None
+    if path.lower().endswith((".tif", ".tiff")):
+        try:
+            facts["header"] = tiff.Describe(path)
+        except Exception:
+            facts["header"] = None
+    try:
+        if facts["header"] is None or facts["header"]["projectionName"] is None:
+            dataset = ras.Open(path)
+            facts["header"] = _Describe(dataset)
+    except Exception:
+        facts["header"] = None
+        return facts
+    if virtual:
+        facts["header"]["nodataValue"] = None
+        dataset = raster
+    if not statistics:
+        return facts
+    
+    ###################### Tally the cells, leaving out nodata like statistics do
+    ###########################################################################
+    try:
+        if dataset is None:
+            dataset = ras.Open(raster)
+        histogram = rat.Histogram(nodata=facts["header"]["nodataValue"])
+        skipped = 0
+        for window in ras.TileWindows(dataset.RasterXSize, dataset.RasterYSize, 
+                                      tileSize):
+            if ras.DataWindow(dataset, window) is None:
+                skipped += window[2]*window[3]
+                continue
+            histogram.Add(ras.ReadWindow(dataset, window))
+        if skipped:
+            histogram.AddCounts([0], [skipped])
+        values, counts = histogram.Counts()
+        table = _ReadGDALRAT(dataset.GetRasterBand(1))
+    except Exception:
+        return facts
+    facts["values"], facts["counts"] = values.tolist(), counts.tolist()
+    if table is not None:
+        facts["table"] = [list(table[0]), list(table[1])]
+    return facts
+
+def _CheckHabMap(raster, facts, nodata, Format, pixel_type, maximum, minimum, zero):
+    '''
+    (string or VirtualExtent, dictionary, number, string, string, number, number, 
+     boolean) -> list
+
+    Checks what _InspectHabMap found about a raster against the desired properties 
+        and returns (key, name) tuples for the CheckHabMaps lists it belongs in.  The
+        nodata value of a VirtualExtent isn't checked, since it has none: it reads 
+        its map's nodata cells as zeros.
+    '''
+    import os
+    from gapanalysis import raster as ras
+    virtual = isinstance(raster, ras.VirtualExtent)
+    raster = getattr(raster, "path", raster)
+    name = os.path.basename(raster)
+    errors = []
+    header = facts["header"]
+    if header is None:
+        return [("CursorProblem", name)]
+    
+    ######################################## Examine describe object properties
+    ###########################################################################
+    if header["projectionName"] != "Albers":
+        errors.append(("WrongProjection", raster))
+    if header["format"] != Format:
+        errors.append(("WrongFormat", raster))
+    if header["pixelType"] != pixel_type:
+        errors.append(("WrongPixelType", raster))
+    if header["nodataValue"] != nodata and not virtual:
+        errors.append(("WrongNoDataValue", raster))
+    if not facts["statistics"]:
+        return errors
+    if facts["values"] is None:
+        return errors + [("CursorProblem", name)]
+    
+    ######################################### Exmamine the histogram's range
+    ###########################################################################
+    values = facts["values"]
+    if len(values) > 0:
+        if max(values) > maximum:
+            errors.append(("WrongMaximum", raster))
+        if min(values) > minimum:
+            errors.append(("WrongMinimum", raster))
+    
+    ########################################## Check the raster attribute table
+    ###########################################################################
+    table = facts["table"] or (values, facts["counts"])
+    if len(table[0]) == 0:
+        errors.append(("NoRows", name))
+    for value, count in zip(*table):
+        if count <= 0:
+            errors.append(("BadCount", name))
+        if value > maximum:
+            errors.append(("overMax", name))
+        if zero == True and value == 0:
+            errors.append(("Zeros", name))
+    return errors
+
+def _FileHash(path):
+    '''
+    (string) -> string
+
+    Returns a BLAKE2 hash of a file's contents, read in 1 MB chunks.
+    '''
+    import hashlib
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(2**20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _OpenCheckCache(cache):
+    '''
+    (string) -> sqlite3 connection
+
+    Opens (creating if needed) the SQLite cache of CheckHabMaps and evicts entries 
+        for files that no longer exist.
+    '''
+    import os, sqlite3
+    connection = sqlite3.connect(cache)
+    connection.execute("""CREATE TABLE IF NOT EXISTS checks (
+                              path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER,
+                              hash TEXT, facts TEXT, checked TEXT)""")
+    gone = [(path,) for (path,) in connection.execute("SELECT path FROM checks")
+            if not os.path.exists(path)]
+    connection.executemany("DELETE FROM checks WHERE path = ?", gone)
+    connection.commit()
+    return connection
+
+def _ReadCheckCache(connection, rasters, statistics, hashing):
+    '''
+    (sqlite3 connection, list, boolean, boolean) -> dictionary, dictionary
+
+    Returns the cached facts (see _InspectHabMap) of the rasters that haven't 
+        changed since they were cached, keyed by raster, and the (size, mtime_ns,
+        hash) key of every raster that exists for writing new entries.  
+        VirtualExtents aren't cached.  Facts cached without 
+        statistics don't count when statistics are wanted.
+    '''
+    import os, json
+    found, keys = {}, {}
+    for r in rasters:
+        if not isinstance(r, str):
+            continue
+        try:
+            stat = os.stat(r)
+        except OSError:
+            continue
+        keys[r] = [stat.st_size, stat.st_mtime_ns, None]
+        row = connection.execute("SELECT size, mtime_ns, hash, facts FROM checks " 
+                                 "WHERE path = ?", (os.path.abspath(r),)).fetchone()
+        if row is None or tuple(row[:2]) != (stat.st_size, stat.st_mtime_ns):
+            continue
+        if hashing:
+            keys[r][2] = _FileHash(r)
+            if row[2] != keys[r][2]:
+                continue
+        facts = json.loads(row[3])
+        if statistics and not facts["statistics"]:
+            continue
+        found[r] = facts
+    return found, keys
+
+def _WriteCheckCache(connection, raster, key, facts, hashing):
+    '''
+    (sqlite3 connection, string, list, dictionary, boolean) -> None
+
+    Replaces the cache entry of a raster with newly gathered facts.
+    '''
+    import os, json, datetime
+    size, mtime_ns, digest = key
+    if hashing and digest is None:
+        digest = _FileHash(raster)
+    connection.execute("INSERT OR REPLACE INTO checks VALUES (?, ?, ?, ?, ?, ?)",
+                       (os.path.abspath(raster), size, mtime_ns, digest, 
+                        json.dumps(facts), datetime.datetime.now().isoformat()))
+
+def PixelCounts(rasters, catalog, sizes=False):
+    '''
+    (list, string, [boolean]) -> pandas dataframe
+
+    Returns the VALUE/COUNT pairs of the raster attribute tables of a list of 
+        rasters, as a dataframe with a row per raster (indexed as passed) and a 
+        column per value.  The counts are kept in a catalog csv keyed by each 
+        raster's absolute path, size, and modification time, so attribute tables are
+        only read for rasters that are new or have changed since they were 
+        cataloged.  The catalog also keeps each raster's width and height in cells 
+        (XSIZE and YSIZE), read from its header along with the table.  With a warm
+        catalog no raster is opened at all.
+    
+    Arguments:
+    rasters -- A list of raster paths.
+    catalog -- Path to the catalog csv.  It's created if it doesn't exist.  Entries
+        for rasters that changed are replaced.
+    sizes -- True to also return a dataframe of each raster's XSIZE and YSIZE, 
+        indexed as passed, e.g., to tell range-extent maps from CONUS extent maps.
+        Entries of catalogs from before sizes were kept get them on first use.
+
+    Example:
+    >>> PixelCounts(["C:/Data/Any/bAMROx.tif"], "C:/Data/PixelCounts.csv")[1]
+    C:/Data/Any/bAMROx.tif    23048729
+    Name: 1, dtype: int64
+    '''
+    import os, pandas as pd
+    columns = ["path", "size", "mtime_ns", "VALUE", "COUNT", "XSIZE", "YSIZE"]
+    stats = [os.stat(r) for r in rasters]
+    keys = pd.DataFrame([(os.path.abspath(r), stat.st_size, stat.st_mtime_ns) 
+                         for r, stat in zip(rasters, stats)], 
+                        columns=columns[:3], index=rasters)
+    if os.path.exists(catalog):
+        catDF = pd.read_csv(catalog).reindex(columns=columns)
+    else:
+        catDF = pd.DataFrame(columns=columns)
+    
+    # Drop entries for files that have changed, then read the missing tables
+    current = catDF.merge(keys.drop_duplicates(), on=columns[:3], how="inner")
+    stale = catDF.path.isin(keys.path) & ~catDF.set_index(columns[:3]).index.isin(
+                current.set_index(columns[:3]).index)
+    changed = stale.any()
+    catDF = catDF[~stale]
+    missing = keys[~keys.path.isin(current.path)].drop_duplicates("path")
+    if len(missing) > 0:
+        new = []
+        for r, key in missing.iterrows():
+            values, counts = _ReadRAT(r)
+            xsize, ysize = _RasterSize(r)
+            new.append(pd.DataFrame({"path": key.path, "size": key["size"], 
+                                     "mtime_ns": key.mtime_ns, "VALUE": values, 
+                                     "COUNT": counts, "XSIZE": xsize, 
+                                     "YSIZE": ysize}, columns=columns))
+        catDF = pd.concat([catDF] + new, ignore_index=True)
+        changed = True
+    unsized = catDF.path.isin(keys.path) & catDF.XSIZE.isnull()
+    if sizes and unsized.any():
+        for path in catDF.path[unsized].unique():
+            rows = catDF.path == path
+            catDF.loc[rows, "XSIZE"], catDF.loc[rows, "YSIZE"] = _RasterSize(path)
+        changed = True
+    if changed:
+        catDF.to_csv(catalog, index=False)
+    
+    cataloged = catDF[catDF.path.isin(keys.path)]
+    table = cataloged.pivot_table(index="path", columns="VALUE", values="COUNT", 
+                                  aggfunc="sum", fill_value=0)
+    table = table.reindex(keys.path).fillna(0).astype("int64")
+    table.index = keys.index
+    table.columns.name = None
+    if not sizes:
+        return table
+    sizeDF = cataloged.drop_duplicates("path").set_index("path")[["XSIZE", "YSIZE"]]
+    sizeDF = sizeDF.reindex(keys.path).astype("int64")
+    sizeDF.index = keys.index
+    return table, sizeDF
+
+
+def _RasterSize(raster):
+    '''
+    (string) -> int, int
+
+    Returns the number of columns and rows of a raster, from the GeoTIFF header if
+        it has one (see tiff.ReadHeader), or else as GDAL or arcpy reads it.
+    '''
+    from gapanalysis import tiff
+    try:
+        header = tiff.ReadHeader(raster)
+        return header["width"], header["height"]
+    except (ValueError, OSError):
+        pass
+    try:
+        from gapanalysis import raster as ras
+        dataset = ras.Open(raster)
+        return dataset.RasterXSize, dataset.RasterYSize
+    except ImportError:
+        import arcpy
+        described = arcpy.Describe(raster)
+        return described.width, described.height
+
+
+def _ReadRAT(raster):
+    '''
+    (string) -> list, list
+
+    Reads a raster's attribute table with a search cursor and returns lists of its
+        values and counts.  Without arcpy, the table is read from its sidecar files,
+        or counted, with rat.ReadRAT.
+    '''
+    try:
+        import arcpy
+    except ImportError:
+        from gapanalysis import rat
+        values, counts = rat.ReadRAT(raster)
+        return list(values), list(counts)
+    values, counts = [], []
+    for row in arcpy.SearchCursor(arcpy.Raster(raster)):
+        values.append(row.getValue("VALUE"))
+        counts.append(row.getValue("COUNT"))
+    return values, counts
+
+def Make01Seasonal(rasters, seasons, from_dir, to_dir, CONUS_extent, 
+                   log="P:/Proj3/USGap/Vert/Model/Output/CONUS/log.txt", 
+                   tileSize=4096, workers=1, sparse=False):
+    '''
+    (list, list, string, string, raster) -> saved rasters
+    
+    Copies a GAP habitat map that is in the format of values 1-3 and nodata (no zeros) 
+        and with an extent defined by the species range to a full CONUS extent version
+        with zero's and 1's throughout. A raster is saved for each season in "Summer", 
+        "Winter", or "Any" directory.  Also adds 9 pixels to the upper left corner of 
+        the map if the conus raster has them.  
+        
+        Each map is read once, in windows of the CONUS grid, and all of the seasons 
+        are written from the same read as 1 bit GeoTIFFs with raster attribute tables
+        (see rat.WriteRAT).  Maps are processed on a pool of processes, one species
+        per process.  Windows that the range and the counter pixels don't reach are
+        just zeros.  With sparse, they're neither read nor written, so a species 
+        takes seconds to a few minutes, rather than the couple of hours per species
+        the arcpy version this replaces took.  Without it, every window of the CONUS
+        grid is still compressed and written, which takes most of the time.
         
-#         end = datetime.datetime.now()
-#         runtime = end - start1
-#         print("\tTotal runtime: " + str(runtime))
+    Arguments:
+    rasters -- A list of rasters to copy.
+    seasons -- A list of seasons create rasters for.
+    from_dir -- Directory to copy rasters from.
+    to_dir -- Directory to create seasonal subdirectories into and save to.
+    log -- The log file to record progress to.
+    CONUS_extent -- A full continental extent raster (30m, albers), composed entirely of
+        zeros and counter pixels with value "1" in the top left corner if desired.  This
+        layer is used for setting the extent, snapgrid, and adding the counter pixels.
+        The habitat maps must be snapped to its grid.
+    tileSize -- Width and height, in cells, of the windows that are read and written.
+        Must be a multiple of 256.
+    workers -- Number of processes to copy maps with.  On Windows, scripts that use 
+        more than one worker must guard their code with "if __name__ == '__main__':".
+    sparse -- True to leave the all-zero blocks out of the output files (see 
+        raster.CreateGeoTiff), which makes them smaller and quicker to write but 
+        requires software that reads sparse GeoTIFFs, like GDAL.
+    
+    Examples:
+    >>> gapanalysis.data.Make01Seasonal(rasters=arcpy.ListRasters(),
+                                        seasons=["any", "Summer", "w"],
+                                        from_dir="C:/data/maps/"
+                                        to_dir="C:/data/Output/",
+                                        CONUS_extent="C:/data/conus_ext_cnt.tif",
+                                        log="P:/Proj3/USGap/Vert/Model/Output/Conus/log.txt",
+                                        workers=8)
+    >>>
+    '''
+    import os, datetime
+    from gapanalysis import raster as ras
+    if tileSize <= 0 or tileSize % 256 != 0:
+        raise ValueError("tileSize must be a multiple of 256, the block size of the "
+                         "counter pixel footprint, not {0}".format(tileSize))
+    
+    ################################################### create directories for the output
+    #####################################################################################
+    aliases = {"Summer": ["Summer", "summer", "S", "s"], 
+               "Winter": ["Winter", "winter", "W", "w"], 
+               "Any": ["Any", "any", "A", "a"]}
+    wanted = [season for season in ["Summer", "Winter", "Any"]
+              if any(alias in seasons for alias in aliases[season])]
+    for season in wanted:
+        if not os.path.exists(os.path.join(to_dir, season)):
+            os.makedirs(os.path.join(to_dir, season))
+    logg = open(log, "a")
+    logg.close()
+    
+    ############################################## Function to write data to the log file
+    #####################################################################################
+    def __Log(content):
+        print(content)
+        with open(log, 'a') as logDoc:
+            logDoc.write(content + '\n')
+    
+    ############################################################################  Process
+    #####################################################################################
+    # The counter pixels are found once for all of the species
+    counters = ras.Footprint(CONUS_extent, tileSize=tileSize)
+    results = ras.MapWindows(_Make01Seasonal, rasters, 
+                             args=(wanted, from_dir, to_dir, CONUS_extent, counters, 
+                                   tileSize, sparse), 
+                             workers=min(workers, len(rasters)))
+    for n, (raster, (runtime, errors)) in enumerate(results):
+        date = datetime.datetime.now().strftime('%Y,%m,%d')
+        print(raster)
+        print(str(n + 1) + " of " + str(len(rasters)))
+        for season in wanted:
+            line = (raster[:6] + "," + from_dir + raster + "," + 
+                    os.path.join(to_dir, season) + "/" + raster + "," + date)
+            if season in errors:
+                print(errors[season])
+                line = line + ",FAILED"
+            __Log(line)
+        print("\tTotal runtime: " + str(runtime))
 
+def _Make01Seasonal(raster, seasons, from_dir, to_dir, CONUS_extent, counters, 
+                    tileSize=4096, sparse=False):
+    '''
+    (string, list, string, string, string, dictionary, [int], [boolean]) 
+        -> timedelta, dictionary
 
-# def Make0123(rasters, CONUS_extent, from_dir, to_dir, 
-#              log="P:/Proj3/USGap/Vert/Model/Output/CONUS/log.txt"):
-#     '''
-#     (list, string, string, string, string, string) -> saved raster
+    Copies one range-extent habitat map to CONUS extent 0/1 maps for each season in 
+        one pass for Make01Seasonal, and returns the runtime and the error messages 
+        of seasons that failed, keyed by season.  counters is the footprint of the 
+        CONUS extent raster.  Runs in the worker processes.
+    '''
+    import os, datetime, numpy as np
+    from gapanalysis import raster as ras, rat
+    start = datetime.datetime.now()
+    errors, outs, histograms = {}, {}, {}
+    try:
+        extent = ras.Open(CONUS_extent)
+        habmap = ras.Open(from_dir + raster)
+        offset = ras.GridOffset(habmap, extent)
+    except Exception as e:
+        return datetime.datetime.now() - start, {s: str(e) for s in seasons}
+    for season in seasons:
+        try:
+            path = os.path.join(to_dir, season, raster)
+            outs[season] = (path, ras.CreateGeoTiff(path, extent, "uint8", nbits=1,
+                                                    sparse=sparse))
+            histograms[season] = rat.Histogram()
+        except Exception as e:
+            errors[season] = str(e)
     
-#     Copies a GAP habitat map that is in the format of values 1-3 and nodata (no zeros) 
-#         and with an extent defined by the species range to a full CONUS extent version
-#         with zero's and original values throughout. Also adds 9 pixels to the upper 
-#         left corner of the map if the CONUS_extent layer has them.  NOTE: This takes
-#         about 25 minutes to run one species.
+    ############################################### expand, fill with zeros, and copy
+    #################################################################################
+    written = 0
+    try:
+        for window in ras.TileWindows(extent.RasterXSize, extent.RasterYSize, 
+                                      tileSize):
+            inRange = ras.OverlapWindow(window, offset, habmap.RasterXSize, 
+                                        habmap.RasterYSize) is not None
+            hasCounters = ras.FootprintWindow(counters, window) is not None
+            if sparse and not (inRange or hasCounters):
+                continue
+            if hasCounters:
+                cnt = ras.ReadWindow(extent, window) != 0
+            else:
+                cnt = np.zeros((window[3], window[2]), dtype=bool)
+            codes = ras.ReadOffsetWindow(habmap, window, offset)
+            for season in outs:
+                binary = (ras.SeasonMask(codes, season) | cnt).astype(np.uint8)
+                outs[season][1].GetRasterBand(1).WriteArray(binary, window[0], 
+                                                            window[1])
+                histograms[season].Add(binary)
+            written += window[2]*window[3]
+    except Exception as e:
+        for season in outs:
+            errors[season] = str(e)
     
-#     Arguments:
-#     rasters -- A list of rasters to check.
-#     CONUS_extent -- A raster with a national extent and zeros everywhere except for 
-#         counter cells.  Also used as a snap raster.
-#     from_dir -- Where to find the habitat maps to process.
-#     to_dir -- Directory to work in and save output.  It should have a subdirectory named
-#         "0123".
-#     log -- Path to the log file used to keep track of habmap movement and creation.
-
-#     Examples:
-#     >>> gapanalysis.data.Expand_0s(rasters=arcpy.ListRasters(), 
-#                                    CONUS_extent="C:/gapanalysis/data/CONUS_extent",
-#                                    from_dir="C:/models/",
-#                                    to_dir="C:/models/Output/",
-#                                    log = "P:/Proj3/USGap/Vert/Model/Output/CONUS/log.txt")
-#     >>>
-#     '''
-#     import arcpy, datetime
-#     arcpy.CheckOutExtension("Spatial")
-#     arcpy.overwriteOutput=True
-#     arcpy.env.snapRaster = CONUS_extent
-#     arcpy.env.extent = CONUS_extent
-#     arcpy.env.workspace = to_dir
+    # Blocks that weren't written are zeros, which the RATs have to count
+    paths = {season: outs[season][0] for season in outs}
+    outs = None
+    for season in paths:
+        if season in errors:
+            continue
+        unwritten = extent.RasterXSize*extent.RasterYSize - written
+        if unwritten > 0:
+            histograms[season].AddCounts([0], [unwritten])
+        rat.WriteRAT(paths[season], *histograms[season].Counts())
+    return datetime.datetime.now() - start, errors
+
+
+def Make0123(rasters, CONUS_extent, from_dir, to_dir, 
+             log="P:/Proj3/USGap/Vert/Model/Output/CONUS/log.txt"):
+    '''
+    (list, string, string, string, string, string) -> saved raster
     
+    Makes a CONUS extent version of GAP habitat maps that are in the format of values
+        1-3 and nodata (no zeros) and with an extent defined by the species range, 
+        with zero's and original values throughout.  Also adds 9 pixels to the upper 
+        left corner of the map if the CONUS_extent layer has them.  
+        
+        Instead of a full copy, which took about 25 minutes per species and many 
+        times the map's disk space, each map is saved as a virtual extent (see
+        raster.WriteVirtualExtent): a small GDAL VRT file in the "0123" 
+        subdirectory, named like the map with a ".vrt" extension, that ArcGIS and
+        GDAL read as the expanded raster.  The numpy engines in this package read 
+        range-extent maps in place (see raster.OpenInGrid), so they don't need 
+        these at all.
     
-#     ######################################### Function to write data to the log file
-#     ################################################################################
-#     log = log
-#     def __Log(content):
-#         print(content)
-#         with open(log, 'a') as logDoc:
-#             logDoc.write(content + '\n')
-            
-#     ######################################### Expand each raster to Conus and add 0s
-#     ################################################################################
-#     for sp in rasters:
-#         start1 = datetime.datetime.now()
-#         date = start1.strftime('%Y,%m,%d')
-#         print(sp)
-#         Tiff = arcpy.Raster(from_dir + sp)
-#         newTiff = to_dir + "0123/" + sp
-#         try:
-#             print("\tCon is Null")
-#             ConNull = arcpy.sa.Con(arcpy.sa.IsNull(Tiff), 0, Tiff)
-#             print("\tSumming")
-#             newRast = ConNull + CONUS_extent
-#             print("\tSaving")
-#             arcpy.management.CopyRaster(newRast, newTiff, pixel_type="2_BIT", 
-#                                         nodata_value="")
-#             print("\tCalculating statistics")
-#             arcpy.management.CalculateStatistics(newTiff)
-#             print("\tBuilding RAT")
-#             arcpy.management.BuildRasterAttributeTable(newTiff, overwrite=True)
-#             end = datetime.datetime.now()
-#             runtime = end - start1
-#             print("\tTotal runtime: " + str(runtime))
-#             __Log(sp[:6] + "," + from_dir + sp + "," + newTiff + "," + date)
-#         except Exception as e:
-#             print('ERROR expanding raster - {0}'.format(e))
-#             __Log(sp[:6] + "," + from_dir + sp + "," + newTiff + "," + date + ",Failed")
+    Arguments:
+    rasters -- A list of rasters to check.
+    CONUS_extent -- A raster with a national extent and zeros everywhere except for 
+        counter cells.  Also used as a snap raster.
+    from_dir -- Where to find the habitat maps to process.
+    to_dir -- Directory to work in and save output.  The "0123" subdirectory is 
+        created if needed.
+    log -- Path to the log file used to keep track of habmap movement and creation.
 
+    Examples:
+    >>> gapanalysis.data.Make0123(rasters=arcpy.ListRasters(), 
+                                  CONUS_extent="C:/gapanalysis/data/CONUS_extent.tif",
+                                  from_dir="C:/models/",
+                                  to_dir="C:/models/Output/",
+                                  log = "P:/Proj3/USGap/Vert/Model/Output/CONUS/log.txt")
+    >>>
+    '''
+    import os, datetime
+    from gapanalysis import raster as ras
+    if not os.path.exists(os.path.join(to_dir, "0123")):
+        os.makedirs(os.path.join(to_dir, "0123"))
+    
+    ######################################### Function to write data to the log file
+    ################################################################################
+    def __Log(content):
+        print(content)
+        with open(log, 'a') as logDoc:
+            logDoc.write(content + '\n')
+            
+    ########################################### Place each raster in the CONUS grid
+    ################################################################################
+    for sp in rasters:
+        date = datetime.datetime.now().strftime('%Y,%m,%d')
+        newVRT = os.path.join(to_dir, "0123", os.path.splitext(sp)[0] + ".vrt")
+        try:
+            ras.WriteVirtualExtent(from_dir + sp, CONUS_extent, newVRT)
+            __Log(sp[:6] + "," + from_dir + sp + "," + newVRT + "," + date)
+        except Exception as e:
+            print('ERROR expanding raster - {0}'.format(e))
+            __Log(sp[:6] + "," + from_dir + sp + "," + newVRT + "," + date + ",Failed")
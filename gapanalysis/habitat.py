@@ -1,334 +1,793 @@
-# """
-# Created Oct 31, 2016 by N. Tarr
-# Functions related to calculating the amount of species' habitat that falls within zones
-# of interest.
-# """
-# def PercentOverlay(zoneFile, zoneName, zoneField, habmapList, habDir, workDir, scratchDir,
-#                    snap, extent="habMap"):
-#     '''
-#     (string, string, string, list, string, string, string, string) -> pandas dataframe
-    
-#     This function calculates the number of habitat pixels and proportion of each species'
-#         summer, winter, and year-round habitat that occurs in each "zone" of a raster. 
-#         It can be used to answer questions like "Which species have the largest 
-#         proportion of their habitat in forest map units?" or "How much habitat does the 
-#         NPS protect for each species?".  The processing creates a directory for saving 
-#         intermediate results including a csv file of results from the process and a log 
-#         file.  If the code has been run before for a different list of species, then it
-#         will update the previous table after saving a copy in "/Archive".  When the 
-#         process is run, new species are added to the existing table and existing entries
-#         are updated.  The result table contains a field for date run and runtime for 
-#         each species.  The table with all species that have been run is returned as a 
-#         pandas dataframe.  NOTE: the extent of analyses is set to that of the zoneFile.
-        
-#         NOTE:  Running two or more instances of this function (for the same analysis)
-#             may execute correctly, but the log file will be jumpled.
-            
-#     Arguments:
-#     zoneFile -- A raster layer of the continental U.S. with zones of interest assigned
-#         a unique value/code.  Must have following properties:
-#                 a) areas of interest have numeric, zon-zero, integer codes. If 0's exist
-#                    reclass them to 99999 or something recognizable first.
-#                 b) 30m x 30m
-#                 c) Albers NAD83 projection
-#                 d) 1 band
-#                 e) GeoTiff format
-#                 f) valid raster attribute table 
-#     zoneName -- A short name to use in file naming (e.g., "Pine")
-#     zoneField -- The field in in the zoneFile to use in the process.  It must be
-#         an integer with unique values for each zone you are interested in. NOTE: Zero
-#         is not a valid value!!!
-#     habmapList -- Python list of GAP habitat maps to analyze. Needs to be a list of 
-#         geotiffs named like: "mSEWEx_CONUS_HabMap_2001v1.tif".
-#     habDir -- The directory containing the GAP habitat maps to use in the process.
-#     workDir -- The name of a directory to save all results, including subfolders, log file
-#         temp output, and final csv files.  This code builds several subfolders and files.
-#     scratchDir -- A scratch directory to work in.  This option included so that 
-#         processing can be batched.  If you pass a directory that doesn't exist, it will
-#         be created.
-#     snap -- A 30x30m cell raster to use as a snap grid during processing.
-#     extent -- Choose "habMap" or "zoneFile".  habMap will process each species overlay
-#         with an extent matching that species' habitat's extent.  zoneFile will do analyses
-#         at the extent of the zoneFile, which is usually CONUS and therefore takes much 
-#         longer.
-    
-#     Example:
-#     >>>ProportionPineDF = ga.representation.Calculate(zoneFile = "C:/data/Pine.tif",
-#                                                       zoneName = "Pine",
-#                                                       zoneField = "VALUE",
-#                                                       habmapList = ["mSEWEx.tif", "bAMROx.tif"]
-#                                                       habDir = "C:/data/speciesmaps/",
-#                                                       workDir = "C:/analyses/represenation/pine",
-#                                                       snap = "C:/data/snapgrid",
-#                                                       extent = "habMap")
-#     '''
-#     ############################################################## Imports and settings
-#     ###################################################################################
-#     import arcpy, pandas as pd, os
-#     from datetime import datetime
-#     arcpy.CheckOutExtension("Spatial")
-#     arcpy.env.extent = arcpy.Raster(zoneFile).extent
-#     arcpy.env.snapRaster = snap
-#     arcpy.env.cellSize = 30
-#     arcpy.env.overwriteOutput = True
-#     arcpy.env.rasterStatistics = "STATISTICS"
-#     pd.set_option('display.width', 1000)
-        
-#     ################################ Create the working directories if they don't exist
-#     ###################################################################################
-#     # Create working directory
-#     if not os.path.exists(workDir):
-#         os.makedirs(workDir)
-#     # Create a scratch workspace
-#     if not os.path.exists(scratchDir):
-#         os.makedirs(scratchDir)
-#     # Create directories for archiving results
-#     archive = workDir + "/Archive"
-#     if not os.path.exists(archive):
-#         os.makedirs(archive)
-        
-#     ############################################ Function to write data to the log file
-#     ###################################################################################
-#     starttime0 = datetime.now()
-#     timestamp = starttime0.strftime('%Y-%m-%d')
-    
-#     log = workDir + "/log{0}.txt".format(timestamp)
-#     def __Log(content):
-#         print content
-#         with open(log, 'a') as logDoc:
-#             logDoc.write(content + '\n')
-    
-#     __Log("\n\n\n****************  " + timestamp + "  **************************\n")
-#     __Log("\nRasters that will be processed: " + str(habmapList) + "\n")
-#     __Log("Checked for and built required directories, lists, & dataframes")
-    
-#     ############################################### Function to check raster properties
-#     ###################################################################################
-#     def RasterReport(raster):
-#         __Log("----" + str(raster))
-#         __Log("\tMax: " + str(raster.maximum))
-#         __Log("\tMin: " + str(raster.minimum))
-#         __Log("\tNoDataValue: " + str(raster.noDataValue))
-#         desObj = arcpy.Describe(raster)
-#         __Log("\t" + str(desObj.spatialReference.projectionName))
-#         __Log("\t" + str(desObj.format))
-#         __Log("\t" + str(desObj.pixelType))
-#         __Log("\tInteger = " + str(raster.isInteger))
-#         __Log("\tHas RAT = " + str(raster.hasRAT))
-#         try:
-#             # Make an indicator variable for checking whether the cursor is 
-#             # empty, otherwise the cursor will quietly pass tables with no rows.
-#             RowsOK = False                
-#             # Make a cursor as a test to see if there's a vat                
-#             cursor = arcpy.SearchCursor(raster)
-#             __Log("\tVALUE:COUNT")
-#             for c in cursor:
-#                 __Log("\t" + str(c.getValue("VALUE")) + ":" + str(c.getValue("COUNT")))
-#                 countt = c.getValue("COUNT")
-#                 if countt < 0:
-#                     __Log("\t" + raster + "  - has bad counts")
-#                     RowsOK = True
-#                 elif countt > 0:
-#                     # Change RowsOK to True since the table has rows.                          
-#                     RowsOK = True
-#             if RowsOK == False:
-#                 __Log("\tRows not OK")
-#         except:
-#             __Log("\tNo Cursor")
-    
-#     ####################################################### Make a dictionary of values
-#     ###################################################################################
-#     ValueMap = {0: "NonHabitatPixels",
-#                 1: "SummerPixels",
-#                 2: "WinterPixels",
-#                 3: "AllYearPixels"}
-    
-#     ###################################### Inspect the zone raster to make sure it's OK
-#     ###################################################################################
-#     __Log("Checking zone raster properties")
-#     zoneFile = arcpy.Raster(zoneFile)
-#     RasterReport(zoneFile)
-    
-#     ######################################## Get list of unique values from zone raster
-#     ###################################################################################
-#     zoneCursor = arcpy.SearchCursor(zoneFile)
-#     zoneValues = []
-#     for z in zoneCursor:
-#         zoneValues.append(z.getValue(zoneField))
-    
-#     ################################################################# Some housekeeping
-#     ###################################################################################
-#     ### Build empty dataframe with hierarchical indexing
-#     colList = ValueMap.values() + ["Date", "RunTime"]
-#     indexSpecies = habmapList * len(zoneValues)
-#     indexSpecies.sort()
-#     indexList = [indexSpecies, zoneValues * len(habmapList)]
-#     df1 = pd.DataFrame(index=indexList, columns=colList).fillna(value=0)
-#     df1.index.names = ["GeoTiff", "Zone"]
-        
-#     ################################ Loop through rasters, sum species and zone rasters
-#     ###################################################################################
-#     arcpy.env.scratchworkspace = scratchDir
-#     arcpy.env.workspace = scratchDir
-#     for sp in habmapList:
-#         __Log("\n-------" + sp + "-------")
-#         starttime = datetime.now()
-#         timestamp = starttime.strftime('%Y-%m-%d-%M')
-#         __Log("Copying habitat map to temp version")
-#         try:
-#             __Log("Building raster object")
-#             spMap = arcpy.Raster(habDir + sp)
-#             # Set processing extent to habitat map to be faster than using zonefile extent
-#             if extent == "habMap":
-#                 arcpy.env.extent = spMap.extent
-#             RasterReport(spMap)
-#         except Exception as e:
-#             __Log("ERROR -- {0}".format(e))
-#         try:    
-#             __Log("Summing zone and species map")
-#             Sum = arcpy.sa.CellStatistics([spMap, zoneFile * 10], "SUM", "DATA")
-#         except Exception as e:
-#             __Log("ERROR -- {0}".format(e))
-#         try:
-#             __Log("Stats, RAT, and checking summed raster")
-#             Sum.save(scratchDir + "tmpSum.tif")            ################################  Can this be ommitted?  It likely slows things down. Can the object have a valid RAT or does it have to be save first?
-#             arcpy.management.CalculateStatistics(scratchDir + "tmpSum.tif")
-#             arcpy.management.BuildRasterAttributeTable(scratchDir + "tmpSum.tif", 
-#                                                         overwrite=True)
-#             RasterReport(arcpy.Raster(scratchDir + "tmpSum.tif"))
-#         except Exception as e:
-#             __Log("ERROR -- {0}".format(e))
-        
-#         ############################################## Fill out dataframes with results
-#         ###############################################################################
-#         # Make empty dataframe for species results, first build a list of index values    
-#         df2indexList = []
-#         for i in zoneValues:
-#             df2indexList = df2indexList + [i*10 + k for k in ValueMap.keys()]
-#         df2 = pd.DataFrame(index=df2indexList, columns=["COUNT"]).fillna(value=0)
-#         try:
-#             __Log("Reading summed raster's table, writing in a dataframe") 
-#             __Log("\tValue:Count")
-#             rows = arcpy.SearchCursor(Sum)
-#             for r in rows:
-#                 # Make sure no unexpected values showed up
-#                 if r.getValue("VALUE") not in df2.index:
-#                     __Log("ERROR!!!")
-#                 __Log("\t{0}:{1}".format(r.getValue("VALUE"), 
-#                       int(r.getValue("COUNT"))))
-#                 df2.loc[r.getValue("VALUE"), "COUNT"] = r.getValue("COUNT")
-#             del rows
-#             del r
-#         except Exception as e:
-#             __Log("!!!!!!ERROR!!!!!!!!! -- {0}".format(e))
-#             # Not doing anything will leave values set to zero in df2
-    
-#         # Do some table manipulation to prep for the next step
-#         try:
-#             # if else statement below should account for zones with zeros.
-#             df2["Season"] = [ValueMap[int(str(x)[-1:])] 
-#                             if len(str(x))>1 
-#                             else ValueMap[int(str(x))] 
-#                             for x in df2.index]
-#             df2["Zone"] = [int(str(l)[:-1]) 
-#                             if len(str(l))>1 
-#                             else 0 
-#                             for l in df2.index]
-#             df2.set_index(["Zone", "Season"], drop=True, inplace=True)
-#             # Fill out the species' entries in main DataFrame using the one just created
-#             # First you need a list of index values to loop on, since Dataframe is multiindexed
-#             df2Index = []
-#             for a in list(df2.index.levels[0]):
-#                 for b in list(df2.index.levels[1]):
-#                     df2Index.append((a,b))
-#             # Fill out df1 with values from df2
-#             for x in df2Index:
-#                 df1.loc[(sp, x[0]), x[1]] = int(df2.loc[(x[0], x[1])])
-        
-#             # Get end time and time it took to run the species
-#             endtime = datetime.now()
-#             delta = endtime - starttime
-#             __Log("Processing time: " + str(delta))
-        
-#             # Fillout runtime and date fields in the main DataFrame
-#             df1.loc[sp, "RunTime"] = str(delta)
-#             df1.loc[sp, "Date"] = str(timestamp)
-#         except Exception as e:
-#             __Log("ERROR -- {0}".format(e))
-            
-#         # Delete intermediate files
-#         try:
-#             arcpy.management.Delete(scratchDir + sp)
-#             arcpy.management.Delete(scratchDir + "tmpSum.tif")
-#         except Exception as e:
-#             __Log("ERROR -- {0}".format(e))
-        
-#     ######################################## Data munging of the multispecies dataframe
-#     ###################################################################################
-#     __Log("\nCalculating some fields in multispecies dataframe")
-#     df3 = df1.reset_index(level=1)
-#     df3["strUC"] = [i[0] + i[1:5].upper() + i[5] for i in df3.index]
-#     df3["ZoneTotal"] = df3["NonHabitatPixels"] + df3["SummerPixels"] + df3["WinterPixels"] + df3["AllYearPixels"]
-#     df3["SummerPixels"] = df3.SummerPixels + df3.AllYearPixels
-#     df3["WinterPixels"] = df3.WinterPixels + df3.AllYearPixels
-#     df3["SummerPixelTotal"] = [sum(df3.loc[i]["SummerPixels"]) for i in df3.index]
-#     df3["WinterPixelTotal"] = [sum(df3.loc[i]["WinterPixels"]) for i in df3.index]
-#     df3["AllYearPixelTotal"] = [sum(df3.loc[i]["AllYearPixels"]) for i in df3.index]
-#     df3["PercSummer"] = 100*(df3["SummerPixels"]/df3["SummerPixelTotal"])
-#     df3["PercWinter"] = 100*(df3["WinterPixels"]/df3["WinterPixelTotal"])
-#     df3["PercYearRound"] = 100*(df3["AllYearPixels"]/df3["AllYearPixelTotal"])
-#     df3.fillna(0, inplace=True)
-    
-#     # Specify the order of columns for convenience
-#     df3 = df3[[u'strUC', u'Zone', u'PercSummer', u'PercWinter', u'PercYearRound', 
-#                u'NonHabitatPixels', u'SummerPixels', u'WinterPixels', u'AllYearPixels', 
-#                u'ZoneTotal', u'SummerPixelTotal', u'WinterPixelTotal', u'AllYearPixelTotal', 
-#                u'Date', u'RunTime']]
-                
-#     ############################################ Print the results in the shell and log
-#     ###################################################################################
-#     df3.set_index([df3.index, "Zone"], inplace=True)
-    
-#     ######################################################### Update and save csv files
-#     ###################################################################################
-#     df3FileName = workDir + "/archive/" + zoneName + "_" + \
-#                     starttime.strftime('%Y-%m-%d-%H-%M') + ".csv"
-#     __Log("Saving new species table to " + df3FileName)
-#     print(df3)
-#     df3.to_csv(df3FileName)#, index_col=["GeoTiff", "Zone"])
-    
-#     # Load the master result table
-#     masterFileName = workDir + "/Percent_in_" + zoneName + "_Master.csv"
-#     if os.path.exists(masterFileName):
-#         dfMas = pd.read_csv(masterFileName, index_col=["GeoTiff", "Zone"])
-#         __Log("Loaded " + masterFileName)
-#     else:
-#         dfMas = df3
-    
-#     # Save an archive copy of master table/dataframe
-#     dfMas.to_csv(workDir + "/archive/" + zoneName + "_Master_" + \
-#                 starttime.strftime('%Y-%m-%d-%H-%M') + ".csv", )
-#     __Log("Creating " + workDir + "/archive/" + zoneName + "_Master_" + \
-#             starttime.strftime('%Y-%m-%d-%H-%M') + ".csv")
-    
-#     __Log("Updating master table with new calculations")
-#     dfMas.update(df3)
-    
-#     __Log("Concating species that haven't been run before, saving")
-#     newMod = [x for x in df3.index if x not in dfMas.index]
-#     dfNewMod = df3.reindex(newMod)
-#     dfNewMas = pd.concat([dfMas, dfNewMod])
-#     dfNewMas.to_csv(masterFileName)#, index_col=["GeoTiff", "Zone"])
-    
-#     ########################################################################## Clean up
-#     ###################################################################################   
-#     df1 = None
-#     df2 = None
-#     df3 = None
-    
-#     # Get end time and time it took to run all species
-#     endtime2 = datetime.now()
-#     delta2 = endtime2 - starttime0
-#     __Log("Total processing time: " + str(delta2))
-    
-#     return dfMas
\ No newline at end of file
+"""
+Created Oct 31, 2016 by N. Tarr
+Functions related to calculating the amount of species' habitat that falls within zones
+of interest.
+"""
+def PercentOverlay(zoneFile, zoneName, zoneField, habmapList, habDir, workDir, scratchDir,
+                   snap, extent="habMap", tileSize=4096, workers=1, mode="species",
+                   exportCSV=False):
+    '''
+    (string, string, string, list, string, string, string, string, [string], [int],
+     [int], [string], [boolean]) -> pandas dataframe
+
+    This function calculates the number of habitat pixels and proportion of each species'
+        summer, winter, and year-round habitat that occurs in each "zone" of a raster.
+        It can be used to answer questions like "Which species have the largest
+        proportion of their habitat in forest map units?" or "How much habitat does the
+        NPS protect for each species?".  The processing creates a directory for saving
+        intermediate results including a csv file of results from the process and a log
+        file.  Results accumulate in a master table kept in a SQLite database,
+        "Percent_in_<zoneName>_Master.sqlite".  When the process is run, new species
+        are added to the master table and existing entries are updated in place, so
+        a run only writes its own species' rows; the rows it replaces are moved to a
+        history table, from which the master table as of any earlier run can be read
+        with ReadOverlayMaster.  A master csv from older versions is loaded into the
+        database the first time.  With exportCSV, the whole master table is also 
+        written to "Percent_in_<zoneName>_Master.csv" after the run, for scripts and
+        spreadsheets that read it; that rewrites every species' rows, so it's off by
+        default.  Each run's own table is always saved as a csv in "/Archive".  The
+        result table contains a field for date run and runtime for each species.  The
+        table with all species that have been run is returned as a pandas dataframe.
+        NOTE: the extent of analyses is set to that of the zoneFile.
+
+        The overlay is done with NumPy rather than arcpy map algebra.  The zone and
+        habitat maps are read in aligned windows of the zoneFile's grid, and each
+        window's zone x season crosstab of pixel counts comes straight from
+        np.bincount of zone*4 + season, so no summed scratch raster or attribute table
+        is made.  With mode "species", species are processed on a pool of workers and
+        each reads the zone windows it needs for itself.  With mode "windows", the
+        zone windows are processed on the pool instead: each is read once and crossed
+        with every species map that covers it, accumulating a species x zone x season
+        array of counts, so the zoneFile, usually the largest input, is read once no
+        matter how many species there are.  Habitat maps can be
+        CONUS extent "0123" maps or range-extent 1-3 maps snapped to the zoneFile's
+        grid (see raster.OpenInGrid); cells that aren't 1, 2, or 3, including
+        nodata, count as non-habitat.
+
+        NOTE:  Running two or more instances of this function (for the same analysis)
+            may execute correctly, but the log file will be jumpled.
+
+    Arguments:
+    zoneFile -- A raster layer of the continental U.S. with zones of interest assigned
+        a unique value/code.  Must have following properties:
+                a) areas of interest have numeric, zon-zero, integer codes. If 0's exist
+                   reclass them to 99999 or something recognizable first.
+                b) 30m x 30m
+                c) Albers NAD83 projection
+                d) 1 band
+                e) GeoTiff format
+                f) valid raster attribute table, if zoneField isn't "VALUE"
+    zoneName -- A short name to use in file naming (e.g., "Pine")
+    zoneField -- The field in in the zoneFile to use in the process.  It must be
+        an integer with unique values for each zone you are interested in. NOTE: Zero
+        is not a valid value!!!  With "VALUE", the zones are the cell values and are
+        found by scanning the raster if GDAL finds no attribute table for it.
+    habmapList -- Python list of GAP habitat maps to analyze. Needs to be a list of
+        geotiffs named like: "mSEWEx_CONUS_HabMap_2001v1.tif".
+    habDir -- The directory containing the GAP habitat maps to use in the process.
+    workDir -- The name of a directory to save all results, including subfolders, log file
+        temp output, and final csv files.  This code builds several subfolders and files.
+    scratchDir -- A scratch directory to work in.  This option included so that
+        processing can be batched.  If you pass a directory that doesn't exist, it will
+        be created.  Nothing is written there now that no scratch rasters are made.
+    snap -- A 30x30m cell raster to use as a snap grid during processing.  The
+        zoneFile defines the grid, so this should share it.
+    extent -- Choose "habMap", "zoneFile", or "zoneBoxes".  habMap will process each
+        species overlay with an extent matching that species' habitat's extent.
+        zoneFile will do analyses at the extent of the zoneFile, which is usually CONUS
+        and therefore takes much longer.  Only the zone totals and non-habitat pixel
+        counts differ.  zoneBoxes gives the same results as zoneFile but reads only
+        the windows where a species' footprint (see raster.Footprint) meets the
+        bounding box of a zone, and takes the non-habitat counts from each zone's
+        number of cells, which is fastest when the zones are small and scattered
+        (e.g., a few parks).  The zones' bounding boxes and cell counts are saved
+        to "<zoneName>_zones.npz" and the footprints to "/Footprints" in workDir, and
+        both are reused until the rasters change.
+    tileSize -- Width and height, in cells, of the windows that are read.
+    workers -- Number of processes to overlay species or windows with.  On Windows,
+        scripts that use more than one worker must guard their code with
+        "if __name__ == '__main__':".
+    mode -- Choose "species" or "windows".  "windows" is faster for long species lists
+        and big zoneFiles, but every species' RunTime is then that of the whole
+        overlay.
+    exportCSV -- True to export the master table to "Percent_in_<zoneName>_Master.csv"
+        after the run, as versions before the SQLite master table did.
+
+    Example:
+    >>>ProportionPineDF = ga.habitat.PercentOverlay(zoneFile = "C:/data/Pine.tif",
+                                                    zoneName = "Pine",
+                                                    zoneField = "VALUE",
+                                                    habmapList = ["mSEWEx.tif", "bAMROx.tif"]
+                                                    habDir = "C:/data/speciesmaps/",
+                                                    workDir = "C:/analyses/represenation/pine",
+                                                    scratchDir = "C:/scratch/pine",
+                                                    snap = "C:/data/snapgrid",
+                                                    extent = "habMap",
+                                                    mode = "windows")
+    '''
+    ############################################################## Imports and settings
+    ###################################################################################
+    import pandas as pd, numpy as np, os
+    from datetime import datetime
+    from gapanalysis import raster
+    if extent not in ("habMap", "zoneFile", "zoneBoxes"):
+        raise ValueError('extent must be "habMap", "zoneFile", or "zoneBoxes", not '
+                         '{0}'.format(extent))
+    if mode not in ("species", "windows"):
+        raise ValueError('mode must be "species" or "windows", not {0}'.format(mode))
+    pd.set_option('display.width', 1000)
+
+    ################################ Create the working directories if they don't exist
+    ###################################################################################
+    # Create working directory
+    if not os.path.exists(workDir):
+        os.makedirs(workDir)
+    # Create a scratch workspace
+    if not os.path.exists(scratchDir):
+        os.makedirs(scratchDir)
+    # Create directories for archiving results
+    archive = workDir + "/Archive"
+    if not os.path.exists(archive):
+        os.makedirs(archive)
+
+    ############################################ Function to write data to the log file
+    ###################################################################################
+    starttime0 = datetime.now()
+    timestamp = starttime0.strftime('%Y-%m-%d')
+
+    log = workDir + "/log{0}.txt".format(timestamp)
+    def __Log(content):
+        print(content)
+        with open(log, 'a') as logDoc:
+            logDoc.write(content + '\n')
+
+    __Log("\n\n\n****************  " + timestamp + "  **************************\n")
+    __Log("\nRasters that will be processed: " + str(habmapList) + "\n")
+    __Log("Checked for and built required directories, lists, & dataframes")
+
+    ######################################## Get list of unique values from zone raster
+    ###################################################################################
+    __Log("Reading zone values from " + zoneFile)
+    zones = raster.Open(zoneFile)
+    # For the zoneBoxes extent, one scan finds the zones' values, cells, and boxes
+    scan = None
+    if extent == "zoneBoxes":
+        scan = _ZoneScan(zoneFile, workDir + "/" + zoneName + "_zones.npz", tileSize)
+    zoneValues, zoneLabels = _ZoneValues(zones, zoneField, tileSize, scan)
+    __Log("{0} zones".format(len(zoneValues)))
+
+    ############################### Overlay each species' windows on the zone windows
+    ###################################################################################
+    # For the zoneBoxes extent, the windows where zones are and where each species is
+    zoneBoxes, windowArgs = None, None
+    if extent == "zoneBoxes":
+        __Log("Indexing zone bounding boxes and species footprints")
+        zoneCells, zoneWindows = _ZoneBoxes(scan, zoneValues, zones, tileSize)
+        footprints = raster.FootprintIndex([habDir + sp for sp in habmapList
+                                            if os.path.exists(habDir + sp)],
+                                           workDir + "/Footprints", workers=workers,
+                                           template=zoneFile)
+        zoneBoxes = (zoneCells, zoneWindows, footprints)
+        windowArgs = {}
+        for sp in habmapList:
+            parts = [raster.FootprintWindow(footprints[habDir + sp], window)
+                     for window in zoneWindows if habDir + sp in footprints]
+            windowArgs[sp] = ([part for part in parts if part is not None], zoneCells)
+        __Log("{0} of {1} windows have zones".format(
+              len(zoneWindows), len(raster.TileWindows(zones.RasterXSize,
+                                                       zones.RasterYSize, tileSize))))
+
+    counts = {}
+    if mode == "species":
+        results = raster.MapWindows(_OverlaySpecies, habmapList,
+                                    args=(habDir, zoneFile, zoneValues, extent,
+                                          tileSize),
+                                    workers=min(workers, len(habmapList)),
+                                    windowArgs=windowArgs)
+    else:
+        results = _OverlayWindows(habmapList, habDir, zoneFile, zoneValues, extent,
+                                  tileSize, workers, zoneBoxes)
+    for sp, (crosstab, delta, error) in results:
+        __Log("\n-------" + sp + "-------")
+        if error is not None:
+            __Log("ERROR -- {0}".format(error))
+            # Not doing anything will leave values set to zero
+            crosstab = np.zeros((len(zoneValues), len(_SEASONS)), dtype=np.int64)
+        __Log("Processing time: " + str(delta))
+        counts[sp] = (crosstab, str(delta))
+
+    ########################################## Data munging of the multispecies results
+    ###################################################################################
+    __Log("\nCalculating some fields in multispecies dataframe")
+    date = datetime.now().strftime('%Y-%m-%d-%M')
+    df3 = OverlayTable([sp for sp in habmapList if sp in counts], zoneLabels,
+                       [counts[sp][0] for sp in habmapList if sp in counts],
+                       date, [counts[sp][1] for sp in habmapList if sp in counts])
+
+    ########################################################### Update and save results
+    ###################################################################################
+    df3FileName = archive + "/" + zoneName + "_" + \
+                    starttime0.strftime('%Y-%m-%d-%H-%M') + ".csv"
+    __Log("Saving new species table to " + df3FileName)
+    print(df3)
+    df3.to_csv(df3FileName)
+
+    # Upsert the new rows into the master table; only this run's rows are written
+    masterFileName = workDir + "/Percent_in_" + zoneName + "_Master.sqlite"
+    masterCSV = workDir + "/Percent_in_" + zoneName + "_Master.csv"
+    __Log("Updating master table " + masterFileName + " with new calculations")
+    connection = _OpenMaster(masterFileName, masterCSV)
+    run = starttime0.isoformat()
+    _UpsertMaster(connection, df3, run)
+    connection.close()
+    dfNewMas = ReadOverlayMaster(masterFileName)
+    if exportCSV:
+        __Log("Exporting master table to " + masterCSV)
+        dfNewMas.to_csv(masterCSV)
+
+    # Get end time and time it took to run all species
+    endtime2 = datetime.now()
+    delta2 = endtime2 - starttime0
+    __Log("Total processing time: " + str(delta2))
+
+    return dfNewMas
+
+
+def DecodeOverlay(values, counts, zoneValues, base=4):
+    '''
+    (numpy array, numpy array, numpy array, [int]) -> numpy array
+
+    Returns the zone x season crosstab (see OverlayTable) of an overlay whose cells
+        were encoded as zone*base + habitat code, from the encoded values and their
+        counts, e.g., the VALUE and COUNT columns of the attribute table of
+        arcpy.sa.CellStatistics([habMap, zoneFile * 10], "SUM") with base 10.  The
+        zones and codes come from np.divmod of the values, with no string parsing.
+        Codes other than 1-3 count as non-habitat, and values of zones that aren't
+        in zoneValues are left out.
+
+    Arguments:
+    values -- The encoded values.
+    counts -- The number of cells with each value.
+    zoneValues -- The sorted cell values of the zones.
+    base -- The number the zones were multiplied by, more than the largest code.
+
+    Example:
+    >>> DecodeOverlay([50, 53, 121], [900, 40, 7], np.array([5, 12]), base=10)
+    array([[900,   0,   0,  40],
+           [  0,   7,   0,   0]])
+    '''
+    import numpy as np
+    nseason = len(_SEASONS)
+    zoneValues = np.asarray(zoneValues)
+    zone, code = np.divmod(np.asarray(values, dtype=np.int64), base)
+    if len(zoneValues) == 0:
+        return np.zeros((0, nseason), dtype=np.int64)
+    index = np.searchsorted(zoneValues, zone)
+    index[index == len(zoneValues)] = 0
+    inZone = zoneValues[index] == zone
+    season = np.where((code >= 1) & (code <= 3), code, 0)
+    flat = np.bincount(index[inZone]*nseason + season[inZone],
+                       weights=np.asarray(counts)[inZone],
+                       minlength=len(zoneValues)*nseason)
+    return flat.astype(np.int64).reshape(len(zoneValues), nseason)
+
+
+def OverlayTable(species, zoneLabels, crosstabs, date="", runtimes=None):
+    '''
+    (list, numpy array, list, [string], [list]) -> pandas dataframe
+
+    Builds the PercentOverlay results table, indexed by GeoTiff and Zone, from each
+        species' zone x season crosstab of pixel counts, with a row for each zone and
+        columns for non-habitat, summer, winter, and year-round pixels.  Zones that
+        share a label are added together with np.bincount of species*labels + label,
+        and the totals and percentages of all rows are computed at once on the
+        species x zone x season array before the dataframe is made, so no lookups
+        or string parsing are done per row.
+
+    Arguments:
+    species -- The names of the species' habitat maps, e.g., "mSEWEx_CONUS.tif".
+    zoneLabels -- The zoneField value of each zone, in the order of the crosstab
+        rows.
+    crosstabs -- A crosstab for each species, e.g., from DecodeOverlay, or one
+        species x zone x season array.
+    date -- The date to record for the run.
+    runtimes -- Optionally, the processing time to record for each species.
+
+    Example:
+    >>> OverlayTable(["mSEWEx.tif"], [1, 2], [DecodeOverlay(values, counts,
+                                                             np.array([5, 12]), 10)])
+    '''
+    import numpy as np, pandas as pd
+    nseason = len(_SEASONS)
+    nspecies = len(species)
+    labels, labelIndex = np.unique(np.asarray(zoneLabels), return_inverse=True)
+    nlabel = len(labels)
+    counts = np.asarray(crosstabs, dtype=np.int64).reshape(nspecies,
+                                                           len(zoneLabels), nseason)
+
+    # Add up the zones that share a label
+    code = (np.arange(nspecies)[:, None]*nlabel + labelIndex[None, :]).ravel()
+    merged = np.stack([np.bincount(code, weights=counts[:, :, k].ravel(),
+                                   minlength=nspecies*nlabel)
+                       for k in range(nseason)], axis=1).astype(np.int64)
+    merged = merged.reshape(nspecies, nlabel, nseason)
+
+    # Summer and winter include year-round habitat, and totals are per species
+    nonhabitat, summer, winter, allYear = (merged[:, :, k] for k in range(nseason))
+    summer, winter = summer + allYear, winter + allYear
+    seasons = {"SummerPixels": summer, "WinterPixels": winter,
+               "AllYearPixels": allYear}
+    totals = {name: np.repeat(values.sum(axis=1, keepdims=True), nlabel, axis=1)
+              for name, values in seasons.items()}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        percents = {name: np.nan_to_num(100*seasons[name]/totals[name])
+                    for name in seasons}
+
+    # Per-species fields are made once per species and repeated
+    names = pd.Series(np.asarray(species, dtype=object), dtype=object)
+    strUC = (names.str[0] + names.str[1:5].str.upper() + names.str[5]).values
+    if runtimes is None:
+        runtimes = [""]*nspecies
+    index = pd.MultiIndex.from_arrays([np.repeat(np.asarray(species, dtype=object),
+                                                 nlabel),
+                                       np.tile(labels, nspecies)],
+                                      names=["GeoTiff", "Zone"])
+    # Specify the order of columns for convenience
+    df3 = pd.DataFrame({"strUC": np.repeat(strUC, nlabel),
+                        "PercSummer": percents["SummerPixels"].ravel(),
+                        "PercWinter": percents["WinterPixels"].ravel(),
+                        "PercYearRound": percents["AllYearPixels"].ravel(),
+                        "NonHabitatPixels": nonhabitat.ravel(),
+                        "SummerPixels": summer.ravel(),
+                        "WinterPixels": winter.ravel(),
+                        "AllYearPixels": allYear.ravel(),
+                        "ZoneTotal": merged.sum(axis=2).ravel(),
+                        "SummerPixelTotal": totals["SummerPixels"].ravel(),
+                        "WinterPixelTotal": totals["WinterPixels"].ravel(),
+                        "AllYearPixelTotal": totals["AllYearPixels"].ravel(),
+                        "Date": date,
+                        "RunTime": np.repeat(np.asarray(runtimes, dtype=object),
+                                             nlabel)},
+                       index=index)
+    return df3
+
+
+def ReadOverlayMaster(database, run=None):
+    '''
+    (string, [string]) -> pandas dataframe
+
+    Returns the master table of PercentOverlay results from its SQLite database,
+        indexed by GeoTiff and Zone.  With a run, returns the table as it was right
+        after that run instead, from the rows kept in the history table.
+
+    Arguments:
+    database -- Path to the "Percent_in_<zoneName>_Master.sqlite" database.
+    run -- Optionally, the start time of a run, in ISO format, as listed in the
+        "Run" column of the master and history tables.  Runs are ordered by time,
+        so any ISO time returns the table as of the last run started before it.
+
+    Example:
+    >>> ReadOverlayMaster("C:/analyses/pine/Percent_in_Pine_Master.sqlite",
+                          run="2017-05-01")
+    '''
+    import sqlite3, pandas as pd
+    connection = sqlite3.connect(database)
+    try:
+        if run is None:
+            df = pd.read_sql("SELECT * FROM master", connection)
+        else:
+            # The latest version of each row from runs up to the one given
+            df = pd.read_sql("""SELECT * FROM (
+                                    SELECT * FROM master WHERE Run <= :run
+                                    UNION ALL
+                                    SELECT {0} FROM history WHERE Run <= :run)
+                                ORDER BY Run""".format(", ".join(_MASTER)),
+                             connection, params={"run": run})
+            df = df.drop_duplicates(["GeoTiff", "Zone"], keep="last")
+    finally:
+        connection.close()
+    return df.drop(columns="Run").set_index(["GeoTiff", "Zone"])
+
+
+# Columns of the master table of PercentOverlay results in the SQLite database
+_MASTER = ["GeoTiff", "Zone", "strUC", "PercSummer", "PercWinter", "PercYearRound",
+           "NonHabitatPixels", "SummerPixels", "WinterPixels", "AllYearPixels",
+           "ZoneTotal", "SummerPixelTotal", "WinterPixelTotal", "AllYearPixelTotal",
+           "Date", "RunTime", "Run"]
+
+
+def _OpenMaster(database, csv=None):
+    '''
+    (string, [string]) -> sqlite3 connection
+
+    Opens (creating if needed) the SQLite database of PercentOverlay results, with
+        a master table keyed by GeoTiff and Zone and a history table of the rows
+        runs have replaced.  A new database is filled from the master csv of older
+        versions if there is one.
+    '''
+    import os, sqlite3, pandas as pd
+    new = not os.path.exists(database)
+    connection = sqlite3.connect(database)
+    columns = """GeoTiff TEXT, Zone INTEGER, strUC TEXT, PercSummer REAL,
+                 PercWinter REAL, PercYearRound REAL, NonHabitatPixels INTEGER,
+                 SummerPixels INTEGER, WinterPixels INTEGER, AllYearPixels INTEGER,
+                 ZoneTotal INTEGER, SummerPixelTotal INTEGER,
+                 WinterPixelTotal INTEGER, AllYearPixelTotal INTEGER, Date TEXT,
+                 RunTime TEXT, Run TEXT"""
+    connection.execute("CREATE TABLE IF NOT EXISTS master ({0}, "
+                       "PRIMARY KEY (GeoTiff, Zone))".format(columns))
+    connection.execute("CREATE TABLE IF NOT EXISTS history ({0}, "
+                       "Archived TEXT)".format(columns))
+    connection.execute("CREATE INDEX IF NOT EXISTS history_run ON history (Run)")
+    if new and csv is not None and os.path.exists(csv):
+        _UpsertMaster(connection, pd.read_csv(csv, index_col=["GeoTiff", "Zone"]),
+                      "")
+    connection.commit()
+    return connection
+
+
+def _UpsertMaster(connection, df, run):
+    '''
+    (sqlite3 connection, pandas dataframe, string) -> None
+
+    Inserts the rows of a PercentOverlay results table into the master table,
+        replacing rows with the same GeoTiff and Zone after copying them to the
+        history table.  Only the rows in df are read or written.
+    '''
+    from datetime import datetime
+    rows = df.reset_index().assign(Run=run)[_MASTER]
+    rows = [tuple(None if v != v else (v.item() if hasattr(v, "item") else v)
+                  for v in row) for row in rows.itertuples(index=False)]
+    archived = datetime.now().isoformat()
+    with connection:
+        connection.executemany("""INSERT INTO history SELECT *, ? FROM master
+                                  WHERE GeoTiff = ? AND Zone = ?""",
+                               [(archived, row[0], row[1]) for row in rows])
+        connection.executemany("INSERT OR REPLACE INTO master VALUES ({0})".format(
+                                   ", ".join("?"*len(_MASTER))), rows)
+
+
+# The habitat map codes, in the order of the crosstab columns
+_SEASONS = ["NonHabitatPixels", "SummerPixels", "WinterPixels", "AllYearPixels"]
+
+
+def _ZoneValues(zones, zoneField, tileSize=4096, scan=None):
+    '''
+    (gdal dataset, string, [int], [tuple]) -> numpy array, numpy array
+
+    Returns the sorted cell values of the zones in a zone raster and the zoneField
+        value of each, from the attribute table GDAL finds for the raster or, for the
+        "VALUE" field, from a scan of the raster if there's no table.  A scan 
+        already made by _ZoneScan can be passed to save another.  Zero and nodata 
+        aren't zones.
+    '''
+    import numpy as np
+    from gapanalysis import raster, rat
+    band = zones.GetRasterBand(1)
+    table = band.GetDefaultRAT()
+    if table is not None:
+        names = [table.GetNameOfCol(i).upper() for i in range(table.GetColumnCount())]
+        if "VALUE" in names and zoneField.upper() in names:
+            rows = range(table.GetRowCount())
+            values = np.array([table.GetValueAsInt(r, names.index("VALUE"))
+                               for r in rows], dtype=np.int64)
+            labels = np.array([table.GetValueAsInt(r, names.index(zoneField.upper()))
+                               for r in rows], dtype=np.int64)
+            order = np.argsort(values)
+            keep = values[order] != 0
+            return values[order][keep], labels[order][keep]
+    if zoneField.upper() != "VALUE":
+        raise ValueError("GDAL found no {0} field for the zones".format(zoneField))
+    if scan is not None:
+        return scan[0].copy(), scan[0].copy()
+    histogram = rat.Histogram(nodata=band.GetNoDataValue())
+    for window in raster.TileWindows(zones.RasterXSize, zones.RasterYSize, tileSize):
+        histogram.Add(raster.ReadWindow(zones, window))
+    values = histogram.Counts()[0]
+    values = values[values != 0]
+    return values, values.copy()
+
+
+def _ZoneScan(zoneFile, path, tileSize=4096):
+    '''
+    (string, string, [int]) -> numpy array, numpy array, numpy array
+
+    Scans a zone raster once and returns the sorted values of its zones, the number
+        of cells of each, and their (xmin, ymin, xmax, ymax) bounding boxes.  Each 
+        row of a window is split into runs of equal values, which are far fewer than
+        the cells in most zone rasters, and the runs are merged into zones by 
+        sorting rather than with ufunc.at.  The results are saved to path, a .npz 
+        file, along with the zoneFile's size and modification time, so the zoneFile
+        is scanned once and then reused until it changes.  Zero and nodata aren't 
+        zones.
+    '''
+    import os, numpy as np
+    from gapanalysis import raster
+    stat = os.stat(zoneFile)
+    try:
+        with np.load(path) as saved:
+            if (int(saved["size"]) != stat.st_size or
+                float(saved["mtime"]) != stat.st_mtime):
+                raise ValueError("stale zone scan")
+            return saved["values"], saved["cells"], saved["boxes"]
+    except Exception:
+        pass
+    zones = raster.Open(zoneFile)
+    nodata = zones.GetRasterBand(1).GetNoDataValue()
+    found = []
+    for window in raster.TileWindows(zones.RasterXSize, zones.RasterYSize, tileSize):
+        zone = raster.ReadWindow(zones, window)
+        # Runs start at the first cell of each row and wherever the value changes
+        change = np.ones(zone.shape, dtype=bool)
+        change[:, 1:] = zone[:, 1:] != zone[:, :-1]
+        starts = np.flatnonzero(change)
+        lengths = np.diff(np.append(starts, zone.size))
+        values = zone.ravel()[starts]
+        keep = values != 0
+        if nodata is not None:
+            keep &= values != nodata
+        starts, lengths, values = starts[keep], lengths[keep], values[keep]
+        rows = starts//window[2] + window[1]
+        cols = starts % window[2] + window[0]
+        boxes = np.stack([cols, rows, cols + lengths, rows + 1], axis=1)
+        found.append(_MergeZones(values.astype(np.int64), lengths, boxes))
+    if found:
+        values, cells, boxes = _MergeZones(*[np.concatenate(f) for f in zip(*found)])
+    else:
+        values, cells = np.zeros(0, np.int64), np.zeros(0, np.int64)
+        boxes = np.zeros((0, 4), np.int64)
+    np.savez_compressed(path, size=stat.st_size, mtime=stat.st_mtime, values=values,
+                        cells=cells, boxes=boxes)
+    return values, cells, boxes
+
+
+def _MergeZones(values, cells, boxes):
+    '''
+    (numpy array, numpy array, numpy array) -> numpy array, numpy array, numpy array
+
+    Merges the cell counts and bounding boxes of pieces of zones, e.g., runs or the
+        zones of windows, by zone value.  The pieces are sorted by value, then each
+        zone's counts are summed and its boxes combined with reduceat.
+    '''
+    import numpy as np
+    boxes = boxes.astype(np.int64).reshape(-1, 4)
+    if len(values) == 0:
+        return values.astype(np.int64), cells.astype(np.int64), boxes
+    order = np.argsort(values, kind="stable")
+    values, cells, boxes = values[order], cells[order], boxes[order]
+    first = np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+    merged = np.empty((len(first), 4), dtype=np.int64)
+    merged[:, :2] = np.minimum.reduceat(boxes[:, :2], first, axis=0)
+    merged[:, 2:] = np.maximum.reduceat(boxes[:, 2:], first, axis=0)
+    return values[first], np.add.reduceat(cells, first).astype(np.int64), merged
+
+
+def _ZoneBoxes(scan, zoneValues, zones, tileSize=4096):
+    '''
+    (tuple, numpy array, gdal dataset, [int]) -> numpy array, list
+
+    Returns the number of cells in each of the sorted zoneValues, from a scan of the
+        zone raster by _ZoneScan, and the windows of the raster's tiles that zones 
+        reach, each shrunk to the bounding box of the zone bounding boxes it meets.
+    '''
+    import numpy as np
+    from gapanalysis import raster
+    values, found, boxes = scan
+    index = np.minimum(np.searchsorted(values, zoneValues), max(len(values) - 1, 0))
+    known = np.zeros(len(zoneValues), dtype=bool)
+    if len(values):
+        known = values[index] == zoneValues
+    cells = np.zeros(len(zoneValues), dtype=np.int64)
+    cells[known] = found[index[known]]
+    boxes = boxes[index[known]]
+
+    # Shrink each tile to the zones it meets
+    windows = []
+    for xoff, yoff, xsize, ysize in raster.TileWindows(zones.RasterXSize,
+                                                       zones.RasterYSize, tileSize):
+        x0 = np.maximum(boxes[:, 0], xoff)
+        y0 = np.maximum(boxes[:, 1], yoff)
+        x1 = np.minimum(boxes[:, 2], xoff + xsize)
+        y1 = np.minimum(boxes[:, 3], yoff + ysize)
+        meets = (x0 < x1) & (y0 < y1)
+        if meets.any():
+            windows.append((int(x0[meets].min()), int(y0[meets].min()),
+                            int(x1[meets].max() - x0[meets].min()),
+                            int(y1[meets].max() - y0[meets].min())))
+    return cells, windows
+
+
+def _ZoneIndex(zone, zoneValues, nodata=None):
+    '''
+    (numpy array, numpy array, [number]) -> numpy array, numpy array
+
+    Returns the position of each cell's zone in the sorted zoneValues and a mask of
+        the cells that are in a zone, both shaped like the window.
+    '''
+    import numpy as np
+    index = np.searchsorted(zoneValues, zone)
+    index[index == len(zoneValues)] = 0
+    inZone = zoneValues[index] == zone
+    if nodata is not None:
+        inZone &= zone != nodata
+    return index, inZone
+
+
+def _CountSeasons(index, inZone, codes, nzones):
+    '''
+    (numpy array, numpy array, numpy array, int) -> numpy array
+
+    Returns the zone x season crosstab of a window from its zone index and mask (see
+        _ZoneIndex) and its habitat codes.
+    '''
+    import numpy as np
+    nseason = len(_SEASONS)
+    index, inZone, codes = index.ravel(), inZone.ravel(), codes.ravel()
+    season = np.where((codes >= 1) & (codes <= 3), codes, 0).astype(np.int64)
+    flat = np.bincount(index[inZone]*nseason + season[inZone],
+                       minlength=nzones*nseason)
+    return flat.reshape(nzones, nseason)
+
+
+def _Crosstab(zone, codes, zoneValues, nodata=None):
+    '''
+    (numpy array, numpy array, numpy array, [number]) -> numpy array
+
+    Returns the zone x season crosstab of pixel counts for a window, with a row for
+        each of the sorted zoneValues and a column for each habitat code 0-3, from
+        np.bincount of zone index*4 + code.  Codes other than 1-3 count as 0, and
+        cells that aren't in a zone aren't counted.
+    '''
+    import numpy as np
+    if len(zoneValues) == 0:
+        return np.zeros((0, len(_SEASONS)), dtype=np.int64)
+    index, inZone = _ZoneIndex(zone, zoneValues, nodata)
+    return _CountSeasons(index, inZone, codes, len(zoneValues))
+
+
+def _OverlaySpecies(sp, habDir, zoneFile, zoneValues, extent="habMap",
+                    tileSize=4096, windows=None, zoneCells=None):
+    '''
+    (string, string, string, numpy array, [string], [int], [list], [numpy array])
+        -> numpy array, timedelta, string
+
+    Overlays one habitat map on the zone raster for PercentOverlay, window by
+        window, and returns its zone x season crosstab (see _Crosstab), the runtime,
+        and an error message or None.  For the zoneBoxes extent, only the windows
+        given are read and the non-habitat counts are what's left of zoneCells.
+        Runs in the worker processes.
+    '''
+    import numpy as np
+    from datetime import datetime
+    from gapanalysis import raster
+    starttime = datetime.now()
+    nseason = len(_SEASONS)
+    crosstab = np.zeros((len(zoneValues), nseason), dtype=np.int64)
+    try:
+        zones = raster.Open(zoneFile)
+        nodata = zones.GetRasterBand(1).GetNoDataValue()
+        habmap = raster.OpenInGrid(habDir + sp, zones)
+        if windows is None:
+            windows = raster.TileWindows(zones.RasterXSize, zones.RasterYSize,
+                                         tileSize)
+        for window in windows:
+            # With the habMap extent, only the part of the window the map covers
+            if extent == "habMap":
+                window = raster.DataWindow(habmap, window)
+                if window is None:
+                    continue
+            crosstab += _Crosstab(raster.ReadWindow(zones, window),
+                                  raster.ReadWindow(habmap, window), zoneValues,
+                                  nodata)
+    except Exception as e:
+        return crosstab, datetime.now() - starttime, str(e)
+    if zoneCells is not None:
+        crosstab[:, 0] = zoneCells - crosstab[:, 1:].sum(axis=1)
+    return crosstab, datetime.now() - starttime, None
+
+
+def _OverlayWindows(habmapList, habDir, zoneFile, zoneValues, extent="habMap",
+                    tileSize=4096, workers=1, zoneBoxes=None):
+    '''
+    (list, string, string, numpy array, [string], [int], [int], [tuple])
+        -> list of tuples
+
+    Overlays all of the habitat maps on the zone raster for PercentOverlay one zone
+        window at a time, so each zone window is read once, and returns a
+        (species, (crosstab, runtime, error)) tuple for each species, like the
+        results of _OverlaySpecies.  Each window is sent only the species whose maps
+        cover it (see raster.DataWindow), along with the part they cover.  For the
+        zoneBoxes extent, zoneBoxes is the zone cell counts, the zone windows, and
+        the footprints from PercentOverlay, and a species covers the parts of the
+        zone windows in its footprint.  Windows send back only the zones they hold
+        (see _OverlayWindow), and for the zoneFile and zoneBoxes extents the 
+        non-habitat counts are found once at the end from the zones' cell counts.
+    '''
+    import numpy as np
+    from datetime import datetime
+    from gapanalysis import raster
+    starttime = datetime.now()
+    nseason = len(_SEASONS)
+    crosstabs = np.zeros((len(habmapList), len(zoneValues), nseason), dtype=np.int64)
+    errors = {}
+    zones = raster.Open(zoneFile)
+    if extent == "zoneBoxes":
+        zoneCells, windows, footprints = zoneBoxes
+    else:
+        windows = raster.TileWindows(zones.RasterXSize, zones.RasterYSize, tileSize)
+
+    # The maps covering each window, and the parts they cover
+    covering = {window: [] for window in windows}
+    for i, sp in enumerate(habmapList):
+        try:
+            habmap = raster.OpenInGrid(habDir + sp, zones)
+        except Exception as e:
+            errors[i] = str(e)
+            continue
+        for window in windows:
+            if extent == "zoneBoxes":
+                part = raster.FootprintWindow(footprints[habDir + sp], window)
+            else:
+                part = raster.DataWindow(habmap, window)
+            if part is not None:
+                covering[window].append((i, sp, part))
+    windowArgs = {window: (tuple(covering[window]),) for window in windows}
+
+    results = raster.MapWindows(_OverlayWindow, windows,
+                                args=(habDir, zoneFile, zoneValues),
+                                workers=min(workers, len(windows)),
+                                windowArgs=windowArgs)
+    if extent != "zoneBoxes":
+        zoneCells = np.zeros(len(zoneValues), dtype=np.int64)
+    for window, (species, seen, crosstab, zoneCounts, windowErrors) in results:
+        crosstabs[np.ix_(species, seen)] += crosstab
+        errors.update((i, e) for i, e in windowErrors.items() if i not in errors)
+        if extent == "zoneFile":
+            zoneCells[seen] += zoneCounts
+    # Beyond the habMap extent, every cell of a zone that isn't habitat is 
+    # non-habitat, including those in windows a map doesn't cover
+    if extent != "habMap":
+        crosstabs[:, :, 0] = zoneCells - crosstabs[:, :, 1:].sum(axis=2)
+
+    delta = datetime.now() - starttime
+    return [(sp, (crosstabs[i], delta, errors.get(i)))
+            for i, sp in enumerate(habmapList)]
+
+
+def _OverlayWindow(window, habDir, zoneFile, zoneValues, species):
+    '''
+    (tuple, string, string, numpy array, tuple)
+        -> list, numpy array, numpy array, numpy array, dictionary
+
+    Reads one window of the zone raster and crosses it with each of the species,
+        given as (position, habitat map, part of the window) tuples, for
+        _OverlayWindows.  Only the zones in the window are tallied, so what's sent
+        back stays small however many zones there are.  Returns the species 
+        positions, the positions in zoneValues of the zones in the window, the 
+        species x zone x season crosstabs of those zones, the number of cells of 
+        each in the window, and error messages keyed by species position.  Runs in
+        the worker processes.
+    '''
+    import numpy as np
+    from gapanalysis import raster
+    nseason = len(_SEASONS)
+    zones = raster.Open(zoneFile)
+    zone = raster.ReadWindow(zones, window)
+    index, inZone = _ZoneIndex(zone, zoneValues,
+                               zones.GetRasterBand(1).GetNoDataValue())
+    zoneCounts = np.bincount(index[inZone], minlength=len(zoneValues))
+    # Number the zones in the window from 0 so the crosstabs only have their rows
+    seen = np.flatnonzero(zoneCounts)
+    index = np.searchsorted(seen, index)
+    crosstab = np.zeros((len(species), len(seen), nseason), dtype=np.int64)
+    errors = {}
+    for j, (i, sp, part) in enumerate(species):
+        try:
+            habmap = raster.OpenInGrid(habDir + sp, zones)
+            rows = slice(part[1] - window[1], part[1] - window[1] + part[3])
+            cols = slice(part[0] - window[0], part[0] - window[0] + part[2])
+            crosstab[j] = _CountSeasons(index[rows, cols], inZone[rows, cols],
+                                        raster.ReadWindow(habmap, part), len(seen))
+        except Exception as e:
+            errors[i] = str(e)
+    return [i for i, sp, part in species], seen, crosstab, zoneCounts[seen], errors
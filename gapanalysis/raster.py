@@ -0,0 +1,845 @@
+"""
+A module of functions for reading and writing rasters in windows with GDAL and NumPy.
+These are the building blocks of the NumPy engines elsewhere in the package, which
+stream aligned tiles of the 30m CONUS grid through arrays instead of running arcpy
+map algebra on full-extent rasters.
+"""
+
+# The codes of GAP seasonal habitat maps (1 summer, 2 winter, 3 year-round) that
+# count as habitat in each season.
+SEASONS = {"Summer": (1, 3), "Winter": (2, 3), "Any": (1, 2, 3)}
+
+
+def TileWindows(xsize, ysize, tileSize=4096):
+    '''
+    (int, int, [int]) -> list of tuples
+
+    Splits a grid into square tiles and returns their windows as (xoff, yoff, xsize,
+        ysize) tuples, in row-major order.  Tiles on the right and bottom edges are
+        clipped to the grid.
+
+    Arguments:
+    xsize -- Number of columns in the grid.
+    ysize -- Number of rows in the grid.
+    tileSize -- The width and height of a tile in cells.
+
+    Example:
+    >>> TileWindows(5000, 3000, 4096)
+    [(0, 0, 4096, 3000), (4096, 0, 904, 3000)]
+    '''
+    windows = []
+    for yoff in range(0, ysize, tileSize):
+        for xoff in range(0, xsize, tileSize):
+            windows.append((xoff, yoff, min(tileSize, xsize - xoff),
+                            min(tileSize, ysize - yoff)))
+    return windows
+
+
+def Open(raster, update=False):
+    '''
+    (string, [boolean]) -> gdal dataset
+
+    Opens a raster with GDAL, raising an exception instead of returning None if the
+        file can't be read.
+
+    Arguments:
+    raster -- Path to the raster.
+    update -- True to open the raster for writing.
+    '''
+    from osgeo import gdal
+    gdal.UseExceptions()
+    if update:
+        return gdal.Open(raster, gdal.GA_Update)
+    return gdal.Open(raster, gdal.GA_ReadOnly)
+
+
+def CheckAlignment(dataset, template):
+    '''
+    (gdal dataset, gdal dataset) -> None
+
+    Raises a ValueError if the dataset doesn't share the template's dimensions and
+        geotransform, i.e., if its windows can't be read with the template's offsets.
+
+    Arguments:
+    dataset -- The dataset to check, usually a species habitat map.
+    template -- The dataset defining the grid, usually the CONUS extent raster.
+    '''
+    if (dataset.RasterXSize, dataset.RasterYSize) != (template.RasterXSize,
+                                                      template.RasterYSize):
+        raise ValueError("{0}x{1} grid doesn't match the {2}x{3} template".format(
+                         dataset.RasterXSize, dataset.RasterYSize,
+                         template.RasterXSize, template.RasterYSize))
+    gt, tgt = dataset.GetGeoTransform(), template.GetGeoTransform()
+    if any(abs(a - b) > 1e-6 for a, b in zip(gt, tgt)):
+        raise ValueError("geotransform {0} doesn't match the template {1}".format(
+                         gt, tgt))
+
+
+def ReadWindow(dataset, window, dtype=None):
+    '''
+    (gdal dataset, tuple, [numpy dtype]) -> numpy array
+
+    Reads a window of the first band of a dataset.
+
+    Arguments:
+    dataset -- An open gdal dataset.
+    window -- An (xoff, yoff, xsize, ysize) tuple.
+    dtype -- Optionally, a dtype to cast the array to.
+    '''
+    xoff, yoff, xsize, ysize = window
+    array = dataset.GetRasterBand(1).ReadAsArray(xoff, yoff, xsize, ysize)
+    if dtype is not None and array.dtype != dtype:
+        array = array.astype(dtype)
+    return array
+
+
+def GDALType(dtype):
+    '''
+    (numpy dtype) -> integer
+
+    Returns the GDAL data type code matching a NumPy dtype.
+    '''
+    import numpy as np
+    from osgeo import gdal
+    types = {np.dtype("uint8"): gdal.GDT_Byte,
+             np.dtype("uint16"): gdal.GDT_UInt16,
+             np.dtype("int16"): gdal.GDT_Int16,
+             np.dtype("uint32"): gdal.GDT_UInt32,
+             np.dtype("int32"): gdal.GDT_Int32,
+             np.dtype("float32"): gdal.GDT_Float32,
+             np.dtype("float64"): gdal.GDT_Float64}
+    return types[np.dtype(dtype)]
+
+
+def CreateGeoTiff(path, template, dtype, nbits=None, nodata=None, sparse=False):
+    '''
+    (string, gdal dataset, numpy dtype, [int], [number], [boolean]) -> gdal dataset
+
+    Creates a tiled, LZW compressed GeoTIFF with the template's grid and projection,
+        ready to have windows written into it.  Close the file by dereferencing the
+        returned dataset.
+
+    Arguments:
+    path -- Path of the GeoTIFF to create.  An existing file is overwritten.
+    template -- The dataset defining the grid, usually the CONUS extent raster.
+    dtype -- The NumPy dtype of the values that will be written.
+    nbits -- Optionally, a bit depth to pack the values into (e.g., 1 for 1_BIT).
+    nodata -- Optionally, a nodata value for the band.
+    sparse -- True to leave blocks that are never written out of the file (GDAL's 
+        SPARSE_OK), rather than filling them with zeros on close.  GDAL reads them as
+        zero, or nodata if there is one.  This saves writing and compressing the 
+        empty parts of CONUS, but not all non-GDAL software reads sparse files.
+    '''
+    from osgeo import gdal
+    gdal.UseExceptions()
+    options = ["TILED=YES", "BLOCKXSIZE=512", "BLOCKYSIZE=512", "COMPRESS=LZW",
+               "BIGTIFF=IF_SAFER"]
+    if nbits is not None:
+        options.append("NBITS={0}".format(nbits))
+    if sparse:
+        options.append("SPARSE_OK=TRUE")
+    driver = gdal.GetDriverByName("GTiff")
+    dataset = driver.Create(path, template.RasterXSize, template.RasterYSize, 1,
+                            GDALType(dtype), options=options)
+    dataset.SetGeoTransform(template.GetGeoTransform())
+    dataset.SetProjection(template.GetProjection())
+    if nodata is not None:
+        dataset.GetRasterBand(1).SetNoDataValue(nodata)
+    return dataset
+
+
+def MapWindows(function, windows, args=(), workers=1, windowArgs=None):
+    '''
+    (function, list, [tuple], [int], [dictionary]) -> generator
+
+    Calls function(window, *args) for each window and yields (window, result) tuples.
+        With more than one worker the windows are processed on a pool of processes
+        and results are yielded as they finish, so their order isn't guaranteed.  At
+        most two windows per worker are in flight at once, which keeps the memory held
+        by finished but unconsumed results bounded.  Tiles share no state, so the
+        speedup is close to linear in the number of workers as long as the disks keep 
+        up.
+    
+    NOTE: function must be defined at the top level of a module so that it can be 
+        sent to the worker processes, and on Windows the calling script must guard its
+        code with "if __name__ == '__main__':".
+
+    Arguments:
+    function -- The function to call on each window.
+    windows -- A list of (xoff, yoff, xsize, ysize) windows.
+    args -- Additional arguments to pass to function after the window.
+    workers -- The number of processes to use.  1 (the default) runs the windows 
+        serially in this process.
+    windowArgs -- Optionally, a dictionary of tuples keyed by window with arguments
+        for that window only, passed after args.  Use this instead of args for data 
+        that differs by window so that workers aren't sent all of it for every window.
+
+    Example:
+    >>> for window, tally in MapWindows(SumTile, TileWindows(5000, 3000), 
+                                        args=(paths,), workers=8):
+            out.GetRasterBand(1).WriteArray(tally, window[0], window[1])
+    '''
+    def __Args(window):
+        if windowArgs is None:
+            return tuple(args)
+        return tuple(args) + tuple(windowArgs[window])
+    
+    if workers <= 1:
+        for window in windows:
+            yield window, function(window, *__Args(window))
+        return
+    
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        queue = list(windows)[::-1]
+        while queue or pending:
+            while queue and len(pending) < 2*workers:
+                window = queue.pop()
+                pending[executor.submit(function, window, *__Args(window))] = window
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+
+
+def _BlockAny(mask, blockSize):
+    '''
+    (numpy array, int) -> numpy array
+
+    Reduces a boolean array to one cell per blockSize x blockSize block that is True 
+        where any cell of the block is True.  Partial blocks on the edges are padded.
+    '''
+    import numpy as np
+    rows, cols = mask.shape
+    padRows, padCols = -rows % blockSize, -cols % blockSize
+    if padRows or padCols:
+        mask = np.pad(mask, ((0, padRows), (0, padCols)))
+    return mask.reshape(mask.shape[0]//blockSize, blockSize, 
+                        mask.shape[1]//blockSize, blockSize).any(axis=(1, 3))
+
+
+def Footprint(raster, blockSize=256, tileSize=4096, template=None):
+    '''
+    (string, [int], [int], [string]) -> dictionary
+
+    Scans a raster once and records where its nonzero cells are, so that later
+        passes can skip the windows where it has no data.  The footprint is a 
+        dictionary with:
+        "bbox" -- The (xmin, ymin, xmax, ymax) cell bounds of the nonzero cells, with
+            the max bounds exclusive, or None if all cells are zero or nodata.
+        "blockSize" -- The size of the cells of the occupancy bitmap.
+        "occupancy" -- A coarse boolean array with one cell per blockSize x blockSize
+            block of the raster that is True where the block has nonzero cells.
+        
+        Note that counter pixels in the top left corner are nonzero, so footprints of
+        CONUS extent maps always include that corner and their bbox starts there.  The
+        occupancy bitmap is what keeps them useful.
+
+    Arguments:
+    raster -- Path to the raster, usually a species habitat map.
+    blockSize -- Size of the blocks of the occupancy bitmap, in cells.
+    tileSize -- Size of the windows the raster is read in.  Must be a multiple of
+        blockSize.
+    template -- Optionally, the raster defining the grid the footprint is in, for
+        range-extent maps (see OpenInGrid).  Only the windows the map reaches are 
+        read.
+
+    Example:
+    >>> Footprint("C:/Data/Model/Output/Any/bAMROx_CONUS_01A_2001v1.tif")["bbox"]
+    (0, 0, 152280, 97081)
+    '''
+    import numpy as np
+    if tileSize % blockSize != 0:
+        raise ValueError("tileSize must be a multiple of blockSize")
+    if template is None:
+        dataset = Open(raster)
+    else:
+        dataset = OpenInGrid(raster, template)
+    band = dataset.GetRasterBand(1)
+    nodata = band.GetNoDataValue()
+    occupancy = np.zeros((-(-dataset.RasterYSize//blockSize), 
+                          -(-dataset.RasterXSize//blockSize)), dtype=bool)
+    xmin, ymin, xmax, ymax = dataset.RasterXSize, dataset.RasterYSize, 0, 0
+    for window in TileWindows(dataset.RasterXSize, dataset.RasterYSize, tileSize):
+        if DataWindow(dataset, window) is None:
+            continue
+        xoff, yoff, xsize, ysize = window
+        array = ReadWindow(dataset, window)
+        mask = array != 0
+        if nodata is not None:
+            mask &= array != nodata
+        if not mask.any():
+            continue
+        cols, rows = np.flatnonzero(mask.any(axis=0)), np.flatnonzero(mask.any(axis=1))
+        xmin, xmax = min(xmin, xoff + cols[0]), max(xmax, xoff + cols[-1] + 1)
+        ymin, ymax = min(ymin, yoff + rows[0]), max(ymax, yoff + rows[-1] + 1)
+        blocks = _BlockAny(mask, blockSize)
+        occupancy[yoff//blockSize:yoff//blockSize + blocks.shape[0],
+                  xoff//blockSize:xoff//blockSize + blocks.shape[1]] |= blocks
+    bbox = None
+    if xmax > 0:
+        bbox = (int(xmin), int(ymin), int(xmax), int(ymax))
+    return {"bbox": bbox, "blockSize": blockSize, "occupancy": occupancy}
+
+
+def FootprintIndex(rasters, indexDir, blockSize=256, workers=1, template=None):
+    '''
+    (list, string, [int], [int], [string]) -> dictionary
+
+    Returns a dictionary of footprints (see Footprint) keyed by raster path.  Each
+        footprint is saved to indexDir as a small .npz file along with the raster's
+        size and modification time, so it's computed once and then reused until the 
+        raster changes.  Files are named by the raster's name and a hash of its 
+        absolute path and the template, so maps with the same name in different 
+        directories, e.g., the Summer and Winter maps of a species, or footprints
+        in different grids can share an indexDir.
+
+    Arguments:
+    rasters -- A list of raster paths.
+    indexDir -- Directory to save the footprints in.  Created if it doesn't exist.
+    blockSize -- Size of the blocks of the occupancy bitmaps, in cells.
+    workers -- Number of processes to compute missing footprints with.
+    template -- Optionally, the raster defining the grid of the footprints, for
+        range-extent maps (see Footprint).
+
+    Example:
+    >>> index = FootprintIndex(["C:/Data/Any/bAMROx.tif"], "C:/Data/Footprints")
+    '''
+    import os, hashlib, numpy as np
+    if not os.path.exists(indexDir):
+        os.makedirs(indexDir)
+    
+    def __File(raster):
+        grid = os.path.abspath(template) if isinstance(template, str) else template
+        key = os.path.abspath(raster) + "|" + str(grid)
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(indexDir, "{0}_{1}.footprint.npz".format(
+                            os.path.basename(raster), digest))
+    
+    index, missing = {}, []
+    for raster in rasters:
+        stat = os.stat(raster)
+        try:
+            with np.load(__File(raster)) as saved:
+                if (int(saved["size"]) != stat.st_size or
+                    float(saved["mtime"]) != stat.st_mtime or 
+                    int(saved["blockSize"]) != blockSize or
+                    str(saved["template"]) != str(template)):
+                    raise ValueError("stale footprint")
+                bbox = None
+                if saved["bbox"][0] >= 0:
+                    bbox = tuple(int(b) for b in saved["bbox"])
+                index[raster] = {"bbox": bbox, "blockSize": blockSize,
+                                 "occupancy": saved["occupancy"]}
+        except Exception:
+            missing.append(raster)
+    
+    if workers > 1 and len(missing) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            n = len(missing)
+            footprints = list(executor.map(Footprint, missing, [blockSize]*n,
+                                           [4096]*n, [template]*n))
+    else:
+        footprints = [Footprint(raster, blockSize, template=template) 
+                      for raster in missing]
+    
+    for raster, footprint in zip(missing, footprints):
+        stat = os.stat(raster)
+        np.savez_compressed(__File(raster), size=stat.st_size, mtime=stat.st_mtime,
+                            blockSize=blockSize, template=str(template),
+                            occupancy=footprint["occupancy"],
+                            bbox=footprint["bbox"] or (-1, -1, -1, -1))
+        index[raster] = footprint
+    return index
+
+
+def FootprintWindow(footprint, window):
+    '''
+    (dictionary, tuple) -> tuple
+
+    Returns the part of a window that can hold nonzero cells according to a footprint,
+        as an (xoff, yoff, xsize, ysize) tuple, or None if the window is empty.  The
+        result is the intersection of the window with the footprint's bbox, or None
+        if no block of the occupancy bitmap under the window is occupied.
+
+    Arguments:
+    footprint -- A footprint from Footprint or FootprintIndex.
+    window -- An (xoff, yoff, xsize, ysize) tuple.
+    '''
+    bbox = footprint["bbox"]
+    if bbox is None:
+        return None
+    xoff, yoff, xsize, ysize = window
+    x0, y0 = max(xoff, bbox[0]), max(yoff, bbox[1])
+    x1, y1 = min(xoff + xsize, bbox[2]), min(yoff + ysize, bbox[3])
+    if x0 >= x1 or y0 >= y1:
+        return None
+    blockSize = footprint["blockSize"]
+    blocks = footprint["occupancy"][y0//blockSize:-(-y1//blockSize),
+                                    x0//blockSize:-(-x1//blockSize)]
+    if not blocks.any():
+        return None
+    return (x0, y0, x1 - x0, y1 - y0)
+
+
+def ReadPackedWindow(dataset, window, offset=0):
+    '''
+    (gdal dataset, tuple, [int]) -> numpy array
+
+    Reads a window of a binary (e.g., 1_BIT) raster and returns it bit-packed along
+        rows in np.packbits layout, one bit per cell with nonzero cells set.  GDAL
+        expands 1-bit rasters to a byte per cell when reading, so the window is packed
+        immediately and only the packed copy is kept.
+
+    Arguments:
+    dataset -- An open gdal dataset.
+    window -- An (xoff, yoff, xsize, ysize) tuple.
+    offset -- Number of zero bits to put in front of each row, for aligning the window
+        with the bytes of a larger packed window.
+    '''
+    import numpy as np
+    mask = ReadWindow(dataset, window) != 0
+    if offset:
+        mask = np.pad(mask, ((0, 0), (offset, 0)))
+    return np.packbits(mask, axis=1)
+
+
+def PackedAdd(planes, packed, rows=slice(None), cols=slice(None)):
+    '''
+    (list, numpy array, [slice], [slice]) -> list
+
+    Adds a bit-packed binary array to a bit-sliced counter in place and returns the
+        counter.  The counter is a list of packed arrays, the bit planes of the 
+        count of each cell, least significant first; start with an empty list.  The 
+        addition ripples the carry up through the planes with bitwise operations on 
+        eight cells per byte, stopping as soon as no carries are left, and adds a 
+        plane when the count outgrows the existing ones.
+
+    Arguments:
+    planes -- The bit-sliced counter.  An empty list is a counter of zeros.
+    packed -- The packed array to add, e.g., from ReadPackedWindow.
+    rows -- Optionally, the rows of the counter that packed covers.
+    cols -- Optionally, the packed columns (bytes) of the counter that packed covers.
+
+    Example:
+    >>> planes = PackedAdd(PackedAdd([], a), b)
+    >>> UnpackCounts(planes, width)
+    '''
+    import numpy as np
+    carry = packed
+    for plane in planes:
+        view = plane[rows, cols]
+        nextCarry = view & carry
+        view ^= carry
+        carry = nextCarry
+        if not carry.any():
+            return planes
+    if not planes:
+        shape = packed.shape
+        if rows != slice(None) or cols != slice(None):
+            raise ValueError("an empty counter can't be added to in part")
+    else:
+        shape = planes[0].shape
+    plane = np.zeros(shape, dtype=np.uint8)
+    plane[rows, cols] = carry
+    planes.append(plane)
+    return planes
+
+
+def UnpackCounts(planes, width, dtype="uint16"):
+    '''
+    (list, int, [numpy dtype]) -> numpy array
+
+    Returns the counts held in a bit-sliced counter (see PackedAdd) as an ordinary 
+        array with width columns.
+
+    Arguments:
+    planes -- The bit-sliced counter.
+    width -- The number of columns (cells, not bytes) of the window.
+    dtype -- The dtype of the counts.
+    '''
+    import numpy as np
+    if not planes:
+        raise ValueError("the counter has no planes")
+    counts = np.zeros((planes[0].shape[0], width), dtype=dtype)
+    for bit, plane in enumerate(planes):
+        counts += np.unpackbits(plane, axis=1, count=width).astype(dtype) << bit
+    return counts
+
+
+def GridOffset(dataset, template):
+    '''
+    (gdal dataset, gdal dataset) -> int, int
+
+    Returns the (column, row) of a dataset's top left cell in the template's grid, 
+        e.g., where a range-extent habitat map sits in the CONUS grid.  Raises a 
+        ValueError if the dataset's cells aren't the same size as the template's or 
+        aren't snapped to its grid.
+
+    Arguments:
+    dataset -- The dataset to place, usually a range-extent habitat map.
+    template -- The dataset defining the grid, usually the CONUS extent raster.
+    '''
+    gt, tgt = dataset.GetGeoTransform(), template.GetGeoTransform()
+    if abs(gt[1] - tgt[1]) > 1e-6 or abs(gt[5] - tgt[5]) > 1e-6 or gt[2] or gt[4]:
+        raise ValueError("cells of {0} don't match the template's {1}".format(gt, tgt))
+    col, row = (gt[0] - tgt[0])/tgt[1], (gt[3] - tgt[3])/tgt[5]
+    if abs(col - round(col)) > 1e-3 or abs(row - round(row)) > 1e-3:
+        raise ValueError("{0} isn't snapped to the template grid {1}".format(gt, tgt))
+    return int(round(col)), int(round(row))
+
+
+def OverlapWindow(window, offset, xsize, ysize):
+    '''
+    (tuple, tuple, int, int) -> tuple
+
+    Returns the part of a window of a template's grid that a dataset covers, as an 
+        (xoff, yoff, xsize, ysize) tuple in the template's grid, or None if the
+        dataset doesn't reach into the window.
+
+    Arguments:
+    window -- An (xoff, yoff, xsize, ysize) tuple in the template's grid.
+    offset -- The (column, row) of the dataset in the template's grid.
+    xsize -- The number of columns of the dataset.
+    ysize -- The number of rows of the dataset.
+    '''
+    x0, y0 = max(window[0], offset[0]), max(window[1], offset[1])
+    x1 = min(window[0] + window[2], offset[0] + xsize)
+    y1 = min(window[1] + window[3], offset[1] + ysize)
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return (x0, y0, x1 - x0, y1 - y0)
+
+
+def ReadOffsetWindow(dataset, window, offset, dtype="uint8"):
+    '''
+    (gdal dataset, tuple, tuple, [numpy dtype]) -> numpy array
+
+    Reads a window of a template's grid from a dataset that covers only part of it,
+        with zeros wherever the dataset has no cells.
+
+    Arguments:
+    dataset -- An open gdal dataset, usually a range-extent habitat map.
+    window -- An (xoff, yoff, xsize, ysize) tuple in the template's grid.
+    offset -- The (column, row) of the dataset in the template's grid, from
+        GridOffset.
+    dtype -- The dtype of the array if the window misses the dataset entirely.
+        Otherwise the array has the dataset's dtype.
+    '''
+    import numpy as np
+    xoff, yoff, xsize, ysize = window
+    part = OverlapWindow(window, offset, dataset.RasterXSize, dataset.RasterYSize)
+    if part is None:
+        return np.zeros((ysize, xsize), dtype=dtype)
+    piece = ReadWindow(dataset, (part[0] - offset[0], part[1] - offset[1], part[2],
+                                 part[3]))
+    if part == window:
+        return piece
+    array = np.zeros((ysize, xsize), dtype=piece.dtype)
+    array[part[1] - yoff:part[1] - yoff + part[3], 
+          part[0] - xoff:part[0] - xoff + part[2]] = piece
+    return array
+
+
+class VirtualExtent(object):
+    '''
+    A range-extent habitat map placed in a template's grid, usually the CONUS grid, 
+        without making a full-extent copy.  It only holds the paths and the map's 
+        offset in the grid, and it reads like a GDAL dataset of the template's size:
+        windows come from the map where it has cells and are zero everywhere else, 
+        including its nodata cells, like the "0123" maps Make0123 used to write.  
+        Pass it to the functions of this module in place of a dataset, e.g., 
+        ReadWindow(VirtualExtent(path, CONUSExtent), window).  Handles can be sent
+        to worker processes; the files are opened on first read.
+    
+    Arguments:
+    raster -- Path to the range-extent map.
+    template -- Path to the raster defining the grid, usually the CONUS extent 
+        raster, or the open dataset.  The map must be snapped to its grid (see 
+        GridOffset).
+
+    Example:
+    >>> habmap = VirtualExtent("C:/Data/Maps/bAMROx.tif", "C:/Data/CONUS_extent.tif")
+    >>> habmap.offset
+    (45120, 30211)
+    >>> ReadWindow(habmap, (45056, 28672, 4096, 4096)).max()
+    3
+    '''
+    def __init__(self, raster, template):
+        self.path = raster
+        self.template = template if isinstance(template, str) else None
+        source = Open(raster)
+        grid = Open(template) if isinstance(template, str) else template
+        self.offset = GridOffset(source, grid)
+        self.xsize, self.ysize = source.RasterXSize, source.RasterYSize
+        self.RasterXSize, self.RasterYSize = grid.RasterXSize, grid.RasterYSize
+        self.RasterCount = 1
+        self._geotransform = grid.GetGeoTransform()
+        self._projection = grid.GetProjection()
+        self._source = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_source"] = None
+        return state
+
+    def __repr__(self):
+        return "VirtualExtent({0!r}, {1!r})".format(self.path, self.template)
+
+    def GetGeoTransform(self):
+        return self._geotransform
+
+    def GetProjection(self):
+        return self._projection
+
+    def GetRasterBand(self, band):
+        if self._source is None:
+            self._source = Open(self.path)
+        return _VirtualBand(self)
+
+    def Window(self):
+        '''
+        () -> tuple
+
+        Returns the (xoff, yoff, xsize, ysize) window of the grid the map covers.
+        '''
+        return (self.offset[0], self.offset[1], self.xsize, self.ysize)
+
+
+class _VirtualBand(object):
+    '''
+    The band of a VirtualExtent, which reads windows of the grid from the map.
+    '''
+    def __init__(self, extent):
+        self._extent = extent
+        self._band = extent._source.GetRasterBand(1)
+        self.DataType = self._band.DataType
+
+    def GetNoDataValue(self):
+        return None
+
+    def GetMetadataItem(self, name, domain=""):
+        return self._band.GetMetadataItem(name, domain)
+
+    def GetDefaultRAT(self):
+        return None
+
+    def ReadAsArray(self, xoff=0, yoff=0, win_xsize=None, win_ysize=None):
+        extent = self._extent
+        if win_xsize is None:
+            win_xsize, win_ysize = extent.RasterXSize, extent.RasterYSize
+        array = ReadOffsetWindow(extent._source, (xoff, yoff, win_xsize, win_ysize),
+                                 extent.offset, _NumPyType(self.DataType))
+        nodata = self._band.GetNoDataValue()
+        if nodata is not None:
+            array[array == nodata] = 0
+        return array
+
+
+def _NumPyType(gdalType):
+    '''
+    (integer) -> numpy dtype
+
+    Returns the NumPy dtype matching a GDAL data type code.
+    '''
+    import numpy as np
+    for dtype in ["uint8", "uint16", "int16", "uint32", "int32", "float32", 
+                  "float64"]:
+        if GDALType(dtype) == gdalType:
+            return np.dtype(dtype)
+    raise ValueError("no NumPy dtype for GDAL type {0}".format(gdalType))
+
+
+def OpenInGrid(raster, template):
+    '''
+    (string, string or gdal dataset) -> gdal dataset or VirtualExtent
+
+    Opens a raster for reading in a template's grid: a raster that already has the 
+        template's grid is opened with GDAL, and a smaller one, like a range-extent
+        habitat map, is opened as a VirtualExtent, so callers can read windows of 
+        either the same way without any full-extent copy being made.  A 
+        VirtualExtent is returned as is.  Raises a ValueError if the raster isn't 
+        snapped to the grid.
+
+    Arguments:
+    raster -- Path to the raster, or a VirtualExtent.
+    template -- Path to the raster defining the grid, usually the CONUS extent 
+        raster, or the open dataset, which saves opening it for every raster.
+    '''
+    if isinstance(raster, VirtualExtent):
+        return raster
+    dataset = Open(raster)
+    grid = Open(template) if isinstance(template, str) else template
+    try:
+        CheckAlignment(dataset, grid)
+        return dataset
+    except ValueError:
+        return VirtualExtent(raster, template)
+
+
+def DataWindow(dataset, window):
+    '''
+    (gdal dataset or VirtualExtent, tuple) -> tuple
+
+    Returns the part of a window a dataset can have data in: the window itself for 
+        a GDAL dataset, and its overlap with the map, or None, for a VirtualExtent.
+    '''
+    if window is None or not isinstance(dataset, VirtualExtent):
+        return window
+    return OverlapWindow(window, dataset.offset, dataset.xsize, dataset.ysize)
+
+
+def WriteVirtualExtent(raster, template, path):
+    '''
+    (string, string, string) -> string
+
+    Writes a VirtualExtent as a GDAL VRT file, a few hundred bytes of XML that 
+        ArcGIS and GDAL read as a template-sized raster.  The map's cells are 
+        placed at its offset, its nodata cells and everything outside it read as 
+        zero, and the template's nonzero cells (the counter pixels) show through 
+        wherever the map has no data.  Returns the path.
+
+    Arguments:
+    raster -- Path to the range-extent map.
+    template -- Path to the raster defining the grid, usually the CONUS extent 
+        raster.
+    path -- Path of the .vrt file to write.
+
+    Example:
+    >>> WriteVirtualExtent("C:/Data/Maps/bAMROx.tif", "C:/Data/CONUS_extent.tif",
+                           "C:/Data/0123/bAMROx.vrt")
+    '''
+    import os
+    from osgeo import gdal
+    from xml.sax.saxutils import escape
+    habmap = VirtualExtent(raster, template)
+    source, grid = Open(raster), Open(template)
+    band = source.GetRasterBand(1)
+    dataType = gdal.GetDataTypeName(band.DataType)
+
+    def __Source(filename, dataset, nodata, dst):
+        xml = '    <ComplexSource>\n'
+        xml += '      <SourceFilename relativeToVRT="0">{0}</SourceFilename>\n'.format(
+               escape(os.path.abspath(filename)))
+        xml += '      <SourceBand>1</SourceBand>\n'
+        xml += ('      <SrcRect xOff="0" yOff="0" xSize="{0}" ySize="{1}"/>\n'
+                .format(dataset.RasterXSize, dataset.RasterYSize))
+        xml += ('      <DstRect xOff="{0}" yOff="{1}" xSize="{2}" ySize="{3}"/>\n'
+                .format(*dst))
+        if nodata is not None:
+            xml += '      <NODATA>{0}</NODATA>\n'.format(nodata)
+        return xml + '    </ComplexSource>\n'
+
+    vrt = '<VRTDataset rasterXSize="{0}" rasterYSize="{1}">\n'.format(
+          grid.RasterXSize, grid.RasterYSize)
+    vrt += '  <SRS>{0}</SRS>\n'.format(escape(grid.GetProjection()))
+    vrt += '  <GeoTransform>{0}</GeoTransform>\n'.format(
+           ", ".join(repr(float(g)) for g in grid.GetGeoTransform()))
+    vrt += '  <VRTRasterBand dataType="{0}" band="1">\n'.format(dataType)
+    vrt += __Source(template, grid, 0, (0, 0, grid.RasterXSize, grid.RasterYSize))
+    vrt += __Source(raster, source, band.GetNoDataValue(), habmap.Window())
+    vrt += '  </VRTRasterBand>\n</VRTDataset>\n'
+    with open(path, "w") as f:
+        f.write(vrt)
+    return path
+
+
+def SeasonMask(codes, season):
+    '''
+    (numpy array, string) -> numpy array
+
+    Returns a boolean array that is True where a window of a seasonal habitat map
+        (codes 1-3) is habitat in the season: 1 or 3 for "Summer", 2 or 3 for 
+        "Winter", and any of them for "Any".  Zeros and nodata are never habitat.
+
+    Arguments:
+    codes -- A window of a habitat map with codes 1-3.
+    season -- "Summer", "Winter", or "Any".
+    '''
+    if season == "Any":
+        return (codes >= 1) & (codes <= 3)
+    a, b = SEASONS[season]
+    return (codes == a) | (codes == b)
+
+
+class BackgroundWriter(object):
+    '''
+    Writes windows into open GDAL datasets on a background thread, so that summing
+        can carry on while GDAL compresses and writes.  A dataset can also be given
+        as a path, in which case it's opened for the write and closed right after,
+        so many rasters can be written without all of them being open at once.
+        Windows wait in a bounded queue; when it's full, Write blocks until there's
+        room, which keeps the memory held by queued windows bounded.  Other work that
+        has to follow the writes, like saving a checkpoint, can be queued with Call.
+        Call Close to wait for the queue to empty.  An error on the writing thread
+        is raised by the next call to Write or by Close, so it can't pass silently.
+        The datasets shouldn't be used by anything else until Close returns.
+
+    Arguments:
+    maxsize -- The most windows that can wait in the queue.
+    
+    Example:
+    >>> writer = BackgroundWriter()
+    >>> writer.Write(dataset, tally, xoff, yoff)
+    >>> writer.Close()
+    '''
+    def __init__(self, maxsize=4):
+        import queue, threading
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._error = None
+        self._thread = threading.Thread(target=self._Run, daemon=True)
+        self._thread.start()
+
+    def _Run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is None:
+                function, args = item
+                try:
+                    function(*args)
+                except Exception as e:
+                    self._error = e
+            item = None
+
+    @staticmethod
+    def _WriteArray(dataset, array, xoff, yoff):
+        if isinstance(dataset, str):
+            dataset = Open(dataset, update=True)
+        dataset.GetRasterBand(1).WriteArray(array, xoff, yoff)
+
+    def Write(self, dataset, array, xoff, yoff):
+        '''
+        (gdal dataset or string, numpy array, int, int) -> None
+
+        Queues an array to be written to a dataset, or the raster at a path, at 
+            (xoff, yoff).  The array must not be changed afterward; pass a copy if
+            it will be.
+        '''
+        self.Call(self._WriteArray, dataset, array, xoff, yoff)
+
+    def Call(self, function, *args):
+        '''
+        (function, ...) -> None
+
+        Queues a function to be called with the arguments on the writing thread, 
+            after the writes queued before it.
+        '''
+        if self._error is not None:
+            raise self._error
+        self._queue.put((function, args))
+
+    def Close(self, raise_errors=True):
+        '''
+        ([boolean]) -> None
+
+        Waits for all queued windows to be written, then raises any error from the
+            writing thread.  Pass raise_errors=False when closing because of another
+            exception, so that exception isn't replaced by the writer's.
+        '''
+        self._queue.put(None)
+        self._thread.join()
+        if raise_errors and self._error is not None:
+            raise self._error
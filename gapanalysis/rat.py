@@ -0,0 +1,479 @@
+"""
+A module of functions for raster attribute tables (RATs) computed with NumPy.  Value
+counts are tallied with np.bincount as windows stream through the engines in other
+modules, so a table comes free with the final write instead of costing another scan
+with arcpy.management.BuildRasterAttributeTable.  Tables are written as GDAL .aux.xml
+sidecars, which ArcGIS and GDAL both read, and as csv or Parquet files.  ReadRAT reads
+tables back in bulk from those sidecars or from an ArcGIS .vat.dbf, and
+RasterStatistics summarizes a raster, or a table, in a single pass.
+"""
+
+
+def CountValues(array, nodata=None):
+    '''
+    (numpy array, [number]) -> numpy array, numpy array
+
+    Returns the distinct values of an integer array and the number of cells with each
+        value, in order of value.  Uses np.bincount when the values span less than
+        2**24, which is much faster than np.unique, and falls back to np.unique for
+        sparse, wide-ranging values.
+
+    Arguments:
+    array -- An integer array, such as a window of a raster.
+    nodata -- Optionally, a value to leave out of the counts.
+
+    Example:
+    >>> CountValues(np.array([[0, 3], [3, 1]]))
+    (array([0, 1, 3]), array([1, 1, 2]))
+    '''
+    import numpy as np
+    array = np.asarray(array).ravel()
+    if nodata is not None:
+        array = array[array != nodata]
+    if array.size == 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    low, high = int(array.min()), int(array.max())
+    if high - low >= 2**24:
+        return np.unique(array, return_counts=True)
+    counts = np.bincount((array.astype(np.int64) - low) if low else array)
+    values = np.flatnonzero(counts)
+    return values + low, counts[values]
+
+
+class Histogram(object):
+    '''
+    Accumulates the value counts of a raster window by window.
+
+    Arguments:
+    nodata -- Optionally, a value to leave out of the counts.
+
+    Example:
+    >>> histogram = Histogram()
+    >>> for window in windows:
+            histogram.Add(tally)
+    >>> WriteAuxXML("C:/Richness/birds_Richness.tif", *histogram.Counts())
+    '''
+    def __init__(self, nodata=None):
+        import numpy as np
+        self.nodata = nodata
+        self._values = np.array([], dtype=np.int64)
+        self._counts = np.array([], dtype=np.int64)
+
+    def Add(self, array):
+        '''
+        (numpy array) -> None
+
+        Adds the value counts of an array, e.g., a window of the raster.
+        '''
+        values, counts = CountValues(array, self.nodata)
+        self.AddCounts(values, counts)
+
+    def AddCounts(self, values, counts):
+        '''
+        (numpy array, numpy array) -> None
+
+        Adds value counts that were already tallied, e.g., by another process.
+        '''
+        import numpy as np
+        if len(values) == 0:
+            return
+        values = np.concatenate([self._values, np.asarray(values, dtype=np.int64)])
+        counts = np.concatenate([self._counts, np.asarray(counts, dtype=np.int64)])
+        self._values, inverse = np.unique(values, return_inverse=True)
+        self._counts = np.bincount(inverse, weights=counts).astype(np.int64)
+
+    def Counts(self):
+        '''
+        () -> numpy array, numpy array
+
+        Returns the distinct values seen so far and their counts.
+        '''
+        return self._values.copy(), self._counts.copy()
+
+
+def Statistics(values, counts):
+    '''
+    (numpy array, numpy array) -> dictionary
+
+    Returns the minimum, maximum, mean, and standard deviation of a raster from its
+        value counts, keyed like GDAL's STATISTICS_* metadata.
+    '''
+    import numpy as np
+    values = np.asarray(values, dtype=np.float64)
+    counts = np.asarray(counts, dtype=np.float64)
+    total = counts.sum()
+    mean = (values*counts).sum()/total
+    std = np.sqrt((counts*(values - mean)**2).sum()/total)
+    return {"STATISTICS_MINIMUM": values.min(), "STATISTICS_MAXIMUM": values.max(),
+            "STATISTICS_MEAN": mean, "STATISTICS_STDDEV": std}
+
+
+class RasterStatistics(object):
+    '''
+    Accumulates the statistics of a raster window by window in a single pass.  The
+        count, mean, and variance are kept with Welford's method, merging each
+        window's moments into the running ones (Chan et al.'s pairwise update), so
+        they're stable for CONUS rasters of any type.  Integer windows are also
+        tallied into an exact histogram (see Histogram), from which percentiles are
+        found and the highest value, e.g., counter pixels, can be dropped.
+
+    Arguments:
+    nodata -- Optionally, a value to leave out.
+    dropZero -- Whether to leave out zeros.
+
+    Example:
+    >>> stats = RasterStatistics(nodata=0)
+    >>> for window in windows:
+            stats.Add(array)
+    >>> stats.Result([25, 50, 75], dropMax=True)
+    '''
+    def __init__(self, nodata=None, dropZero=False):
+        self.nodata = nodata
+        self.dropZero = dropZero
+        self.histogram = Histogram()
+        self.count, self.mean, self.m2 = 0, 0.0, 0.0
+        self.minimum, self.maximum = None, None
+        self._integer = True
+
+    def Add(self, array):
+        '''
+        (numpy array) -> None
+
+        Adds the cells of an array, e.g., a window of the raster.
+        '''
+        import numpy as np
+        array = np.asarray(array).ravel()
+        keep = np.ones(array.shape, dtype=bool)
+        if self.nodata is not None:
+            keep &= array != self.nodata
+        if self.dropZero:
+            keep &= array != 0
+        if array.dtype.kind == "f":
+            keep &= ~np.isnan(array)
+            self._integer = False
+        array = array[keep]
+        if array.size == 0:
+            return
+        if self._integer:
+            self.histogram.Add(array)
+        values = array.astype(np.float64)
+        mean = values.mean()
+        self._Merge(values.size, mean, ((values - mean)**2).sum())
+        low, high = values.min(), values.max()
+        self.minimum = low if self.minimum is None else min(self.minimum, low)
+        self.maximum = high if self.maximum is None else max(self.maximum, high)
+
+    def AddCounts(self, values, counts):
+        '''
+        (numpy array, numpy array) -> None
+
+        Adds integer values that were already tallied, e.g., from a raster
+            attribute table (see ReadRAT), as if their cells had been read.
+        '''
+        import numpy as np
+        values = np.asarray(values, dtype=np.int64)
+        counts = np.asarray(counts, dtype=np.int64)
+        keep = counts > 0
+        if self.nodata is not None:
+            keep &= values != self.nodata
+        if self.dropZero:
+            keep &= values != 0
+        values, counts = values[keep], counts[keep]
+        if len(values) == 0:
+            return
+        self.histogram.AddCounts(values, counts)
+        n = counts.sum()
+        mean = (values*counts).sum()/float(n)
+        self._Merge(n, mean, (counts*(values - mean)**2).sum())
+        low, high = float(values.min()), float(values.max())
+        self.minimum = low if self.minimum is None else min(self.minimum, low)
+        self.maximum = high if self.maximum is None else max(self.maximum, high)
+
+    def _Merge(self, n, mean, m2):
+        '''
+        (int, float, float) -> None
+
+        Merges the count, mean, and sum of squared deviations of a set of cells into
+            the running ones.
+        '''
+        self.count, self.mean, self.m2 = _Moments((self.count, self.mean, self.m2),
+                                                  (n, mean, m2))
+
+    def Result(self, percentiles=(), dropMax=False):
+        '''
+        ([list], [boolean]) -> dictionary
+
+        Returns the "count", "mean", "standard_deviation" (of the population, as
+            ArcGIS reports it), "coefficient_of_variation" (in percent), and "range"
+            (a (min, max) tuple) of the cells added so far, and a "<p>th" entry with
+            the value at each percentile p.  A percentile is the lowest value whose
+            cumulative count reaches p percent of the cells, as in misc.RATStats.
+            Percentiles and dropMax, which leaves out the cells with the highest
+            value, need integer cells.
+
+        Arguments:
+        percentiles -- A list of percentiles to find, e.g., [25, 50, 75].
+        dropMax -- Whether to leave out the highest value.
+        '''
+        import numpy as np
+        if (dropMax or len(percentiles) > 0) and not self._integer:
+            raise ValueError("percentiles and dropMax need an integer raster")
+        values, counts = self.histogram.Counts()
+        count, mean, m2 = self.count, self.mean, self.m2
+        minimum, maximum = self.minimum, self.maximum
+        if dropMax and len(values) > 0:
+            count, mean, m2 = _Moments((count, mean, m2),
+                                       (int(counts[-1]), float(values[-1]), 0.0), -1)
+            values, counts = values[:-1], counts[:-1]
+            if len(values) > 0:
+                maximum = float(values[-1])
+
+        results = {"count": int(count)}
+        if count == 0:
+            results.update({"mean": np.nan, "standard_deviation": np.nan,
+                            "coefficient_of_variation": np.nan,
+                            "range": (np.nan, np.nan)})
+        else:
+            std = np.sqrt(max(m2, 0.0)/count)
+            results.update({"mean": mean, "standard_deviation": std,
+                            "coefficient_of_variation": 100*std/mean if mean
+                                                        else np.nan,
+                            "range": (minimum, maximum)})
+        cumulative = np.cumsum(counts)
+        for percentile in percentiles:
+            if len(values) == 0:
+                results[str(percentile) + "th"] = np.nan
+                continue
+            position = np.searchsorted(cumulative, cumulative[-1]*percentile/100.0)
+            results[str(percentile) + "th"] = values[min(position, len(values) - 1)]
+        return results
+
+
+def _Moments(a, b, sign=1):
+    '''
+    (tuple, tuple, [int]) -> tuple
+
+    Returns the (count, mean, sum of squared deviations) of the union of two sets of
+        cells from theirs, or, with sign -1, of the cells in a that aren't in b.
+    '''
+    n1, mean1, m21 = a
+    n2, mean2, m22 = b
+    if sign < 0:
+        n = n1 - n2
+        if n <= 0:
+            return 0, 0.0, 0.0
+        mean = (mean1*n1 - mean2*n2)/n
+        return n, mean, m21 - m22 - (mean2 - mean)**2*n*n2/n1
+    n = n1 + n2
+    if n == 0:
+        return 0, 0.0, 0.0
+    delta = mean2 - mean1
+    return n, mean1 + delta*n2/n, m21 + m22 + delta**2*n1*n2/n
+
+
+def WriteAuxXML(raster, values, counts):
+    '''
+    (string, numpy array, numpy array) -> string
+
+    Writes a raster attribute table with "Value" and "Count" fields, plus band
+        statistics, into the raster's GDAL .aux.xml sidecar.  Anything else already
+        in the sidecar is kept, but an existing table or statistics for band 1 are
+        replaced.  Counts are written as reals since CONUS counts can pass 2**31.
+
+    Returns the path to the sidecar.
+
+    Arguments:
+    raster -- Path to the raster the table describes.
+    values -- The distinct values of the raster, e.g., from Histogram.Counts.
+    counts -- The number of cells with each value.
+
+    Example:
+    >>> WriteAuxXML("C:/Richness/birds_Richness.tif", [0, 1, 2], [9000, 80, 3])
+    'C:/Richness/birds_Richness.tif.aux.xml'
+    '''
+    import os
+    import xml.etree.ElementTree as ET
+    aux = raster + ".aux.xml"
+    if os.path.exists(aux):
+        root = ET.parse(aux).getroot()
+    else:
+        root = ET.Element("PAMDataset")
+    band = root.find("PAMRasterBand[@band='1']")
+    if band is None:
+        band = ET.SubElement(root, "PAMRasterBand", band="1")
+    for old in band.findall("GDALRasterAttributeTable"):
+        band.remove(old)
+
+    # Band statistics
+    if len(values) > 0:
+        metadata = band.find("Metadata")
+        if metadata is None:
+            metadata = ET.SubElement(band, "Metadata")
+        for mdi in metadata.findall("MDI"):
+            if mdi.get("key", "").startswith("STATISTICS_"):
+                metadata.remove(mdi)
+        for key, value in Statistics(values, counts).items():
+            ET.SubElement(metadata, "MDI", key=key).text = repr(float(value))
+
+    # The table; types are 0 integer and 1 real, usages 5 min-max and 1 pixel count
+    table = ET.SubElement(band, "GDALRasterAttributeTable", tableType="thematic")
+    for index, (name, ftype, usage) in enumerate([("Value", "0", "5"),
+                                                  ("Count", "1", "1")]):
+        field = ET.SubElement(table, "FieldDefn", index=str(index))
+        ET.SubElement(field, "Name").text = name
+        ET.SubElement(field, "Type").text = ftype
+        ET.SubElement(field, "Usage").text = usage
+    for index, (value, count) in enumerate(zip(values, counts)):
+        row = ET.SubElement(table, "Row", index=str(index))
+        ET.SubElement(row, "F").text = str(int(value))
+        ET.SubElement(row, "F").text = str(int(count))
+    ET.ElementTree(root).write(aux)
+    return aux
+
+
+def WriteTable(path, values, counts):
+    '''
+    (string, numpy array, numpy array) -> string
+
+    Writes value counts as a table with "VALUE" and "COUNT" columns, as Parquet if
+        the path ends in ".parquet" and as csv otherwise.  Returns the path.
+
+    Arguments:
+    path -- Path of the table to write.
+    values -- The distinct values of the raster.
+    counts -- The number of cells with each value.
+    '''
+    import pandas as pd
+    table = pd.DataFrame({"VALUE": values, "COUNT": counts})
+    if path.endswith(".parquet"):
+        table.to_parquet(path, index=False)
+    else:
+        table.to_csv(path, index=False)
+    return path
+
+
+def WriteRAT(raster, values, counts):
+    '''
+    (string, numpy array, numpy array) -> string, string
+
+    Writes value counts as both an .aux.xml raster attribute table and a csv next to
+        the raster ("<raster>.vat.csv").  Returns both paths.
+
+    Arguments:
+    raster -- Path to the raster the counts describe.
+    values -- The distinct values of the raster.
+    counts -- The number of cells with each value.
+    '''
+    return (WriteAuxXML(raster, values, counts),
+            WriteTable(raster + ".vat.csv", values, counts))
+
+
+def ReadRAT(raster, compute=True, tileSize=4096):
+    '''
+    (string, [boolean], [int]) -> numpy array, numpy array
+
+    Returns the values and counts of a raster's attribute table as integer arrays in
+        order of value.  The table is read in bulk from the first sidecar found: the
+        ".vat.dbf" ArcGIS writes, the GDAL ".aux.xml", or the ".vat.csv" written by
+        WriteRAT.  Without one, the counts are computed by reading the raster in
+        windows (see Histogram), unless compute is False, in which case a ValueError
+        is raised.  No arcpy search cursor is used.
+
+    Arguments:
+    raster -- Path to the raster.
+    compute -- Whether to count the raster's values when it has no table.
+    tileSize -- Width and height, in cells, of the windows the raster is read in
+        when counting.
+
+    Example:
+    >>> ReadRAT("C:/Richness/birds_Richness.tif")
+    (array([0, 1, 2]), array([9000, 80, 3]))
+    '''
+    import os, numpy as np
+    table = None
+    if os.path.exists(raster + ".vat.dbf"):
+        table = _ReadDBF(raster + ".vat.dbf", ["VALUE", "COUNT"])
+    if table is None and os.path.exists(raster + ".aux.xml"):
+        table = _ReadAuxXML(raster + ".aux.xml")
+    if table is None and os.path.exists(raster + ".vat.csv"):
+        import pandas as pd
+        csv = pd.read_csv(raster + ".vat.csv")
+        csv.columns = [c.upper() for c in csv.columns]
+        table = csv["VALUE"].values, csv["COUNT"].values
+    if table is None:
+        if not compute:
+            raise ValueError("{0} has no attribute table".format(raster))
+        from gapanalysis import raster as _raster
+        dataset = _raster.Open(raster)
+        histogram = Histogram(nodata=dataset.GetRasterBand(1).GetNoDataValue())
+        for window in _raster.TileWindows(dataset.RasterXSize, dataset.RasterYSize,
+                                          tileSize):
+            histogram.Add(_raster.ReadWindow(dataset, window))
+        return histogram.Counts()
+    values = np.rint(np.asarray(table[0], dtype=np.float64)).astype(np.int64)
+    counts = np.rint(np.asarray(table[1], dtype=np.float64)).astype(np.int64)
+    order = np.argsort(values, kind="stable")
+    return values[order], counts[order]
+
+
+def _ReadDBF(path, fields):
+    '''
+    (string, list) -> tuple of numpy arrays
+
+    Reads numeric fields of a dBASE table, such as an ArcGIS ".vat.dbf", as float
+        arrays, decoding all of the records at once through a NumPy structured dtype
+        laid out like the records.  Deleted records are left out.  Returns None if
+        the table lacks any of the fields.
+    '''
+    import struct, numpy as np
+    with open(path, "rb") as f:
+        data = f.read()
+    nrecords, headerLength, recordLength = struct.unpack("<IHH", data[4:12])
+    names, formats, offset = ["deleted"], ["S1"], 32
+    while offset < headerLength - 1 and data[offset:offset + 1] != b"\r":
+        name = data[offset:offset + 11].split(b"\x00")[0].decode("ascii").upper()
+        names.append(name)
+        formats.append("S{0}".format(data[offset + 16]))
+        offset += 32
+    if any(field.upper() not in names for field in fields):
+        return None
+    dtype = np.dtype({"names": names, "formats": formats})
+    if dtype.itemsize != recordLength:
+        raise ValueError("{0} isn't a dBASE table".format(path))
+    records = np.frombuffer(data, dtype=dtype, count=nrecords,
+                            offset=headerLength)
+    records = records[records["deleted"] != b"*"]
+    return tuple(np.char.strip(records[field.upper()]).astype(np.float64)
+                 for field in fields)
+
+
+def _ReadAuxXML(path):
+    '''
+    (string) -> numpy array, numpy array
+
+    Reads the value and count fields of the band 1 raster attribute table in a GDAL
+        ".aux.xml" sidecar, found by name or by usage (min-max and pixel count).
+        Returns None if the sidecar has no such table.
+    '''
+    import numpy as np
+    import xml.etree.ElementTree as ET
+    table = ET.parse(path).getroot().find(
+        "PAMRasterBand[@band='1']/GDALRasterAttributeTable")
+    if table is None:
+        return None
+    value, count = None, None
+    for field in table.findall("FieldDefn"):
+        index = int(field.get("index"))
+        name = (field.findtext("Name") or "").upper()
+        usage = field.findtext("Usage")
+        if name == "VALUE" or (value is None and usage == "5"):
+            value = index
+        if name == "COUNT" or (count is None and usage == "1"):
+            count = index
+    if value is None or count is None:
+        return None
+    rows = [[f.text for f in row.findall("F")] for row in table.findall("Row")]
+    if not rows:
+        return np.array([]), np.array([])
+    cells = np.array(rows, dtype=object)
+    return cells[:, value].astype(np.float64), cells[:, count].astype(np.float64)
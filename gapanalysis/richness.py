@@ -1,5 +1,7 @@
 def MapRichness(spp, groupName, outLoc, modelDir, season, intervalSize, 
-                CONUSExtent, weight="None", weights_df=None):    
+                CONUSExtent, weight="None", weights_df=None, engine="arcpy",
+                tileSize=4096, workers=1, indexDir=None, resume=True, 
+                catalog=None, scale=None, accumulator="float64", checkpoint=True):    
     '''
     (list, str, str, str, str, int, str) -> str, str
 
@@ -28,6 +30,8 @@ def MapRichness(spp, groupName, outLoc, modelDir, season, intervalSize,
     intervalSize -- This number specifies how often to save the running tally as grids
         are added to it one-by-one.  For example, selecting 20 will mean that the tally 
         will be saved every time the number of maps summed is a multiple of 20.
+        The numpy engine writes intermediates on a background thread, so they don't
+        hold up summing.
     CONUSExtent -- A raster with a national/CONUS extent, and all cells have value of 0 except 
         for a 3x3 cell square in the top left corner that has values of 1.  The spatial reference
         should be NAD_1983_Albers and cell size 30x30 m.  Also used as a snap raster.
@@ -39,6 +43,52 @@ def MapRichness(spp, groupName, outLoc, modelDir, season, intervalSize,
         1/proportion of species (from the list you provided, which is important 
         to note) with a pixel count below the species' pixel count. The area 
         option will use 1/species pixel count. 
+    engine -- How to sum the rasters.  "arcpy" (the default) adds the maps one at a 
+        time with map algebra.  "numpy" reads the maps with GDAL in aligned windows of 
+        the CONUS grid and sums each window in memory, so each cell is touched once
+        for all species.  The numpy engine writes the same richness raster, table, and
+        intermediates, and returns the path to the richness raster instead of a 
+        raster object.  Its RATs are counted as the windows are written and saved as
+        .aux.xml and .vat.csv sidecars (see rat.WriteRAT) rather than built with
+        arcpy.  The species maps can be CONUS extent maps or range-extent maps
+        snapped to the CONUSExtent grid, which are read in place as 
+        raster.VirtualExtent with zeros outside the range, so no CONUS extent copy
+        of them has to be made.  Counter cells still count every species, and the
+        "area" and "percentile" weights only leave out counter cells for maps that
+        have them.  The same goes for UpdateRichness and MapRichnessGroups.
+    tileSize -- Width and height, in cells, of the windows used by the numpy engine.
+    workers -- Number of processes the numpy engine uses to sum windows in parallel. 
+        The default of 1 sums them serially.  On Windows, scripts that use more than
+        one worker must guard their code with "if __name__ == '__main__':".
+    indexDir -- Optionally, a directory for footprint indexes of the species maps 
+        (see raster.FootprintIndex).  With the numpy engine, each map's footprint is
+        computed once and saved there, and windows where a species has no habitat 
+        are skipped rather than read.  Most maps cover a small part of CONUS, so
+        this cuts the reading and arithmetic of later runs by a lot, but the first 
+        run has to scan every map once to build the index.
+    resume -- With the numpy engine and checkpoint=True, if True (the default), a 
+        rerun with the same groupName and outLoc that finds a checkpoint with a 
+        matching manifest reuses the finished windows instead of summing them again.
+    catalog -- Path to the pixel count catalog used for "percentile" and "area" 
+        weights (see data.PixelCounts).  Defaults to "PixelCounts.csv" in outLoc, so 
+        runs that share an outLoc only read the attribute table of a map once.
+    scale -- With the numpy engine, the factor weighted tallies are multiplied by
+        before they're written as integers.  Defaults to 10000 for "percentile" and
+        "area" weights (rounded) and 1 for "custom" weights (truncated), like the 
+        arcpy engine.  The numpy engine keeps the weighted tally unquantized, with 
+        Kahan compensated summation, and quantizes it once per write, choosing the 
+        smallest integer type that can hold the largest possible tally.
+    accumulator -- With the numpy engine, the float type of the weighted tally, 
+        "float64" or "float32".  Kahan summation keeps float32 accurate across 
+        thousands of maps at half the memory.
+    checkpoint -- With the numpy engine, whether to checkpoint each finished window
+        to a "Richness_checkpoint" directory in the output directory, next to a 
+        manifest of the species, weights, and settings.  Only the window's final 
+        tally is kept, as a .npy file, with the value counts of its intermediates;
+        the intermediates themselves are already on disk.  Checkpoints are written
+        by the background writer after the window's rasters, so they don't slow 
+        summing, and are deleted once the richness raster is written.  Pass False
+        to skip them, e.g., for runs that are quick to redo or short on disk.
 
     Example:
     >>> MapRichness(spp=['mOLDEh_CONUS_01A_2016v1_int8_1bit.tif',
@@ -56,16 +106,19 @@ def MapRichness(spp, groupName, outLoc, modelDir, season, intervalSize,
     C:\GIS_Data\Richness\MyRandomSpecies.csv
     '''    
     
-    import os, datetime, arcpy, pandas as pd
-    from scipy import stats
-    arcpy.CheckOutExtension('SPATIAL')
-    arcpy.ResetEnvironments()
-    arcpy.env.overwriteOutput=True
-    arcpy.env.pyramid = 'NONE'
-    arcpy.env.snapRaster = CONUSExtent
-    arcpy.env.rasterStatistics = "STATISTICS"
-    arcpy.env.cellSize = "MINOF"
-    arcpy.env.extent = CONUSExtent
+    import os, datetime, pandas as pd
+    if engine not in ("arcpy", "numpy"):
+        raise ValueError('engine must be "arcpy" or "numpy", not {0}'.format(engine))
+    if engine == "arcpy":
+        import arcpy
+        arcpy.CheckOutExtension('SPATIAL')
+        arcpy.ResetEnvironments()
+        arcpy.env.overwriteOutput=True
+        arcpy.env.pyramid = 'NONE'
+        arcpy.env.snapRaster = CONUSExtent
+        arcpy.env.rasterStatistics = "STATISTICS"
+        arcpy.env.cellSize = "MINOF"
+        arcpy.env.extent = CONUSExtent
     starttime = datetime.datetime.now()      
     
     # Maximum number of species to process at once
@@ -78,7 +131,8 @@ def MapRichness(spp, groupName, outLoc, modelDir, season, intervalSize,
     ############################################# create directories for the output
     ###############################################################################
     outDir = os.path.join(outLoc, groupName)   
-    arcpy.env.workspace = outDir
+    if engine == "arcpy":
+        arcpy.env.workspace = outDir
     intDir = os.path.join(outDir, 'Richness_intermediates')
     for x in [intDir, outDir]:
         if not os.path.exists(x):
@@ -102,18 +156,12 @@ def MapRichness(spp, groupName, outLoc, modelDir, season, intervalSize,
     
     if weight == "percentile" or weight == "area":
         # Record habitat area per species in the table
-        for sp in spp:
-            habmap = arcpy.Raster(modelDir + sp)
-            rows = arcpy.SearchCursor(habmap)
-            for row in rows:
-                if row.getValue("VALUE") == 1:
-                    count = row.getValue("COUNT")
-            weightsDF.loc[sp, "cnt"] = count
-        if weight == "percentile":
-            weightsDF["weight"] = 100.*(stats.rankdata(weightsDF.cnt, method="average")/len(weightsDF.cnt))
-        if weight == "area":
-            weightsDF["weight"] = [(c-9)*1. for c in weightsDF.cnt]
-        weightsDF["weighted_value"] = 1./(weightsDF.weight)
+        if catalog is None:
+            catalog = os.path.join(outLoc, "PixelCounts.csv")
+        counts = _PixelCounts(spp, modelDir, catalog)
+        counters = _CounterCells([modelDir + sp for sp in spp], CONUSExtent, catalog,
+                                 CONUSExtent if engine == "numpy" else None)
+        weightsDF = _Weights(counts, weight, counters)
         weightsDF.to_csv(outTable)
     
     if weight == "custom":
@@ -131,6 +179,9 @@ def MapRichness(spp, groupName, outLoc, modelDir, season, intervalSize,
             raise ValueError("The custom weights must be a pandas DataFrame.")
         if weightsDF.empty:
             raise ValueError("The custom weights DataFrame is empty.")
+        # Record the weight of each map so the run can be updated later
+        pd.DataFrame({"weight": [weightsDF.loc[sp[:6], "weight"] for sp in spp]},
+                     index=spp).to_csv(outTable)
         
     if weight == "None":
         spTable = open(outTable, "a")
@@ -153,6 +204,32 @@ def MapRichness(spp, groupName, outLoc, modelDir, season, intervalSize,
     __Log('\nThe species that will be used for analysis:')
     __Log(str(spp) + '\n')
     
+    ############################ Or sum windows of the rasters with NumPy, if chosen
+    ###############################################################################
+    if engine == "numpy":
+        richness_file_name = outDir + "/{0}_Richness.tif".format(groupName)
+        values = []
+        for sp in spp:
+            if weight == "None":
+                values.append(1)
+            if weight == "custom":
+                values.append(weightsDF.loc[sp[:6], "weight"])
+            if weight == "percentile" or weight == "area":
+                values.append(1./weightsDF.loc[sp, "weight"])
+        __Log("Summing in {0}x{0} windows".format(tileSize))
+        _SumNumPy(paths=[modelDir + sp for sp in spp], values=values,
+                  weight=weight, CONUSExtent=CONUSExtent, 
+                  intDir=intDir, interval=interval, 
+                  tileSize=tileSize, outFile=richness_file_name,
+                  Log=__Log, workers=workers, indexDir=indexDir,
+                  checkDir=(os.path.join(outDir, "Richness_checkpoint") 
+                            if checkpoint else None),
+                  resume=resume, scale=scale, accumulator=accumulator)
+        __Log('Richness raster and RAT saved to {0}'.format(richness_file_name))
+        runtime = datetime.datetime.now() - starttime
+        __Log("Total runtime was: " + str(runtime))
+        return richness_file_name, outTable
+    
     #################################### Sum rasters, saving the tally periodically
     ###############################################################################    
     tally = arcpy.Raster(CONUSExtent)
@@ -231,4 +308,1155 @@ def MapRichness(spp, groupName, outLoc, modelDir, season, intervalSize,
     runtime = datetime.datetime.now() - starttime
     __Log("Total runtime was: " + str(runtime))
 
-    return tally, outTable
\ No newline at end of file
+    return tally, outTable
+
+
+def UpdateRichness(existing, modelDir, season, add=(), remove=(), weight="None",
+                   weights_df=None, table=None, outFile=None, tileSize=4096, 
+                   workers=1, indexDir=None, catalog=None, scale=None, 
+                   CONUSExtent=None):
+    '''
+    (str, str, str, [list], [list], [str], [DataFrame], [str], [str], [int], [int],
+     [str], [str], [number], [str]) -> str, str
+
+    Adds species to and/or removes species from a richness raster made by MapRichness
+        without summing the other species again.  The species table of the earlier 
+        run says which maps were summed and with what values; the function works out
+        each species' new value and reads only the maps whose value changed.  For the 
+        "None", "area", and "custom" weights, those are just the added and removed 
+        species.  Percentile weights are 100*rank/n, so adding or removing one species
+        changes the weight of nearly every other species; rather than re-adding 
+        almost all of them with the difference, a "percentile" update sums every 
+        species again with the numpy engine of MapRichness, which needs the 
+        CONUSExtent.  The updated table replaces the old one.
+        
+        Values are exact for the "None" weight and for integer custom weights.  The 
+        "percentile" and "area" rasters store rounded values, so each update can 
+        shift a cell by one unit (1/scale) compared with a fresh MapRichness run.
+        
+    Returns the path to the updated richness raster and the path to its species 
+        table.
+
+    Arguments:
+    existing -- Path to a richness raster from MapRichness (e.g., 
+        "C:/GIS_Data/Richness/raptors/raptors_Richness.tif").
+    modelDir -- The directory holding the "Summer", "Winter", and "Any" habitat map
+        directories, as passed to MapRichness.
+    season -- The season of the existing raster; "Summer", "Winter", or "Any".
+    add -- A list of habitat map file names to add.
+    remove -- A list of habitat map file names to remove.
+    weight -- The weighting method of the existing raster.  See MapRichness.
+    weights_df -- For "custom" weights, a DataFrame with "strUC" and "weight" columns
+        that covers the added species.  Not needed when only removing species.
+    table -- Path to the existing raster's species table.  Defaults to the table 
+        MapRichness wrote next to the raster.
+    outFile -- Path for the updated raster.  Defaults to replacing existing.
+    tileSize -- Width and height of the windows that are read, in cells.
+    workers -- Number of processes to update windows with.
+    indexDir -- Optionally, a footprint index directory.  See MapRichness.
+    catalog -- The pixel count catalog.  Defaults to the one MapRichness uses.
+    scale -- The scale the existing raster was written with.  See MapRichness.
+    CONUSExtent -- The CONUS extent raster of the existing run, needed to sum the 
+        maps again for "percentile" weights.  See MapRichness.  For the other 
+        weights it's optional, but without it the counter cells aren't updated for
+        range-extent maps and CONUS extent maps are taken to carry 9 of them.
+
+    Example:
+    >>> UpdateRichness(existing="C:/GIS_Data/Richness/raptors/raptors_Richness.tif",
+                       modelDir="C:/Data/Model/Output/", season="Summer",
+                       add=["bAMKEx_CONUS_01A_2001v1.tif"], weight="area")
+    C:/GIS_Data/Richness/raptors/raptors_Richness.tif, 
+    C:/GIS_Data/Richness/raptors/raptors.csv
+    '''
+    import os, datetime, pandas as pd
+    from gapanalysis import rat
+    starttime = datetime.datetime.now()
+    outDir = os.path.dirname(existing)
+    groupName = os.path.basename(existing).replace("_Richness.tif", "")
+    if table is None:
+        table = os.path.join(outDir, groupName + ".csv")
+    if outFile is None:
+        outFile = existing
+    outTable = table if outFile == existing else os.path.splitext(outFile)[0] + ".csv"
+    modelDir = modelDir + season + "/"
+    
+    ######################################## Function to write data to the log file
+    ###############################################################################
+    log = outDir + "/Log_{0}.txt".format(groupName)
+    def __Log(content):
+        print(content)
+        with open(log, 'a') as logDoc:
+            logDoc.write(content + '\n')
+    
+    ################################### Work out the old and new value of each map
+    ###############################################################################
+    with open(table) as f:
+        header = f.readline()
+    if header.startswith(","):
+        # The weights are read back exactly, so unchanged maps have no delta
+        oldDF = pd.read_csv(table, index_col=0, float_precision="round_trip")
+    else:
+        oldDF = pd.read_csv(table, header=None, index_col=0, usecols=[0, 1], 
+                            names=["sp", "weight"])
+    # Tables of unweighted runs are appended to, so a map may be listed twice
+    oldDF = oldDF[~oldDF.index.duplicated(keep="last")]
+    if weight == "percentile" or weight == "area":
+        old = oldDF["weighted_value"]
+    elif weight == "custom":
+        old = oldDF["weight"]
+    else:
+        old = pd.Series(1., index=oldDF.index)
+    
+    missing = [sp for sp in remove if sp not in old.index]
+    if missing:
+        raise ValueError("Can't remove species that aren't in {0}: {1}".format(
+                         table, missing))
+    spp = [sp for sp in old.index if sp not in remove] 
+    spp = spp + [sp for sp in add if sp not in spp]
+    
+    if weight == "percentile" or weight == "area":
+        if catalog is None:
+            catalog = os.path.join(os.path.dirname(outDir), "PixelCounts.csv")
+        counts = _PixelCounts(spp, modelDir, catalog)
+        counters = _CounterCells([modelDir + sp for sp in spp], CONUSExtent, catalog,
+                                 existing)
+        newDF = _Weights(counts, weight, counters)
+        new = newDF["weighted_value"]
+    elif weight == "custom":
+        if weights_df is None and any(sp not in old.index for sp in spp):
+            raise ValueError('weights_df is needed for the "custom" weights of added '
+                             'species')
+        customDF = weights_df.set_index("strUC") if weights_df is not None else None
+        newWeights = [old[sp] if sp in old.index else customDF.loc[sp[:6], "weight"]
+                      for sp in spp]
+        newDF = pd.DataFrame({"weight": newWeights}, index=spp, dtype=float)
+        new = newDF["weight"]
+    else:
+        newDF = None
+        new = pd.Series(1., index=spp)
+    
+    # Only maps with a new value need reading
+    deltas = new.reindex(new.index.union(old.index), fill_value=0.) - \
+             old.reindex(new.index.union(old.index), fill_value=0.)
+    deltas = deltas[deltas != 0]
+    
+    __Log("\n" + ("#"*67))
+    __Log("Updating richness")
+    __Log("#"*67)
+    __Log(starttime.strftime("%c"))
+    __Log("Updating {0} to {1}".format(existing, outFile))
+    __Log("Adding: " + str(list(add)))
+    __Log("Removing: " + str(list(remove)))
+    tmpFile = os.path.splitext(outFile)[0] + "_updating.tif"
+    
+    ##################### Or sum all maps again, since percentile weights all change
+    ###############################################################################
+    if weight == "percentile":
+        if CONUSExtent is None:
+            raise ValueError('CONUSExtent is needed to update "percentile" richness')
+        __Log("Percentile weights change with every species' rank, so summing all "
+              "{0} maps again".format(len(spp)))
+        _SumNumPy(paths=[modelDir + sp for sp in spp], values=[new[sp] for sp in spp],
+                  weight=weight, CONUSExtent=CONUSExtent, intDir=outDir, 
+                  interval=len(spp) + 1, tileSize=tileSize, outFile=tmpFile, 
+                  Log=__Log, workers=workers, indexDir=indexDir, scale=scale)
+        histogram = rat.Histogram()
+        histogram.AddCounts(*rat.ReadRAT(tmpFile, compute=False))
+        for sidecar in [".aux.xml", ".vat.csv"]:
+            if os.path.exists(tmpFile + sidecar):
+                os.remove(tmpFile + sidecar)
+    
+    ############################################# Add the changes window by window
+    ###############################################################################
+    else:
+        __Log("Reading {0} maps whose values changed".format(len(deltas)))
+        histogram = _UpdateNumPy(existing, tmpFile, modelDir, deltas, new, weight,
+                                 tileSize, workers, indexDir, scale, CONUSExtent, 
+                                 __Log)
+    
+    ########################################### Replace the old raster and table
+    ###############################################################################
+    for sidecar in [".aux.xml", ".vat.dbf", ".vat.cpg", ".vat.csv", ".ovr"]:
+        if os.path.exists(outFile + sidecar):
+            os.remove(outFile + sidecar)
+    os.replace(tmpFile, outFile)
+    rat.WriteRAT(outFile, *histogram.Counts())
+    if newDF is None:
+        with open(outTable, "w") as spTable:
+            for sp in spp:
+                spTable.write(str(sp) + ", {0}".format(str(1)) + ",\n")
+    else:
+        newDF.to_csv(outTable)
+    
+    __Log("Total runtime was: " + str(datetime.datetime.now() - starttime))
+    return outFile, outTable
+
+
+def MapRichnessGroups(groups, outLoc, modelDir, season, CONUSExtent, weight="None",
+                      weights_df=None, tileSize=4096, workers=1, indexDir=None,
+                      catalog=None, scale=None, accumulator="float64"):
+    '''
+    (dictionary, str, str, str, str, [str or dictionary], [DataFrame or dictionary],
+     [int], [int], [str], [str], [number or dictionary], [numpy dtype]) -> dictionary
+
+    Creates species richness rasters for several, usually overlapping, groups of
+        species in one pass over the habitat maps.  Each window of each map is read 
+        once and added to the tally of every group that includes the species, so
+        mapping many groups costs about as much reading as mapping their union once.
+        Uses the numpy engine of MapRichness; each group gets the same output 
+        directory, richness raster, and species table that MapRichness would write, 
+        but no intermediate rasters.  Progress is logged to "Log_RichnessGroups.txt"
+        in outLoc.
+
+    Returns a dictionary of (richness raster path, species table path) tuples keyed
+        by group name.
+
+    Arguments:
+    groups -- A dictionary of lists of habitat map file names keyed by group name 
+        (e.g., {"raptors": [...], "amphibians": [...]}).
+    outLoc -- The directory to put the group output directories in.
+    modelDir -- The directory that holds the "Summer", "Winter", and "Any" habitat
+        map directories.  See MapRichness.
+    season -- "Summer", "Winter", or "Any".
+    CONUSExtent -- The CONUS extent raster.  See MapRichness.
+    weight -- The weighting method, "None", "percentile", "area", or "custom", either
+        for all groups or as a dictionary keyed by group name.  Percentile weights
+        are ranked within each group, as MapRichness does.
+    weights_df -- For "custom" weights, a DataFrame with "strUC" and "weight" columns,
+        or a dictionary of them keyed by group name.
+    tileSize -- Width and height of the windows that are read, in cells.
+    workers -- Number of processes to sum windows with.
+    indexDir -- Optionally, a footprint index directory.  See MapRichness.
+    catalog -- The pixel count catalog.  Defaults to "PixelCounts.csv" in outLoc.
+    scale -- The factor weighted tallies are multiplied by before they're written
+        as integers, either for all groups or as a dictionary keyed by group name.
+        See MapRichness.  Each group's raster gets the smallest integer type that 
+        holds its tallies.
+    accumulator -- The float type of the weighted tallies, "float64" or "float32",
+        which are summed with Kahan compensation.  See MapRichness.
+
+    Example:
+    >>> MapRichnessGroups(groups={"raptors": ["bAMKEx_CONUS_01A_2001v1.tif", ...],
+                                  "owls": ["bBADOx_CONUS_01A_2001v1.tif", ...]},
+                          outLoc="C:/GIS_Data/Richness", 
+                          modelDir="C:/Data/Model/Output/", season="Summer", 
+                          CONUSExtent="C:/Data/conus_ext_cnt.tif", workers=16)
+    {'raptors': ('C:/GIS_Data/Richness/raptors/raptors_Richness.tif', 
+                 'C:/GIS_Data/Richness/raptors/raptors.csv'), ...}
+    '''
+    import os, datetime, pandas as pd
+    from gapanalysis import raster, rat
+    starttime = datetime.datetime.now()
+    modelDir = modelDir + season + "/"
+    if catalog is None:
+        catalog = os.path.join(outLoc, "PixelCounts.csv")
+    
+    ######################################## Function to write data to the log file
+    ###############################################################################
+    if not os.path.exists(outLoc):
+        os.makedirs(outLoc)
+    log = os.path.join(outLoc, "Log_RichnessGroups.txt")
+    def __Log(content):
+        print(content)
+        with open(log, 'a') as logDoc:
+            logDoc.write(content + '\n')
+    
+    __Log("\n" + ("#"*67))
+    __Log("The results from multi-group richness processing")
+    __Log("#"*67)
+    __Log(starttime.strftime("%c"))
+    __Log('Season of this calculation: ' + season)
+    
+    ################################## Weight each group's species and write tables
+    ###############################################################################
+    spp = []
+    for groupName in groups:
+        spp = spp + [sp for sp in groups[groupName] if sp not in spp]
+    extent = raster.Open(CONUSExtent)
+    okSpp = []
+    for sp in spp:
+        try:
+            raster.OpenInGrid(modelDir + sp, extent)
+            okSpp.append(sp)
+        except Exception as e:
+            __Log("ERROR -- {0}: {1}".format(sp, e))
+    
+    methods, memberships, outputs = {}, [[] for sp in okSpp], {}
+    scales, dtypes = {}, {}
+    for g, groupName in enumerate(groups):
+        method = weight[groupName] if isinstance(weight, dict) else weight
+        scales[g] = scale.get(groupName) if isinstance(scale, dict) else scale
+        groupSpp = [sp for sp in groups[groupName] if sp in okSpp]
+        outDir = os.path.join(outLoc, groupName)
+        if not os.path.exists(outDir):
+            os.makedirs(outDir)
+        outTable = os.path.join(outDir, groupName + '.csv')
+        if method == "percentile" or method == "area":
+            counters = _CounterCells([modelDir + sp for sp in groupSpp], CONUSExtent,
+                                     catalog, CONUSExtent)
+            weightsDF = _Weights(_PixelCounts(groupSpp, modelDir, catalog), method,
+                                 counters)
+            weightsDF.to_csv(outTable)
+            values = list(weightsDF["weighted_value"])
+        elif method == "custom":
+            customDF = weights_df[groupName] if isinstance(weights_df, dict) \
+                       else weights_df
+            customDF = customDF.set_index("strUC")
+            values = [float(customDF.loc[sp[:6], "weight"]) for sp in groupSpp]
+            pd.DataFrame({"weight": values}, index=groupSpp).to_csv(outTable)
+        elif method == "None":
+            values = [1]*len(groupSpp)
+            with open(outTable, "w") as spTable:
+                for sp in groupSpp:
+                    spTable.write(str(sp) + ", {0}".format(str(1)) + ",\n")
+        else:
+            raise ValueError("Unknown weighting method {0}".format(method))
+        for sp, value in zip(groupSpp, values):
+            memberships[okSpp.index(sp)].append((g, value))
+        methods[g] = method
+        dtypes[g] = _QuantizedType(values, method, scales[g])
+        outRaster = os.path.join(outDir, "{0}_Richness.tif".format(groupName))
+        outputs[groupName] = (outRaster, outTable)
+        __Log('{0}: {1} species, weighting method {2}, writing {3} values'.format(
+              groupName, len(groupSpp), method, dtypes[g]))
+    
+    ###################### Read each map once per window, adding it to its groups
+    ###############################################################################
+    paths = [modelDir + sp for sp in okSpp]
+    windows = raster.TileWindows(extent.RasterXSize, extent.RasterYSize, tileSize)
+    windowArgs = None
+    if indexDir is not None:
+        index = raster.FootprintIndex(paths, indexDir, workers=workers, 
+                                      template=CONUSExtent)
+        windowArgs = {w: ([raster.FootprintWindow(index[p], w) for p in paths],)
+                      for w in windows}
+    outs = {}
+    for g, groupName in enumerate(groups):
+        outs[g] = raster.CreateGeoTiff(outputs[groupName][0], extent, dtypes[g])
+    __Log("Summing {0} species into {1} groups in {2}x{2} windows".format(
+          len(okSpp), len(groups), tileSize))
+    results = raster.MapWindows(_SumGroupsWindow, windows, workers=workers,
+                                windowArgs=windowArgs,
+                                args=(CONUSExtent, paths, memberships, methods, 
+                                      scales, dtypes, accumulator))
+    histograms = {g: rat.Histogram() for g in outs}
+    for n, (window, tallies) in enumerate(results):
+        for g in tallies:
+            outs[g].GetRasterBand(1).WriteArray(tallies[g], window[0], window[1])
+            histograms[g].Add(tallies[g])
+        __Log("\tWindow {0} of {1}".format(n + 1, len(windows)))
+    outs = None
+    
+    for g, groupName in enumerate(groups):
+        rat.WriteRAT(outputs[groupName][0], *histograms[g].Counts())
+        __Log('Richness raster saved to {0}'.format(outputs[groupName][0]))
+    __Log("Total runtime was: " + str(datetime.datetime.now() - starttime))
+    return outputs
+
+
+def _SumGroupsWindow(window, CONUSExtent, paths, memberships, methods, scales=None,
+                     dtypes=None, accumulator="float64", parts=None):
+    '''
+    (tuple, str, list, list, dictionary, [dictionary], [dictionary], [numpy dtype],
+     [list]) -> dictionary
+
+    Sums one window for several groups at once.  memberships lists, for each map, 
+        the (group, value) pairs of the groups it belongs to, and methods, scales, 
+        and dtypes give each group's weighting method, scale, and output type.  Each
+        map is read once and added to all of its groups.  Weighted tallies are kept
+        in the accumulator type with Kahan compensation, as in _SumWindow.  Counter
+        cells count every species (see _MissingCounters).  Returns the quantized 
+        tallies keyed by group.
+    '''
+    import numpy as np
+    from gapanalysis import raster
+    grid = raster.Open(CONUSExtent)
+    extent = raster.ReadWindow(grid, window)
+    counters = extent != 0
+    counters = counters if counters.any() else None
+    scales = scales or {}
+    dtypes = dtypes or {}
+    tallies, compensations = {}, {}
+    for g, method in methods.items():
+        if method == "None":
+            tallies[g] = raster.PackedAdd([], np.packbits(extent != 0, axis=1))
+        else:
+            tallies[g] = extent.astype(accumulator)
+            compensations[g] = np.zeros_like(tallies[g])
+    for i, path in enumerate(paths):
+        part = window if parts is None else parts[i]
+        if (part is None and counters is None) or not memberships[i]:
+            continue
+        habmap = raster.OpenInGrid(path, grid)
+        missing = _MissingCounters(habmap, window, counters)
+        if missing is not None:
+            for g, value in memberships[i]:
+                if methods[g] == "None":
+                    raster.PackedAdd(tallies[g], np.packbits(missing, axis=1))
+                else:
+                    _KahanAdd(tallies[g], compensations[g], value, missing)
+        part = raster.DataWindow(habmap, part)
+        if part is None:
+            continue
+        mask = raster.ReadWindow(habmap, part) != 0
+        x, y = part[0] - window[0], part[1] - window[1]
+        packed = None
+        for g, value in memberships[i]:
+            if methods[g] == "None":
+                if packed is None:
+                    packed = np.packbits(np.pad(mask, ((0, 0), (x % 8, 0))), axis=1)
+                raster.PackedAdd(tallies[g], packed, rows=slice(y, y + part[3]),
+                                 cols=slice(x//8, x//8 + packed.shape[1]))
+            else:
+                _KahanAdd(tallies[g][y:y + part[3], x:x + part[2]], 
+                          compensations[g][y:y + part[3], x:x + part[2]], value, 
+                          mask)
+    for g, method in methods.items():
+        if method == "None":
+            tallies[g] = raster.UnpackCounts(tallies[g], window[2])
+        else:
+            tallies[g] = _Quantize(tallies[g] - compensations[g], method, 
+                                   scales.get(g), dtypes.get(g, "int32"))
+    return tallies
+
+
+def MapRichnessSeasons(spp, groupName, outLoc, rawDir, CONUSExtent, weight="None",
+                       weights_df=None, seasons=("Summer", "Winter", "Any"), 
+                       tileSize=4096, workers=1, catalog=None, scale=None, 
+                       accumulator="float64"):
+    '''
+    (list, str, str, str, str, [str], [DataFrame], [list], [int], [int], [str],
+     [number], [numpy dtype]) -> dictionary
+
+    Creates Summer, Winter, and Any season species richness rasters in one pass over
+        the original GAP habitat maps, the range-extent maps with codes 1 (summer), 
+        2 (winter), and 3 (year-round).  Each window of a map is read once and the 
+        seasonal masks (1 or 3, 2 or 3, and any code) are derived on the fly, so the
+        binary CONUS-extent "Summer", "Winter", and "Any" copies that MapRichness
+        needs never have to be made.  The maps only need to share the CONUS cell size
+        and be snapped to its grid; windows outside a map's range aren't read.
+        
+        The results match MapRichness run on maps from Make01Seasonal: the counter 
+        cells of CONUSExtent are counted once for every species, as they would be if
+        each seasonal copy carried them, and weights are computed from the seasonal
+        pixel counts, which have no counter cells to leave out.  Each season is 
+        written like a MapRichness run named "{groupName}_{season}", without 
+        intermediate rasters.
+
+    Returns a dictionary of (richness raster path, species table path) tuples keyed
+        by season.
+
+    Arguments:
+    spp -- A list of habitat map file names in rawDir.
+    groupName -- The name used to identify the output directories and files.
+    outLoc -- The directory to put the output directories in.
+    rawDir -- The directory holding the original 1-3 coded habitat maps.
+    CONUSExtent -- The CONUS extent raster.  See MapRichness.
+    weight -- The weighting method.  See MapRichness.
+    weights_df -- For "custom" weights, a DataFrame with "strUC" and "weight" 
+        columns.  The weights apply to every season.
+    seasons -- The seasons to map.
+    tileSize -- Width and height of the windows that are read, in cells.
+    workers -- Number of processes to sum windows with.
+    catalog -- The pixel count catalog.  Defaults to "PixelCounts.csv" in outLoc.
+    scale -- The factor weighted tallies are multiplied by before they're written
+        as integers.  See MapRichness.  Each season's raster gets the smallest 
+        integer type that holds its tallies.
+    accumulator -- The float type of the weighted tallies, "float64" or "float32",
+        which are summed with Kahan compensation.  See MapRichness.
+
+    Example:
+    >>> MapRichnessSeasons(spp=["bAMROx_CONUS_HabMap_2001v1.tif", ...], 
+                           groupName="birds", outLoc="C:/GIS_Data/Richness", 
+                           rawDir="C:/Data/HabMaps/", 
+                           CONUSExtent="C:/Data/conus_ext_cnt.tif", workers=16)
+    {'Summer': ('C:/GIS_Data/Richness/birds_Summer/birds_Summer_Richness.tif',
+                'C:/GIS_Data/Richness/birds_Summer/birds_Summer.csv'), ...}
+    '''
+    import os, datetime, pandas as pd
+    from gapanalysis import raster, data, rat
+    starttime = datetime.datetime.now()
+    if catalog is None:
+        catalog = os.path.join(outLoc, "PixelCounts.csv")
+    
+    ######################################## Function to write data to the log file
+    ###############################################################################
+    outDirs = {season: os.path.join(outLoc, "{0}_{1}".format(groupName, season))
+               for season in seasons}
+    for outDir in outDirs.values():
+        if not os.path.exists(outDir):
+            os.makedirs(outDir)
+    logs = [os.path.join(outDirs[season], "Log_{0}_{1}.txt".format(groupName, season))
+            for season in seasons]
+    def __Log(content):
+        print(content)
+        for log in logs:
+            with open(log, 'a') as logDoc:
+                logDoc.write(content + '\n')
+    
+    __Log("\n" + ("#"*67))
+    __Log("The results from seasonal richness processing")
+    __Log("#"*67)
+    __Log(starttime.strftime("%c"))
+    __Log('\nProcessing {0} species as "{1}".\n'.format(len(spp), groupName).upper())
+    __Log('Seasons of this calculation: ' + str(list(seasons)))
+    __Log('Weighting method: ' + weight)
+    
+    ######################################### Place each map in the CONUS grid
+    ###############################################################################
+    extent = raster.Open(CONUSExtent)
+    okSpp, offsets = [], []
+    for sp in spp:
+        try:
+            offsets.append(raster.GridOffset(raster.Open(rawDir + sp), extent))
+            okSpp.append(sp)
+        except Exception as e:
+            __Log("ERROR -- {0}: {1}".format(sp, e))
+    
+    ################################## Weight each season's maps and write tables
+    ###############################################################################
+    values, outputs = {}, {}
+    if weight == "percentile" or weight == "area":
+        counts = data.PixelCounts([rawDir + sp for sp in okSpp], catalog)
+    if weight == "custom":
+        customDF = weights_df.set_index("strUC")
+    for season in seasons:
+        name = "{0}_{1}".format(groupName, season)
+        outTable = os.path.join(outDirs[season], name + ".csv")
+        if weight == "percentile" or weight == "area":
+            codes = [c for c in raster.SEASONS[season] if c in counts.columns]
+            seasonCounts = counts[codes].sum(axis=1)
+            seasonCounts.index = okSpp
+            weightsDF = _Weights(seasonCounts, weight)
+            weightsDF.to_csv(outTable)
+            values[season] = list(weightsDF["weighted_value"])
+        elif weight == "custom":
+            values[season] = [float(customDF.loc[sp[:6], "weight"]) for sp in okSpp]
+            pd.DataFrame({"weight": values[season]}, index=okSpp).to_csv(outTable)
+        elif weight == "None":
+            values[season] = [1]*len(okSpp)
+            with open(outTable, "w") as spTable:
+                for sp in okSpp:
+                    spTable.write(str(sp) + ", {0}".format(str(1)) + ",\n")
+        else:
+            raise ValueError("Unknown weighting method {0}".format(weight))
+        outputs[season] = (os.path.join(outDirs[season], name + "_Richness.tif"), 
+                           outTable)
+    
+    ################ Read each map once per window and add it to all of the seasons
+    ###############################################################################
+    dtypes = {season: _QuantizedType(values[season], weight, scale) 
+              for season in seasons}
+    for season in seasons:
+        __Log("{0}: writing {1} values".format(season, dtypes[season]))
+    outs = {season: raster.CreateGeoTiff(outputs[season][0], extent, dtypes[season])
+            for season in seasons}
+    windows = raster.TileWindows(extent.RasterXSize, extent.RasterYSize, tileSize)
+    __Log("Summing in {0}x{0} windows".format(tileSize))
+    results = raster.MapWindows(_SumSeasonsWindow, windows, workers=workers,
+                                args=(CONUSExtent, [rawDir + sp for sp in okSpp],
+                                      offsets, values, weight, scale, dtypes, 
+                                      accumulator))
+    histograms = {season: rat.Histogram() for season in seasons}
+    for n, (window, tallies) in enumerate(results):
+        for season in seasons:
+            outs[season].GetRasterBand(1).WriteArray(tallies[season], window[0], 
+                                                     window[1])
+            histograms[season].Add(tallies[season])
+        __Log("\tWindow {0} of {1}".format(n + 1, len(windows)))
+    outs = None
+    
+    for season in seasons:
+        rat.WriteRAT(outputs[season][0], *histograms[season].Counts())
+        __Log('Richness raster saved to {0}'.format(outputs[season][0]))
+    __Log("Total runtime was: " + str(datetime.datetime.now() - starttime))
+    return outputs
+
+
+def _SumSeasonsWindow(window, CONUSExtent, paths, offsets, values, weight, 
+                      scale=None, dtypes=None, accumulator="float64"):
+    '''
+    (tuple, str, list, list, dictionary, str, [number], [dictionary], 
+     [numpy dtype]) -> dictionary
+
+    Sums one window of range-extent, 1-3 coded habitat maps into a tally for each 
+        season in values, which holds each season's list of map values.  Each map is
+        read once.  Weighted tallies are kept in the accumulator type with Kahan 
+        compensation, as in _SumWindow, and quantized with the scale into each 
+        season's dtype.  Counter cells count every species, as the maps are 
+        range-extent and don't carry them.  Returns the quantized tallies keyed by
+        season.
+    '''
+    import numpy as np
+    from gapanalysis import raster
+    extent = raster.ReadWindow(raster.Open(CONUSExtent), window)
+    counters = extent != 0
+    counters = counters if counters.any() else None
+    dtypes = dtypes or {}
+    tallies, compensations = {}, {}
+    for season in values:
+        if weight == "None":
+            tallies[season] = raster.PackedAdd([], np.packbits(extent != 0, axis=1))
+        else:
+            tallies[season] = extent.astype(accumulator)
+            compensations[season] = np.zeros_like(tallies[season])
+    for i, path in enumerate(paths):
+        dataset = raster.Open(path)
+        part = raster.OverlapWindow(window, offsets[i], dataset.RasterXSize,
+                                    dataset.RasterYSize)
+        if part is None and counters is None:
+            continue
+        if part is not None:
+            codes = raster.ReadWindow(dataset, (part[0] - offsets[i][0], 
+                                                part[1] - offsets[i][1], part[2], 
+                                                part[3]))
+            x, y = part[0] - window[0], part[1] - window[1]
+        for season in values:
+            if counters is not None:
+                missing = counters.copy()
+                if part is not None:
+                    missing[y:y + part[3], x:x + part[2]] &= \
+                        ~raster.SeasonMask(codes, season)
+                if not missing.any():
+                    pass
+                elif weight == "None":
+                    raster.PackedAdd(tallies[season], np.packbits(missing, axis=1))
+                else:
+                    _KahanAdd(tallies[season], compensations[season], 
+                              values[season][i], missing)
+            if part is None:
+                continue
+            mask = raster.SeasonMask(codes, season)
+            if weight == "None":
+                packed = np.packbits(np.pad(mask, ((0, 0), (x % 8, 0))), axis=1)
+                raster.PackedAdd(tallies[season], packed, rows=slice(y, y + part[3]),
+                                 cols=slice(x//8, x//8 + packed.shape[1]))
+            else:
+                _KahanAdd(tallies[season][y:y + part[3], x:x + part[2]], 
+                          compensations[season][y:y + part[3], x:x + part[2]], 
+                          values[season][i], mask)
+    for season in values:
+        if weight == "None":
+            tallies[season] = raster.UnpackCounts(tallies[season], window[2])
+        else:
+            tallies[season] = _Quantize(tallies[season] - compensations[season], 
+                                        weight, scale, dtypes.get(season, "int32"))
+    return tallies
+
+
+def _PixelCounts(spp, modelDir, catalog):
+    '''
+    (list, str, str) -> pandas Series
+
+    Returns the number of cells with value 1 in each habitat map, indexed by map file
+        name, using the pixel count catalog (see data.PixelCounts).
+    '''
+    from gapanalysis import data
+    table = data.PixelCounts([modelDir + sp for sp in spp], catalog)
+    counts = table[1] if 1 in table.columns else table.iloc[:, 0]*0
+    counts.index = list(spp)
+    return counts
+
+
+def _Weights(counts, weight, counters=0):
+    '''
+    (pandas Series, str, [number or array]) -> pandas DataFrame
+
+    Builds the "percentile" or "area" weights table of MapRichness from a series of
+        habitat pixel counts indexed by map file name, in one vectorized pass.  The
+        counter cells in each map's count (see _CounterCells) aren't habitat, so 
+        they're taken off first.  A map with no habitat left gets a weighted value 
+        of 0 rather than an infinite or negative one.
+    '''
+    import numpy as np, pandas as pd
+    from scipy import stats
+    cnt = counts.to_numpy(dtype=float)
+    area = np.maximum(cnt - counters, 0.)
+    if weight == "percentile":
+        values = 100.*(stats.rankdata(area, method="average")/len(area))
+    if weight == "area":
+        values = area
+    weighted = np.zeros_like(values)
+    np.divide(1., values, out=weighted, where=values > 0)
+    return pd.DataFrame({"cnt": cnt, "weight": values, "weighted_value": weighted}, 
+                        index=counts.index)
+
+
+def _CounterCells(paths, CONUSExtent, catalog, template=None):
+    '''
+    (list, str, str, [str]) -> numpy array
+
+    Returns the number of counter cells in the pixel count of each map.  Maps with
+        the CONUS extent carry the counter cells of the CONUS extent raster, which 
+        are counted with the catalog (see data.PixelCounts), or taken to be the 9 of
+        the 3x3 square without a CONUSExtent.  Range-extent maps, read as 
+        raster.VirtualExtent in the template's grid, carry none; they're told apart
+        by the sizes kept in the catalog, so only the template is opened.  Without
+        a template, every map is taken to have the CONUS extent and the 9 counter 
+        cells the arcpy engine expects.
+    '''
+    import numpy as np
+    from gapanalysis import data, raster
+    if template is None:
+        return np.full(len(paths), 9)
+    grid = raster.Open(template)
+    table, sizes = data.PixelCounts(paths, catalog, sizes=True)
+    full = ((sizes.XSIZE.values == grid.RasterXSize) & 
+            (sizes.YSIZE.values == grid.RasterYSize))
+    counters = 9
+    if CONUSExtent is not None and full.any():
+        table = data.PixelCounts([CONUSExtent], catalog)
+        counters = int(table.drop(columns=0, errors="ignore").sum(axis=1).iloc[0])
+    return np.where(full, counters, 0)
+
+
+def _MissingCounters(dataset, window, counters):
+    '''
+    (gdal dataset or VirtualExtent, tuple, numpy array) -> numpy array or None
+
+    Returns the counter cells of a window, given by the counters mask, that a map
+        doesn't count, or None if there are none.  Counter cells should hold 1 plus 
+        the number of species, as with the arcpy engine and the VRTs of 
+        raster.WriteVirtualExtent.  Maps with the CONUS extent carry them, but a 
+        VirtualExtent reads 0 there, so the sums add its value back at these cells.
+    '''
+    import numpy as np
+    from gapanalysis import raster
+    if counters is None or not isinstance(dataset, raster.VirtualExtent):
+        return None
+    rows, cols = np.nonzero(counters)
+    y, x = rows.min(), cols.min()
+    ysize, xsize = rows.max() + 1 - y, cols.max() + 1 - x
+    missing = np.zeros_like(counters)
+    habmap = raster.ReadWindow(dataset, (window[0] + x, window[1] + y, xsize, ysize))
+    missing[y:y + ysize, x:x + xsize] = habmap == 0
+    missing &= counters
+    return missing if missing.any() else None
+
+
+def _UpdateNumPy(existing, tmpFile, modelDir, deltas, new, weight, tileSize, 
+                 workers, indexDir, scale, CONUSExtent, Log):
+    '''
+    (str, str, str, Series, Series, str, int, int, str, number, str, function) 
+     -> rat.Histogram
+
+    Writes the existing richness raster, with the maps whose value changed added in
+        with the change (see _UpdateWindow), to tmpFile window by window, and 
+        returns the value counts of the result.
+    '''
+    from gapanalysis import raster, rat
+    base = raster.Open(existing)
+    paths = [modelDir + sp for sp in deltas.index]
+    for path in paths:
+        raster.OpenInGrid(path, base)
+    windows = raster.TileWindows(base.RasterXSize, base.RasterYSize, tileSize)
+    windowArgs = None
+    if indexDir is not None:
+        index = raster.FootprintIndex(paths, indexDir, workers=workers, 
+                                      template=existing)
+        windowArgs = {w: ([raster.FootprintWindow(index[p], w) for p in paths],)
+                      for w in windows}
+    
+    dtype = _QuantizedType(list(new), weight, scale)
+    out = raster.CreateGeoTiff(tmpFile, base, dtype)
+    results = raster.MapWindows(_UpdateWindow, windows, workers=workers,
+                                windowArgs=windowArgs,
+                                args=(existing, paths, list(deltas), weight, scale,
+                                      dtype, CONUSExtent))
+    histogram = rat.Histogram()
+    for n, (window, tally) in enumerate(results):
+        out.GetRasterBand(1).WriteArray(tally, window[0], window[1])
+        histogram.Add(tally)
+        Log("\tWindow {0} of {1}".format(n + 1, len(windows)))
+    out = None
+    base = None
+    return histogram
+
+
+def _UpdateWindow(window, existing, paths, deltas, weight, scale=None, 
+                  dtype="int32", CONUSExtent=None, parts=None):
+    '''
+    (tuple, str, list, list, str, [number], [numpy dtype], [str], [list]) 
+     -> numpy array
+
+    Adds each map times its change in value to one window of an existing richness
+        raster and returns the window quantized like MapRichness does.  With the 
+        CONUSExtent, counter cells keep counting every species (see 
+        _MissingCounters).
+    '''
+    import numpy as np
+    from gapanalysis import raster
+    base = raster.Open(existing)
+    tally = raster.ReadWindow(base, window, np.float64)
+    if weight != "None":
+        tally = tally/_Scale(weight, scale)
+    counters = None
+    if CONUSExtent is not None:
+        counters = raster.ReadWindow(raster.Open(CONUSExtent), window) != 0
+        counters = counters if counters.any() else None
+    for i, (path, delta) in enumerate(zip(paths, deltas)):
+        dataset = raster.OpenInGrid(path, base)
+        missing = _MissingCounters(dataset, window, counters)
+        if missing is not None:
+            np.add(tally, delta, out=tally, where=missing)
+        part = raster.DataWindow(dataset, window if parts is None else parts[i])
+        if part is None:
+            continue
+        habmap = raster.ReadWindow(dataset, part)
+        x, y = part[0] - window[0], part[1] - window[1]
+        view = tally[y:y + part[3], x:x + part[2]]
+        np.add(view, delta, out=view, where=habmap != 0)
+    if weight == "None":
+        if (tally < 0).any():
+            raise ValueError("removing species made richness negative in window "
+                             "{0}; were they in the raster?".format(window))
+        return tally.astype(np.uint16)
+    return _Quantize(tally, weight, scale, dtype)
+
+
+def _Quantize(tally, weight, scale=None, dtype="int32"):
+    '''
+    (numpy array, str, [number], [numpy dtype]) -> numpy array
+
+    Converts a window of the running tally to the values written by MapRichness:
+        a copy for unweighted sums, multiplied by the scale and rounded for the
+        "percentile" and "area" weights, and multiplied by the scale and truncated
+        for "custom" weights.  See _Scale for the default scales.
+    '''
+    import numpy as np
+    scale = _Scale(weight, scale)
+    if weight == "percentile" or weight == "area":
+        return np.floor((tally*scale) + 0.5).astype(dtype)
+    if weight == "custom":
+        return np.trunc(tally*scale).astype(dtype)
+    return tally.copy()
+
+
+def _Scale(weight, scale=None):
+    '''
+    (str, [number]) -> number
+
+    Returns the scale factor weighted tallies are multiplied by before they're 
+        written as integers: the one passed, or else 10000 for "percentile" and 
+        "area" weights and 1 for "custom" weights, as the arcpy engine uses.
+    '''
+    if scale is not None:
+        return scale
+    if weight == "percentile" or weight == "area":
+        return 10000
+    return 1
+
+
+def _QuantizedType(values, weight, scale=None):
+    '''
+    (list, str, [number]) -> numpy dtype
+
+    Chooses the smallest integer dtype that holds any quantized tally of maps with
+        the given values, from the extremes where every map (and a counter cell of 
+        the CONUS extent) overlaps.  Unweighted tallies are always uint16.
+    '''
+    import numpy as np
+    if weight == "None":
+        return np.dtype("uint16")
+    scale = _Scale(weight, scale)
+    low = min(0., sum(v for v in values if v < 0))*scale
+    high = (1. + sum(v for v in values if v > 0))*scale
+    for dtype in ["uint8", "uint16", "int16", "uint32", "int32"]:
+        info = np.iinfo(dtype)
+        if low >= info.min and high + 1 <= info.max:
+            return np.dtype(dtype)
+    raise ValueError("Weighted tallies up to {0} don't fit in 32 bits; use a smaller"
+                     " scale".format(high))
+
+
+def _KahanAdd(total, compensation, value, mask):
+    '''
+    (numpy array, numpy array, number, numpy array) -> None
+
+    Adds value to total wherever mask is True, in place, with Kahan summation: the 
+        low-order bits lost by each addition are kept in compensation and fed back
+        into the next, so the error doesn't grow with the number of maps added.  The
+        compensated total is total - compensation.
+    '''
+    import numpy as np
+    y = value - compensation
+    t = total + y
+    np.subtract(t, total, out=compensation, where=mask)
+    np.subtract(compensation, y, out=compensation, where=mask)
+    np.copyto(total, t, where=mask)
+
+
+def _SumWindow(window, CONUSExtent, paths, values, weight, interval, scale=None,
+               dtype="int32", accumulator="float64", spillDir=None, parts=None):
+    '''
+    (tuple, str, list, list, str, int, [number], [numpy dtype], [numpy dtype], 
+     [str], [list]) -> numpy array, list
+
+    Sums one window of the CONUS extent raster and the species maps.  Returns the
+        quantized tally and a list of (counter, snapshot) tuples with the running 
+        tally after every interval'th species, numbered like the intermediate rasters
+        of MapRichness.  With a spillDir, each snapshot is saved there as a .npy file
+        as soon as it's taken and its path is returned in place of the array, so 
+        only one snapshot is ever held in memory and none are sent between 
+        processes; the caller deletes the files once it's read them.  If parts is 
+        given, it lists the part of the window to read for each species (see 
+        raster.FootprintWindow), and species with None are skipped.  Counter cells
+        count every species (see _MissingCounters).
+        Unweighted sums are kept bit-packed in a bit-sliced counter and only unpacked
+        for writing.  Weighted sums are kept unquantized in an accumulator array with
+        Kahan compensation and only quantized, with the scale and dtype, for writing.
+    '''
+    import os, numpy as np
+    from gapanalysis import raster
+    extent = raster.Open(CONUSExtent)
+    if weight == "None":
+        packed = raster.ReadPackedWindow(extent, window)
+        counters = np.unpackbits(packed, axis=1, count=window[2]).astype(bool)
+        planes = raster.PackedAdd([], packed)
+    else:
+        tally = raster.ReadWindow(extent, window, accumulator)
+        compensation = np.zeros_like(tally)
+        counters = tally != 0
+    counters = counters if counters.any() else None
+    snapshots = []
+    for i, (path, value) in enumerate(zip(paths, values)):
+        part = window if parts is None else parts[i]
+        if part is not None or counters is not None:
+            dataset = raster.OpenInGrid(path, extent)
+            missing = _MissingCounters(dataset, window, counters)
+            if missing is None:
+                pass
+            elif weight == "None":
+                raster.PackedAdd(planes, np.packbits(missing, axis=1))
+            else:
+                _KahanAdd(tally, compensation, value, missing)
+        if part is not None:
+            part = raster.DataWindow(dataset, part)
+        if part is not None:
+            x, y = part[0] - window[0], part[1] - window[1]
+            if weight == "None":
+                packed = raster.ReadPackedWindow(dataset, part, x % 8)
+                raster.PackedAdd(planes, packed, rows=slice(y, y + part[3]),
+                                 cols=slice(x//8, x//8 + packed.shape[1]))
+            else:
+                habmap = raster.ReadWindow(dataset, part)
+                # The maps are binary, so add the weight wherever there is habitat
+                _KahanAdd(tally[y:y + part[3], x:x + part[2]], 
+                          compensation[y:y + part[3], x:x + part[2]], value, 
+                          habmap != 0)
+        if (i + 1) % interval == 0:
+            if weight == "None":
+                snapshot = raster.UnpackCounts(planes, window[2])
+            else:
+                snapshot = _Quantize(tally - compensation, weight, scale, dtype)
+            if spillDir is not None:
+                spill = os.path.join(spillDir, "Window_{0}_{1}_{2}_{3}".format(
+                                     *window) + "_{0}.npy".format(i + 2))
+                np.save(spill, snapshot)
+                snapshot = spill
+            snapshots.append((i + 2, snapshot))
+            snapshot = None
+    if weight == "None":
+        return raster.UnpackCounts(planes, window[2]), snapshots
+    return _Quantize(tally - compensation, weight, scale, dtype), snapshots
+
+
+def _SumNumPy(paths, values, weight, CONUSExtent, intDir, interval, tileSize, 
+              outFile, Log, workers=1, indexDir=None, checkDir=None, resume=True,
+              scale=None, accumulator="float64"):
+    '''
+    (list, list, str, str, str, int, int, str, function, [int], [str], [str], 
+     [bool], [number], [numpy dtype]) -> list
+
+    The numpy engine of MapRichness.  Checks that each species map is readable and 
+        on the CONUS grid, then sums them window by window, on a pool of workers if
+        more than one is requested, and stitches the windows into the richness raster
+        and the intermediate rasters.  With an indexDir, the footprint index decides
+        which part of each window to read for each species.  With a checkDir, 
+        finished windows are checkpointed there, after their rasters are written, 
+        and if resume is True they're reused from an earlier run with the same 
+        manifest.  Rasters are written on a background thread so summing doesn't 
+        wait on compression.  Intermediate snapshots are spilled to disk by the 
+        workers and written one at a time, with each intermediate raster opened only
+        for its write, so memory stays bounded however many intermediates there are.
+        Value counts are tallied as windows go by to write each raster's RAT (see 
+        the rat module) without another scan.  Weighted tallies are quantized with 
+        the scale into the smallest integer type that holds them.  Returns the 
+        intermediate raster paths.
+    '''
+    import os, shutil, itertools, numpy as np
+    from gapanalysis import raster, rat
+    extent = raster.Open(CONUSExtent)
+    
+    # Drop maps that can't be summed, like the arcpy engine does
+    okPaths, okValues = [], []
+    for path, value in zip(paths, values):
+        try:
+            raster.OpenInGrid(path, extent)
+            okPaths.append(path)
+            okValues.append(value)
+        except Exception as e:
+            Log("ERROR -- {0}: {1}".format(path, e))
+    
+    dtype = _QuantizedType(okValues, weight, scale)
+    windows = raster.TileWindows(extent.RasterXSize, extent.RasterYSize, tileSize)
+    done = []
+    if checkDir is not None:
+        manifest = {"species": okPaths, "values": [float(v) for v in okValues],
+                    "weight": weight, "CONUSExtent": CONUSExtent, 
+                    "interval": interval, "tileSize": tileSize, 
+                    "scale": _Scale(weight, scale), "dtype": str(np.dtype(dtype)),
+                    "accumulator": str(np.dtype(accumulator))}
+        done = _OpenCheckpoint(checkDir, manifest, resume, Log)
+        windows = [w for w in windows if w not in done]
+    
+    Log("Writing {0} values".format(dtype))
+    out = raster.CreateGeoTiff(outFile, extent, dtype)
+    # Intermediates are created empty and then opened only while being written to.
+    # When resuming, they already hold the finished windows and are kept.
+    intermediates = {}
+    for i in range(len(okPaths)):
+        if (i + 1) % interval == 0:
+            tally_file_name = intDir + "/Intermediate_{0}.tif".format(i + 2)
+            if not (done and os.path.exists(tally_file_name)):
+                raster.CreateGeoTiff(tally_file_name, extent, dtype, sparse=True)
+            intermediates[i + 2] = tally_file_name
+    spillDir = None
+    if intermediates:
+        spillDir = os.path.join(intDir, "Spill")
+        if os.path.exists(spillDir):
+            shutil.rmtree(spillDir)
+        os.makedirs(spillDir)
+    
+    windowArgs = None
+    if indexDir is not None:
+        Log("Loading footprint index from {0}".format(indexDir))
+        index = raster.FootprintIndex(okPaths, indexDir, workers=workers,
+                                      template=CONUSExtent)
+        windowArgs = {}
+        for window in windows:
+            parts = [raster.FootprintWindow(index[path], window) for path in okPaths]
+            windowArgs[window] = (parts,)
+        reads = sum(p is not None for args in windowArgs.values() for p in args[0])
+        Log("Reading {0} of {1} species windows".format(reads, 
+                                                        len(windows)*len(okPaths)))
+    results = raster.MapWindows(_SumWindow, windows, workers=workers, 
+                                windowArgs=windowArgs,
+                                args=(CONUSExtent, okPaths, okValues, weight, interval,
+                                      scale, dtype, accumulator, spillDir))
+    checkpointed = ((w, _ReadCheckpoint(checkDir, w)) for w in done)
+    total = len(done) + len(windows)
+    # Rasters are written on a background thread while the next windows are summed
+    writer = raster.BackgroundWriter()
+    histograms = {c: rat.Histogram() for c in list(intermediates) + [None]}
+    try:
+        for n, (window, (tally, snapshots)) in enumerate(itertools.chain(checkpointed,
+                                                                         results)):
+            if n < len(done):
+                # Intermediates of checkpointed windows are on disk, only counted
+                for counter, counts in snapshots:
+                    histograms[counter].AddCounts(*counts)
+                writer.Write(out, tally, window[0], window[1])
+                histograms[None].Add(tally)
+                Log("\tWindow {0} of {1}".format(n + 1, total))
+                continue
+            counts = []
+            for counter, snapshot in snapshots:
+                if isinstance(snapshot, str):
+                    spill, snapshot = snapshot, np.load(snapshot)
+                    os.remove(spill)
+                writer.Write(intermediates[counter], snapshot, window[0], window[1])
+                counts.append((counter, rat.CountValues(snapshot)))
+                histograms[counter].AddCounts(*counts[-1][1])
+                snapshot = None
+            writer.Write(out, tally, window[0], window[1])
+            histograms[None].Add(tally)
+            if checkDir is not None:
+                writer.Call(_WriteCheckpoint, checkDir, window, tally, counts)
+            Log("\tWindow {0} of {1}".format(n + 1, total))
+    except BaseException:
+        writer.Close(raise_errors=False)
+        raise
+    writer.Close()
+    
+    # Dereferencing the datasets flushes and closes them, then the RATs are written
+    tally_file_names = [intermediates[c] for c in sorted(intermediates)]
+    out = tally = None
+    if spillDir is not None:
+        shutil.rmtree(spillDir)
+    for counter in histograms:
+        if counter is None:
+            rat.WriteRAT(outFile, *histograms[counter].Counts())
+        else:
+            rat.WriteRAT(intDir + "/Intermediate_{0}.tif".format(counter), 
+                         *histograms[counter].Counts())
+    if checkDir is not None:
+        shutil.rmtree(checkDir)
+    return tally_file_names
+
+
+def _OpenCheckpoint(checkDir, manifest, resume, Log):
+    '''
+    (str, dictionary, bool, function) -> list
+
+    Prepares the checkpoint directory of a numpy engine run and returns the windows 
+        that are already finished.  An existing checkpoint is only reused if resume is
+        True and its manifest matches this run's; otherwise it's cleared and the 
+        manifest is written fresh.
+    '''
+    import os, json, shutil
+    manifestFile = os.path.join(checkDir, "manifest.json")
+    if resume and os.path.exists(manifestFile):
+        with open(manifestFile) as f:
+            if json.load(f) == manifest:
+                done = []
+                for name in os.listdir(checkDir):
+                    if name.startswith("Window_") and name.endswith(".npy"):
+                        done.append(tuple(int(x) for x in name[7:-4].split("_")))
+                Log("Resuming from checkpoint with {0} windows done".format(len(done)))
+                return sorted(done, key=lambda w: (w[1], w[0]))
+        Log("Checkpoint in {0} is from a different run, starting over".format(checkDir))
+    if os.path.exists(checkDir):
+        shutil.rmtree(checkDir)
+    os.makedirs(checkDir)
+    with open(manifestFile, "w") as f:
+        json.dump(manifest, f)
+    return []
+
+
+def _WriteCheckpoint(checkDir, window, tally, counts):
+    '''
+    (str, tuple, numpy array, list) -> None
+
+    Saves a finished window's tally as a .npy file, with the (counter, (values, 
+        counts)) value counts of its intermediates in a small .npz beside it.  The 
+        tally is written under a temporary name and renamed last, so a run that dies
+        mid-write never leaves a partial window behind.
+    '''
+    import os, numpy as np
+    name = os.path.join(checkDir, "Window_{0}_{1}_{2}_{3}".format(*window))
+    arrays = {}
+    for counter, (values, count) in counts:
+        arrays["Intermediate_{0}_values".format(counter)] = values
+        arrays["Intermediate_{0}_counts".format(counter)] = count
+    with open(name + ".counts.npz", "wb") as f:
+        np.savez(f, **arrays)
+    with open(name + ".tmp", "wb") as f:
+        np.save(f, tally)
+    os.replace(name + ".tmp", name + ".npy")
+
+
+def _ReadCheckpoint(checkDir, window):
+    '''
+    (str, tuple) -> numpy array, list
+
+    Loads a window saved by _WriteCheckpoint, returning its tally, memory mapped 
+        rather than read in, and the value counts of its intermediates.
+    '''
+    import os, numpy as np
+    name = os.path.join(checkDir, "Window_{0}_{1}_{2}_{3}".format(*window))
+    with np.load(name + ".counts.npz") as saved:
+        counters = sorted(int(k[13:-7]) for k in saved.files if k.endswith("_values"))
+        counts = [(c, (saved["Intermediate_{0}_values".format(c)], 
+                       saved["Intermediate_{0}_counts".format(c)])) for c in counters]
+    return np.load(name + ".npy", mmap_mode="r"), counts
@@ -0,0 +1,206 @@
+"""
+A module for reading GeoTIFF headers with nothing but the Python standard library.
+The tags that describe a raster (its size, pixel type, georeferencing, and nodata
+value) sit in the first few kilobytes of the file, so reading them directly is far
+faster than opening the raster with arcpy or GDAL when thousands of maps only need
+their metadata checked.  Pixel data is never read.
+"""
+
+# Sizes in bytes of the TIFF field types, keyed by type code, with struct formats
+_TYPES = {1: (1, "B"), 2: (1, "s"), 3: (2, "H"), 4: (4, "I"), 5: (8, "II"),
+          6: (1, "b"), 7: (1, "B"), 8: (2, "h"), 9: (4, "i"), 10: (8, "ii"),
+          11: (4, "f"), 12: (8, "d"), 16: (8, "Q"), 17: (8, "q"), 18: (8, "Q")}
+
+# The tags that are read; others, like the tile offsets, are skipped
+_TAGS = {256: "width", 257: "height", 258: "bitsPerSample", 259: "compression",
+         277: "samplesPerPixel", 322: "tileWidth", 323: "tileLength",
+         339: "sampleFormat", 33550: "pixelScale", 33922: "tiePoint",
+         34735: "geoKeyDirectory", 34736: "geoDoubleParams",
+         34737: "geoAsciiParams", 42113: "nodata"}
+
+# Names of the GeoTIFF coordinate transformation codes (ProjCoordTransGeoKey), as
+# arcpy.Describe reports them in projectionName
+_TRANSFORMS = {1: "Transverse_Mercator", 7: "Mercator", 8: "Lambert_Conformal_Conic",
+               9: "Lambert_Conformal_Conic", 10: "Lambert_Azimuthal_Equal_Area",
+               11: "Albers", 12: "Azimuthal_Equidistant",
+               17: "Equidistant_Cylindrical"}
+
+# EPSG codes of Albers projected coordinate systems in use for CONUS data
+_ALBERS = (5069, 5070, 5071, 5072, 3083, 3310, 6350, 6414, 102003, 102039)
+
+
+def ReadHeader(path, size=16384):
+    '''
+    (string, [int]) -> dictionary
+
+    Parses the first image file directory of a TIFF or BigTIFF and returns its
+        size, pixel type, and georeferencing tags, plus the GeoKeys and the GDAL
+        nodata value.  Only the first size bytes are read unless a tag's values
+        are stored past them, which is rare for these tags.  Raises a ValueError if
+        the file isn't a TIFF.
+
+    Keys:
+    "width", "height" -- Number of columns and rows.
+    "bitsPerSample" -- Bits per cell, e.g., 2 for GAP habitat maps.
+    "sampleFormat" -- 1 unsigned integer, 2 signed integer, 3 floating point.
+    "compression" -- TIFF compression code, e.g., 5 for LZW.
+    "samplesPerPixel" -- Number of bands.
+    "tileWidth", "tileLength" -- Tile size, or None for striped files.
+    "geoKeys" -- A dictionary of GeoKey values by key ID.
+    "geoTransform" -- A GDAL style geotransform, or None if the file has no tie
+        point and pixel scale.
+    "nodata" -- The nodata value from the GDAL_NODATA tag, or None.
+    "bigTIFF" -- True if the file is a BigTIFF.
+
+    Arguments:
+    path -- Path to the TIFF.
+    size -- Number of bytes to read at first.
+
+    Example:
+    >>> ReadHeader("C:/Data/Any/bAMROx.tif")["bitsPerSample"]
+    2
+    '''
+    import struct
+    with open(path, "rb") as f:
+        head = f.read(size)
+
+        def __Read(offset, length):
+            if offset + length <= len(head):
+                return head[offset:offset + length]
+            f.seek(offset)
+            return f.read(length)
+
+        if head[:2] == b"II":
+            order = "<"
+        elif head[:2] == b"MM":
+            order = ">"
+        else:
+            raise ValueError("{0} isn't a TIFF".format(path))
+        version = struct.unpack(order + "H", head[2:4])[0]
+        if version == 42:
+            big, countFormat, entryFormat, inline = False, "H", "HHI", 4
+            offset = struct.unpack(order + "I", head[4:8])[0]
+        elif version == 43:
+            big, countFormat, entryFormat, inline = True, "Q", "HHQ", 8
+            offset = struct.unpack(order + "Q", head[8:16])[0]
+        else:
+            raise ValueError("{0} isn't a TIFF".format(path))
+
+        # Walk the entries of the first directory
+        countSize = struct.calcsize(order + countFormat)
+        count = struct.unpack(order + countFormat, __Read(offset, countSize))[0]
+        entrySize = struct.calcsize(order + entryFormat) + inline
+        entries = __Read(offset + countSize, count*entrySize)
+        tags = {}
+        for i in range(count):
+            entry = entries[i*entrySize:(i + 1)*entrySize]
+            tag, ftype, n = struct.unpack(order + entryFormat,
+                                          entry[:entrySize - inline])
+            if tag not in _TAGS or ftype not in _TYPES:
+                continue
+            length = _TYPES[ftype][0]*n
+            if length <= inline:
+                raw = entry[entrySize - inline:entrySize - inline + length]
+            else:
+                pointer = struct.unpack(order + ("Q" if big else "I"),
+                                        entry[entrySize - inline:])[0]
+                raw = __Read(pointer, length)
+            if ftype == 2:
+                tags[_TAGS[tag]] = raw.split(b"\x00")[0].decode("ascii", "replace")
+            else:
+                values = struct.unpack(order + _TYPES[ftype][1]*n, raw)
+                if ftype in (5, 10):
+                    values = tuple(values[j]/values[j + 1]
+                                   for j in range(0, len(values), 2))
+                tags[_TAGS[tag]] = values
+
+    header = {"width": None, "height": None, "bitsPerSample": None,
+              "sampleFormat": 1, "compression": 1, "samplesPerPixel": 1,
+              "tileWidth": None, "tileLength": None, "bigTIFF": big}
+    for key in header:
+        if key in tags:
+            header[key] = tags[key][0]
+    header["geoKeys"] = _GeoKeys(tags)
+
+    # Only a single tie point with a pixel scale maps to a geotransform
+    header["geoTransform"] = None
+    if "pixelScale" in tags and "tiePoint" in tags:
+        i, j, _, x, y, _ = tags["tiePoint"][:6]
+        dx, dy = tags["pixelScale"][:2]
+        header["geoTransform"] = (x - i*dx, dx, 0.0, y + j*dy, 0.0, -dy)
+
+    header["nodata"] = None
+    if tags.get("nodata", "").strip():
+        try:
+            header["nodata"] = float(tags["nodata"].strip())
+        except ValueError:
+            pass
+    return header
+
+
+def _GeoKeys(tags):
+    '''
+    (dictionary) -> dictionary
+
+    Decodes the GeoKeyDirectory tag into a dictionary of GeoKey values by key ID,
+        looking up values stored in the double and ASCII parameter tags.
+    '''
+    directory = tags.get("geoKeyDirectory")
+    if not directory:
+        return {}
+    keys = {}
+    for i in range(1, directory[3] + 1):
+        key, location, count, value = directory[4*i:4*i + 4]
+        if location == 0:
+            keys[key] = value
+        elif location == 34736 and "geoDoubleParams" in tags:
+            values = tags["geoDoubleParams"][value:value + count]
+            keys[key] = values[0] if count == 1 else values
+        elif location == 34737 and "geoAsciiParams" in tags:
+            keys[key] = tags["geoAsciiParams"][value:value + count].rstrip("|")
+    return keys
+
+
+def Describe(path):
+    '''
+    (string) -> dictionary
+
+    Returns the projection name, format, pixel type, and nodata value of a GeoTIFF
+        from its header, named and coded the way arcpy.Describe reports them (e.g.,
+        "Albers", "TIFF", "U2").  The projection name is None when the GeoKeys don't
+        identify the projection, e.g., for an EPSG code this module doesn't know.
+
+    Arguments:
+    path -- Path to the GeoTIFF.
+
+    Example:
+    >>> Describe("C:/Data/Any/bAMROx.tif")
+    {'projectionName': 'Albers', 'format': 'TIFF', 'pixelType': 'U2',
+     'nodataValue': 0.0}
+    '''
+    header = ReadHeader(path)
+    keys = header["geoKeys"]
+
+    # The transformation is explicit for user-defined projections, like the ones
+    # ArcGIS writes; otherwise go by the EPSG code or the citation
+    projection = None
+    if 3075 in keys:
+        projection = _TRANSFORMS.get(keys[3075])
+    elif keys.get(3072) in _ALBERS:
+        projection = "Albers"
+    elif (32601 <= keys.get(3072, 0) <= 32760 or
+          26901 <= keys.get(3072, 0) <= 26923):
+        projection = "Transverse_Mercator"
+    if projection is None:
+        citation = str(keys.get(3073, "")) + str(keys.get(1026, ""))
+        if "albers" in citation.lower():
+            projection = "Albers"
+    if projection is None and 1024 in keys and keys[1024] != 1:
+        # Geographic or geocentric
+        projection = ""
+
+    bits, sampleFormat = header["bitsPerSample"], header["sampleFormat"]
+    kind = {1: "U", 2: "S", 3: "F"}.get(sampleFormat, "U")
+    pixelType = "{0}{1}".format(kind, bits)
+    return {"projectionName": projection, "format": "TIFF", "pixelType": pixelType,
+            "nodataValue": header["nodata"]}
@@ -0,0 +1,70 @@
+"""
+Helpers that write small GeoTIFFs for the tests with nothing but struct, so inputs
+can be made without GDAL.  The files are uncompressed, single strip, single band
+GeoTIFFs in EPSG 5070 (CONUS Albers) that GDAL and tiff.ReadHeader both read.
+"""
+import struct
+import numpy as np
+
+# TIFF sample formats and field types of the NumPy dtypes that can be written
+_FORMATS = {"u": 1, "i": 2, "f": 3}
+
+
+def WriteGeoTIFF(path, array, geoTransform=(0.0, 30.0, 0.0, 0.0, 0.0, -30.0),
+                 nodata=None, epsg=5070):
+    '''
+    (path, numpy array, [tuple], [number], [int]) -> string
+
+    Writes a 2D array as a GeoTIFF and returns the path as a string.
+    '''
+    array = np.ascontiguousarray(array)
+    if array.dtype == bool:
+        array = array.astype(np.uint8)
+    data = array.astype(array.dtype.newbyteorder("<")).tobytes()
+    height, width = array.shape
+    pixelScale = [geoTransform[1], -geoTransform[5], 0.0]
+    tiePoint = [0.0, 0.0, 0.0, geoTransform[0], geoTransform[3], 0.0]
+    geoKeys = [1, 1, 0, 3, 1024, 0, 1, 1, 1025, 0, 1, 1, 3072, 0, 1, epsg]
+    # (tag, type, values); type 2 is ASCII, 3 SHORT, 4 LONG, and 12 DOUBLE
+    entries = [(256, 4, [width]), (257, 4, [height]),
+               (258, 3, [8*array.dtype.itemsize]), (259, 3, [1]), (262, 3, [1]),
+               (273, 4, [0]), (277, 3, [1]), (278, 4, [height]),
+               (279, 4, [len(data)]), (284, 3, [1]),
+               (339, 3, [_FORMATS[array.dtype.kind]]), (33550, 12, pixelScale),
+               (33922, 12, tiePoint), (34735, 3, geoKeys)]
+    if nodata is not None:
+        entries.append((42113, 2, str(nodata).encode() + b"\0"))
+    formats, sizes = {2: "s", 3: "H", 4: "I", 12: "d"}, {2: 1, 3: 2, 4: 4, 12: 8}
+    ifd = 8
+    extraStart = ifd + 2 + 12*len(entries) + 4
+    extra = b""
+    # The pixels go after the values that don't fit in the IFD
+    for tag, ftype, values in entries:
+        if sizes[ftype]*len(values) > 4:
+            extra += b"\0"*(sizes[ftype]*len(values))
+    dataStart = extraStart + len(extra)
+    entries[5] = (273, 4, [dataStart])
+    body, extra = struct.pack("<H", len(entries)), b""
+    for tag, ftype, values in entries:
+        n = len(values)
+        raw = values if ftype == 2 else struct.pack("<" + formats[ftype]*n, *values)
+        body += struct.pack("<HHI", tag, ftype, n)
+        if sizes[ftype]*n <= 4:
+            body += raw.ljust(4, b"\0")
+        else:
+            body += struct.pack("<I", extraStart + len(extra))
+            extra += raw
+    with open(str(path), "wb") as f:
+        f.write(b"II" + struct.pack("<HI", 42, ifd) + body + struct.pack("<I", 0) +
+                extra + data)
+    return str(path)
+
+
+def Grid(xoff=0, yoff=0, cellSize=30.0):
+    '''
+    ([int], [int], [number]) -> tuple
+
+    Returns the geotransform of a raster whose top left cell is at (xoff, yoff) in a
+        grid with its origin at 0, 0, for range-extent maps.
+    '''
+    return (xoff*cellSize, cellSize, 0.0, -yoff*cellSize, 0.0, -cellSize)
@@ -0,0 +1,4 @@
+import os, sys
+
+# Import the package from this checkout
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
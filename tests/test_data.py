@@ -0,0 +1,297 @@
+"""
+Tests of the data module's checks, catalogs, and map conversions, on small GeoTIFFs
+written with the _rasters helpers.  Tests that read cells need GDAL and are skipped
+without it.
+"""
+import os
+import numpy as np, pandas as pd
+import pytest
+from gapanalysis import data, rat
+from _rasters import WriteGeoTIFF, Grid
+
+
+def _Catalogued(tmp_path, name, array):
+    # A map with its attribute table in a sidecar, so it's cataloged without GDAL
+    path = WriteGeoTIFF(tmp_path / name, array)
+    rat.WriteRAT(path, *np.unique(array, return_counts=True))
+    return path
+
+
+def test_pixel_counts_are_cataloged(tmp_path, monkeypatch):
+    a = _Catalogued(tmp_path, "a.tif", np.array([[0, 1, 1], [1, 0, 0]], np.uint8))
+    b = _Catalogued(tmp_path, "b.tif", np.ones((4, 5), np.uint8))
+    catalog = str(tmp_path / "PixelCounts.csv")
+    stats = []
+    stat = os.stat
+    monkeypatch.setattr(os, "stat", lambda path, *args, **kwargs:
+                        stats.append(path) or stat(path, *args, **kwargs))
+    table = data.PixelCounts([a, b], catalog)
+    assert table.loc[a].tolist() == [3, 3] and table.loc[b].tolist() == [0, 20]
+    # Each raster is stat'ed once, so its size and time come from the same call
+    assert stats.count(a) == 1 and stats.count(b) == 1
+
+    # A warm catalog neither reads tables nor headers
+    def __Fail(raster):
+        raise AssertionError("{0} was read".format(raster))
+    monkeypatch.setattr(data, "_ReadRAT", __Fail)
+    monkeypatch.setattr(data, "_RasterSize", __Fail)
+    table, sizes = data.PixelCounts([b, a], catalog, sizes=True)
+    assert list(table.index) == [b, a] and table.loc[a].tolist() == [3, 3]
+    assert sizes.loc[a].tolist() == [3, 2] and sizes.loc[b].tolist() == [5, 4]
+
+
+def test_pixel_counts_reread_changed_rasters(tmp_path, monkeypatch):
+    a = _Catalogued(tmp_path, "a.tif", np.ones((2, 2), np.uint8))
+    b = _Catalogued(tmp_path, "b.tif", np.ones((3, 3), np.uint8))
+    catalog = str(tmp_path / "PixelCounts.csv")
+    data.PixelCounts([a, b], catalog)
+    _Catalogued(tmp_path, "a.tif", np.array([[1, 2], [2, 2]], np.uint8))
+    stat = os.stat(a)
+    os.utime(a, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    read = []
+    readRAT = data._ReadRAT
+    monkeypatch.setattr(data, "_ReadRAT", lambda raster: read.append(raster) or
+                        readRAT(raster))
+    table = data.PixelCounts([a, b], catalog)
+    assert read == [a]
+    assert table.loc[a].tolist() == [1, 3] and table.loc[b].tolist() == [9, 0]
+    catDF = pd.read_csv(catalog)
+    assert len(catDF) == 3 and set(catDF.path) == {os.path.abspath(a),
+                                                   os.path.abspath(b)}
+
+
+def test_pixel_counts_add_sizes_to_old_catalogs(tmp_path, monkeypatch):
+    a = _Catalogued(tmp_path, "a.tif", np.ones((2, 6), np.uint8))
+    catalog = str(tmp_path / "PixelCounts.csv")
+    stat = os.stat(a)
+    pd.DataFrame({"path": [os.path.abspath(a)], "size": [stat.st_size],
+                  "mtime_ns": [stat.st_mtime_ns], "VALUE": [1],
+                  "COUNT": [12]}).to_csv(catalog, index=False)
+    monkeypatch.setattr(data, "_ReadRAT", lambda raster: 1/0)
+    table, sizes = data.PixelCounts([a], catalog, sizes=True)
+    assert table.loc[a].tolist() == [12] and sizes.loc[a].tolist() == [6, 2]
+    assert pd.read_csv(catalog).XSIZE.tolist() == [6]
+
+
+def _HabMaps(tmp_path):
+    # A passing map and maps that fail one check each, keyed by what they fail
+    maps = {"good": WriteGeoTIFF(tmp_path / "good.tif",
+                                 np.array([[0, 1], [3, 2]], np.uint8), nodata=0),
+            "WrongMaximum": WriteGeoTIFF(tmp_path / "max.tif",
+                                         np.array([[0, 5], [3, 2]], np.uint8),
+                                         nodata=0),
+            "WrongNoDataValue": WriteGeoTIFF(tmp_path / "nodata.tif",
+                                             np.array([[0, 1], [3, 3]], np.uint8),
+                                             nodata=255),
+            "WrongPixelType": WriteGeoTIFF(tmp_path / "u16.tif",
+                                           np.array([[0, 1], [3, 3]], np.uint16),
+                                           nodata=0),
+            "CursorProblem": str(tmp_path / "broken.tif")}
+    with open(maps["CursorProblem"], "wb") as f:
+        f.write(b"II*\0 not a tiff")
+    return maps
+
+
+def test_inspect_hab_map_reads_headers_without_cells(tmp_path):
+    maps = _HabMaps(tmp_path)
+    facts = data._InspectHabMap(maps["good"], statistics=False)
+    assert facts["header"] == {"projectionName": "Albers", "format": "TIFF",
+                               "pixelType": "U8", "nodataValue": 0}
+    assert facts["values"] is None and facts["table"] is None
+    assert data._CheckHabMap(maps["good"], facts, 0, "TIFF", "U8", 3, 3,
+                             False) == []
+    facts = data._InspectHabMap(maps["WrongPixelType"], statistics=False)
+    assert facts["header"]["pixelType"] == "U16"
+
+
+def test_inspect_hab_map_counts_cells(tmp_path):
+    pytest.importorskip("osgeo.gdal")
+    maps = _HabMaps(tmp_path)
+    facts = data._InspectHabMap(maps["good"], tileSize=1)
+    # Nodata cells are left out, as cell statistics leave them out
+    assert facts["values"] == [1, 2, 3] and facts["counts"] == [1, 1, 1]
+    assert data._InspectHabMap(maps["CursorProblem"])["header"] is None
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_check_hab_maps_numpy_engine(tmp_path, workers):
+    pytest.importorskip("osgeo.gdal")
+    maps = _HabMaps(tmp_path)
+    results = data.CheckHabMaps(list(maps.values()), pixel_type="U8", zero=True,
+                                engine="numpy", workers=workers, tileSize=1)
+    assert results["WrongMaximum"] == [maps["WrongMaximum"]]
+    assert results["overMax"] == ["max.tif"]
+    assert results["WrongNoDataValue"] == [maps["WrongNoDataValue"]]
+    assert results["WrongPixelType"] == [maps["WrongPixelType"]]
+    assert results["CursorProblem"] == ["broken.tif"]
+    # Zero is nodata in the maps that declare it, so only one has zeros
+    assert results["Zeros"] == ["nodata.tif"]
+    for key in ("WrongProjection", "WrongFormat", "WrongMinimum", "BadCount",
+                "NoRows"):
+        assert results[key] == [], key
+    with pytest.raises(ValueError):
+        data.CheckHabMaps([], engine="gdal")
+
+
+def test_check_cache_skips_unchanged_rasters(tmp_path, monkeypatch):
+    maps = _HabMaps(tmp_path)
+    rasters = [maps["good"], maps["WrongNoDataValue"], maps["WrongPixelType"]]
+    cache = str(tmp_path / "checks.sqlite")
+    first = data.CheckHabMaps(rasters, engine="numpy", statistics=False,
+                              cache=cache, pixel_type="U8")
+    inspected = []
+    inspect = data._InspectHabMap
+    monkeypatch.setattr(data, "_InspectHabMap", lambda raster, *args:
+                        inspected.append(raster) or inspect(raster, *args))
+    # Changing the desired properties doesn't need the rasters inspected again
+    again = data.CheckHabMaps(rasters, engine="numpy", statistics=False,
+                              cache=cache, pixel_type="U16")
+    assert inspected == []
+    assert first["WrongPixelType"] == [maps["WrongPixelType"]]
+    assert again["WrongPixelType"] == [maps["good"], maps["WrongNoDataValue"]]
+    # A changed raster is inspected again and a deleted one is evicted
+    WriteGeoTIFF(maps["WrongNoDataValue"], np.ones((3, 3), np.uint8), nodata=0)
+    stat = os.stat(maps["WrongNoDataValue"])
+    os.utime(maps["WrongNoDataValue"], ns=(stat.st_atime_ns,
+                                           stat.st_mtime_ns + 10**9))
+    os.remove(maps["WrongPixelType"])
+    again = data.CheckHabMaps(rasters[:2], engine="numpy", statistics=False,
+                              cache=cache, pixel_type="U8")
+    assert inspected == [maps["WrongNoDataValue"]]
+    assert again["WrongNoDataValue"] == []
+    connection = data._OpenCheckCache(cache)
+    paths = [path for (path,) in connection.execute("SELECT path FROM checks")]
+    assert sorted(paths) == sorted(os.path.abspath(r) for r in rasters[:2])
+    # Facts gathered without statistics don't stand in for a check with them
+    found, keys = data._ReadCheckCache(connection, rasters[:2], True, False)
+    assert found == {} and sorted(keys) == sorted(rasters[:2])
+    connection.close()
+
+
+def test_check_cache_hashes_contents(tmp_path):
+    path = WriteGeoTIFF(tmp_path / "a.tif", np.zeros((2, 2), np.uint8), nodata=0)
+    cache = str(tmp_path / "checks.sqlite")
+    connection = data._OpenCheckCache(cache)
+    found, keys = data._ReadCheckCache(connection, [path], False, True)
+    facts = data._InspectHabMap(path, statistics=False)
+    data._WriteCheckCache(connection, path, keys[path], facts, True)
+    assert data._ReadCheckCache(connection, [path], False, True)[0] == {path: facts}
+    # Same size and modification time, but different contents
+    stat = os.stat(path)
+    WriteGeoTIFF(path, np.zeros((2, 2), np.uint8), nodata=1)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert data._ReadCheckCache(connection, [path], False, False)[0] == {path: facts}
+    assert data._ReadCheckCache(connection, [path], False, True)[0] == {}
+    connection.close()
+
+
+def test_iter_check_hab_maps_records(tmp_path):
+    maps = _HabMaps(tmp_path)
+    rasters = [maps["good"], maps["WrongNoDataValue"], maps["good"],
+               maps["WrongPixelType"]]
+    records = list(data.IterCheckHabMaps(rasters, pixel_type="U8",
+                                         statistics=False))
+    # Each raster is checked once
+    assert [record["raster"] for record in records] == [
+        maps["good"], maps["WrongNoDataValue"], maps["WrongPixelType"]]
+    assert [record["errors"] for record in records] == [[], ["WrongNoDataValue"],
+                                                        ["WrongPixelType"]]
+    assert records[0]["ok"] and records[1]["nodataValue"] == 255
+    assert records[0]["minimum"] is None and records[0]["cells"] is None
+    # Checking stops at the first raster that fails
+    records = list(data.IterCheckHabMaps(rasters, pixel_type="U8",
+                                         statistics=False, fail_fast=True))
+    assert [record["ok"] for record in records] == [True, False]
+
+
+def test_write_check_report(tmp_path, capsys):
+    maps = _HabMaps(tmp_path)
+    rasters = [maps["good"], maps["WrongNoDataValue"], maps["CursorProblem"]]
+    records = list(data.IterCheckHabMaps(rasters, pixel_type="U8",
+                                         statistics=False))
+    csv = str(tmp_path / "checks.csv")
+    assert data.WriteCheckReport(iter(records), csv) == 3
+    report = pd.read_csv(csv)
+    assert report.raster.tolist() == rasters
+    assert report.ok.tolist() == [True, False, False]
+    assert report.errors.fillna("").tolist() == ["", "WrongNoDataValue",
+                                                 "CursorProblem"]
+    jsonl = str(tmp_path / "checks.jsonl")
+    assert data.WriteCheckReport(records, jsonl) == 3
+    assert pd.read_json(jsonl, lines=True).errors.tolist() == [
+        [], ["WrongNoDataValue"], ["CursorProblem"]]
+    assert data.WriteCheckReport(records[:1], "-") == 1
+    assert '"ok": true' in capsys.readouterr().out
+
+
+def _RangeMap(tmp_path):
+    # A CONUS extent raster with counter pixels, wider than one 256 cell window, and
+    # a range-extent map coded 1-3 with 0 as nodata that straddles two windows
+    extent = np.zeros((300, 600), np.uint8)
+    extent[:3, :3] = 1
+    conus = WriteGeoTIFF(tmp_path / "conus.tif", extent)
+    rng = np.random.default_rng(13)
+    codes = rng.integers(0, 4, (40, 70)).astype(np.uint8)
+    os.makedirs(str(tmp_path / "raw"))
+    WriteGeoTIFF(tmp_path / "raw" / "bSPPx.tif", codes, Grid(230, 100), nodata=0)
+    full = np.zeros_like(extent)
+    full[100:140, 230:300] = codes
+    return conus, extent, full
+
+
+def test_make01seasonal_needs_whole_blocks(tmp_path):
+    with pytest.raises(ValueError):
+        data.Make01Seasonal(["a.tif"], ["Any"], str(tmp_path) + "/", str(tmp_path),
+                            "conus.tif", log=str(tmp_path / "log.txt"), tileSize=300)
+    assert os.listdir(str(tmp_path)) == []
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_make01seasonal(tmp_path, sparse):
+    pytest.importorskip("osgeo.gdal")
+    from gapanalysis import raster
+    conus, extent, full = _RangeMap(tmp_path)
+    out = tmp_path / "out"
+    data.Make01Seasonal(["bSPPx.tif"], ["s", "winter", "Any"], str(tmp_path / "raw")
+                        + "/", str(out), conus, log=str(tmp_path / "log.txt"),
+                        tileSize=256, sparse=sparse)
+    for season, codes in (("Summer", (1, 3)), ("Winter", (2, 3)),
+                          ("Any", (1, 2, 3))):
+        path = str(out / season / "bSPPx.tif")
+        dataset = raster.Open(path)
+        binary = raster.ReadWindow(dataset, (0, 0, 600, 300))
+        expected = (np.isin(full, codes) | (extent == 1)).astype(np.uint8)
+        assert np.array_equal(binary, expected), season
+        assert [list(a) for a in rat.ReadRAT(path, compute=False)] == \
+            [list(a) for a in np.unique(expected, return_counts=True)]
+    assert open(str(tmp_path / "log.txt")).read().count("bSPPx.tif") == 6
+
+
+def test_check_hab_maps_of_virtual_extents(tmp_path):
+    pytest.importorskip("osgeo.gdal")
+    from gapanalysis import raster
+    conus, extent, full = _RangeMap(tmp_path)
+    habmap = raster.VirtualExtent(str(tmp_path / "raw" / "bSPPx.tif"), conus)
+    # The map's nodata cells read as zeros, so there's no nodata value to check
+    results = data.CheckHabMaps([habmap], nodata=0, pixel_type="U8", engine="numpy",
+                                tileSize=256)
+    assert all(names == [] for names in results.values()), results
+    record, = data.IterCheckHabMaps([habmap], pixel_type="U8", tileSize=256)
+    assert record["nodataValue"] is None and record["ok"]
+    assert record["cells"] == 300*600 and record["maximum"] == 3
+    # The counter pixels come from the template, not the map
+    assert record["minimum"] == 0
+
+
+def test_make0123_writes_virtual_extents(tmp_path):
+    pytest.importorskip("osgeo.gdal")
+    from gapanalysis import raster
+    conus, extent, full = _RangeMap(tmp_path)
+    data.Make0123(["bSPPx.tif"], conus, str(tmp_path / "raw") + "/",
+                  str(tmp_path / "out"), log=str(tmp_path / "log.txt"))
+    vrt = raster.Open(str(tmp_path / "out" / "0123" / "bSPPx.vrt"))
+    assert (vrt.RasterXSize, vrt.RasterYSize) == (600, 300)
+    assert vrt.GetGeoTransform() == raster.Open(conus).GetGeoTransform()
+    assert np.array_equal(raster.ReadWindow(vrt, (0, 0, 600, 300)),
+                          np.where(full != 0, full, extent))
+    assert "Failed" not in open(str(tmp_path / "log.txt")).read()
@@ -0,0 +1,274 @@
+"""
+Tests of PercentOverlay and its NumPy parts, on small GeoTIFFs written with the
+_rasters helpers.  The expected counts are found by brute force, zone by zone.
+Tests that read rasters need GDAL and are skipped without it.
+"""
+import os
+import numpy as np, pandas as pd
+import pytest
+from gapanalysis import habitat
+from _rasters import WriteGeoTIFF, Grid
+
+# The size of the zone grid and the windows it's read in
+HEIGHT, WIDTH, TILE = 48, 64, 16
+
+# The columns of the results that are counts
+COUNTS = ["NonHabitatPixels", "SummerPixels", "WinterPixels", "AllYearPixels",
+          "ZoneTotal", "SummerPixelTotal", "WinterPixelTotal", "AllYearPixelTotal"]
+
+
+def _Inputs(tmp_path, seed=0):
+    # A zone raster with three zones, zeros, and nodata, and habitat maps: two
+    # range-extent 1-3 maps with nodata and one CONUS extent "0123" map
+    rng = np.random.default_rng(seed)
+    zones = np.zeros((HEIGHT, WIDTH), np.uint8)
+    zones[2:20, 5:30] = 3
+    zones[25:40, 10:60] = 7
+    zones[30:46, 50:62] = 12
+    zones[rng.random(zones.shape) < 0.05] = 255
+    zoneFile = WriteGeoTIFF(tmp_path / "zones.tif", zones, nodata=255)
+    habDir = tmp_path / "maps"
+    os.makedirs(str(habDir))
+    spp, maps, covers = [], [], []
+    for i, (x, y, w, h) in enumerate([(3, 1, 30, 22), (20, 18, 40, 28)]):
+        codes = rng.integers(0, 4, (h, w)).astype(np.uint8)
+        codes[rng.random(codes.shape) < 0.1] = 255
+        spp.append("mSPP{0}x_CONUS_HabMap_2001v1.tif".format(i))
+        WriteGeoTIFF(habDir / spp[-1], codes, Grid(x, y), nodata=255)
+        full = np.zeros((HEIGHT, WIDTH), np.uint8)
+        full[y:y + h, x:x + w] = codes
+        cover = np.zeros((HEIGHT, WIDTH), bool)
+        cover[y:y + h, x:x + w] = True
+        maps.append(full)
+        covers.append(cover)
+    codes = rng.integers(0, 4, (HEIGHT, WIDTH)).astype(np.uint8)
+    spp.append("bSPP2x_CONUS_0123.tif")
+    WriteGeoTIFF(habDir / spp[-1], codes)
+    maps.append(codes)
+    covers.append(np.ones((HEIGHT, WIDTH), bool))
+    return zoneFile, zones, str(habDir) + "/", spp, maps, covers
+
+
+def _Expected(zones, maps, covers, extent="habMap"):
+    # Each species' zone x season crosstab, counted cell by cell for each zone
+    zoneValues = np.array([3, 7, 12])
+    crosstabs = []
+    for habmap, cover in zip(maps, covers):
+        if extent != "habMap":
+            cover = np.ones_like(cover)
+        crosstab = np.zeros((len(zoneValues), 4), np.int64)
+        for z, value in enumerate(zoneValues):
+            codes = habmap[(zones == value) & cover]
+            crosstab[z] = [np.sum((codes < 1) | (codes > 3)), np.sum(codes == 1),
+                           np.sum(codes == 2), np.sum(codes == 3)]
+        crosstabs.append(crosstab)
+    return zoneValues, crosstabs
+
+
+def _Overlay(tmp_path, zoneFile, habDir, spp, name="Zones", **kwargs):
+    return habitat.PercentOverlay(zoneFile, name, "VALUE", spp, habDir,
+                                  str(tmp_path / "work"), str(tmp_path / "scratch"),
+                                  zoneFile, tileSize=TILE, **kwargs)
+
+
+def test_decode_overlay():
+    crosstab = habitat.DecodeOverlay([50, 53, 121, 999], [900, 40, 7, 3],
+                                     np.array([5, 12]), base=10)
+    assert crosstab.tolist() == [[900, 0, 0, 40], [0, 7, 0, 0]]
+    crosstab = habitat.DecodeOverlay([8, 9, 10, 11, 14], [1, 2, 3, 4, 5],
+                                     np.array([2]))
+    assert crosstab.tolist() == [[1, 2, 3, 4]]
+    assert habitat.DecodeOverlay([8], [1], np.array([])).shape == (0, 4)
+
+
+def test_overlay_table():
+    # Two species over three zones, the first two of which share label 1
+    crosstabs = [np.array([[10, 2, 0, 3], [5, 0, 1, 0], [20, 4, 4, 2]]),
+                 np.array([[0, 0, 0, 0], [7, 0, 0, 0], [1, 1, 0, 0]])]
+    df = habitat.OverlayTable(["mSEWEx_CONUS.tif", "bamrox_conus.tif"], [1, 1, 2],
+                              crosstabs, date="2024-01-01", runtimes=["0:01", "0:02"])
+    assert list(df.index) == [("mSEWEx_CONUS.tif", 1), ("mSEWEx_CONUS.tif", 2),
+                              ("bamrox_conus.tif", 1), ("bamrox_conus.tif", 2)]
+    assert list(df.strUC) == ["mSEWEx"]*2 + ["bAMROx"]*2
+    row = df.loc[("mSEWEx_CONUS.tif", 1)]
+    # Summer and winter include the year-round pixels
+    assert (row.NonHabitatPixels, row.SummerPixels, row.WinterPixels,
+            row.AllYearPixels, row.ZoneTotal) == (15, 5, 4, 3, 21)
+    assert (row.SummerPixelTotal, row.WinterPixelTotal, row.AllYearPixelTotal) == \
+           (11, 10, 5)
+    assert np.isclose(row.PercSummer, 100*5/11.)
+    assert np.isclose(row.PercYearRound, 60.)
+    # A species with no winter habitat gets 0 percent rather than nan
+    assert df.loc[("bamrox_conus.tif", 2)].PercWinter == 0
+    assert df.loc[("bamrox_conus.tif", 2)].RunTime == "0:02"
+    assert set(df.Date) == {"2024-01-01"}
+    # One species x zone x season array gives the same table
+    stacked = habitat.OverlayTable(["mSEWEx_CONUS.tif", "bamrox_conus.tif"],
+                                   [1, 1, 2], np.stack(crosstabs),
+                                   date="2024-01-01", runtimes=["0:01", "0:02"])
+    pd.testing.assert_frame_equal(stacked, df)
+
+
+@pytest.mark.parametrize("extent", ["habMap", "zoneFile"])
+def test_percent_overlay_counts_every_zone(tmp_path, extent):
+    pytest.importorskip("osgeo.gdal")
+    zoneFile, zones, habDir, spp, maps, covers = _Inputs(tmp_path)
+    df = _Overlay(tmp_path, zoneFile, habDir, spp, extent=extent, workers=2)
+    expected = habitat.OverlayTable(spp, *_Expected(zones, maps, covers, extent))
+    assert sorted(df.index) == sorted(expected.index)
+    df = df.loc[expected.index]
+    assert np.array_equal(df[COUNTS].values, expected[COUNTS].values)
+    assert np.allclose(df[["PercSummer", "PercWinter", "PercYearRound"]].values,
+                       expected[["PercSummer", "PercWinter",
+                                 "PercYearRound"]].values)
+    assert list(df.strUC.unique()) == ["mSPP0x", "mSPP1x", "bSPP2x"]
+
+
+@pytest.mark.parametrize("extent", ["habMap", "zoneFile"])
+def test_percent_overlay_by_windows_matches_by_species(tmp_path, extent):
+    pytest.importorskip("osgeo.gdal")
+    zoneFile, zones, habDir, spp, maps, covers = _Inputs(tmp_path, seed=1)
+    bySpecies = _Overlay(tmp_path, zoneFile, habDir, spp, "species", extent=extent)
+    byWindows = _Overlay(tmp_path, zoneFile, habDir, spp + ["missing.tif"],
+                         "windows", extent=extent, mode="windows", workers=2)
+    assert np.array_equal(byWindows.loc[bySpecies.index, COUNTS].values,
+                          bySpecies[COUNTS].values)
+    # A map that can't be read gets zeros
+    assert (byWindows.loc["missing.tif", COUNTS].values == 0).all()
+
+
+def test_overlay_window_returns_only_the_zones_in_it(tmp_path):
+    pytest.importorskip("osgeo.gdal")
+    zoneFile, zones, habDir, spp, maps, covers = _Inputs(tmp_path, seed=2)
+    zoneValues = np.array([3, 7, 12])
+    window, part = (0, 0, 16, 16), (3, 1, 13, 15)
+    positions, seen, crosstab, zoneCounts, errors = habitat._OverlayWindow(
+        window, habDir, zoneFile, zoneValues, ((4, spp[0], part), (6, "x.tif", part)))
+    # Only zone 3 reaches the window
+    assert positions == [4, 6] and seen.tolist() == [0] and crosstab.shape == (2, 1, 4)
+    assert zoneCounts.tolist() == [np.sum(zones[:16, :16] == 3)]
+    expected = _Expected(zones[:16, :16], [maps[0][:16, :16]],
+                         [covers[0][:16, :16]])[1][0]
+    assert crosstab[0].tolist() == expected[:1].tolist()
+    assert list(errors) == [6] and not crosstab[1].any()
+
+
+def _Table(species, nonhabitat, date):
+    # A results table of one zone for each species, with 10 summer pixels each
+    crosstabs = [np.array([[n, 10, 0, 0]]) for n in nonhabitat]
+    return habitat.OverlayTable(species, [1], crosstabs, date=date)
+
+
+def test_master_table_keeps_history(tmp_path):
+    database = str(tmp_path / "Percent_in_Zones_Master.sqlite")
+    connection = habitat._OpenMaster(database)
+    habitat._UpsertMaster(connection, _Table(["a.tif", "b.tif"], [1, 2], "d1"),
+                          "2024-01-01T00:00:00")
+    habitat._UpsertMaster(connection, _Table(["b.tif", "c.tif"], [3, 4], "d2"),
+                          "2024-02-01T00:00:00")
+    connection.close()
+    master = habitat.ReadOverlayMaster(database)
+    assert sorted(master.index) == [("a.tif", 1), ("b.tif", 1), ("c.tif", 1)]
+    assert master.loc[("b.tif", 1)].NonHabitatPixels == 3
+    assert master.loc[("b.tif", 1)].Date == "d2"
+    assert "Run" not in master.columns
+    # The table as of the first run, from the history the second run kept
+    first = habitat.ReadOverlayMaster(database, run="2024-01-15")
+    assert sorted(first.index) == [("a.tif", 1), ("b.tif", 1)]
+    assert first.loc[("b.tif", 1)].NonHabitatPixels == 2
+    assert habitat.ReadOverlayMaster(database, run="2023-12-31").empty
+    # Reopening keeps the tables
+    connection = habitat._OpenMaster(database)
+    assert connection.execute("SELECT COUNT(*) FROM history").fetchone() == (1,)
+    connection.close()
+
+
+def test_master_table_imports_old_csv(tmp_path):
+    csv = str(tmp_path / "Percent_in_Zones_Master.csv")
+    old = _Table(["a.tif", "b.tif"], [5, 6], "d0")
+    old.to_csv(csv)
+    database = str(tmp_path / "Percent_in_Zones_Master.sqlite")
+    habitat._OpenMaster(database, csv).close()
+    master = habitat.ReadOverlayMaster(database)
+    assert sorted(master.index) == sorted(old.index)
+    assert master.loc[old.index, "NonHabitatPixels"].tolist() == [5, 6]
+    assert np.allclose(master.loc[old.index, "PercSummer"], 100.)
+    # Only a new database is filled from the csv
+    _Table(["c.tif"], [7], "d1").to_csv(csv)
+    habitat._OpenMaster(database, csv).close()
+    assert "c.tif" not in habitat.ReadOverlayMaster(database).index
+
+
+def test_percent_overlay_exports_csv_on_request(tmp_path):
+    pytest.importorskip("osgeo.gdal")
+    zoneFile, zones, habDir, spp, maps, covers = _Inputs(tmp_path, seed=3)
+    csv = tmp_path / "work" / "Percent_in_Zones_Master.csv"
+    first = _Overlay(tmp_path, zoneFile, habDir, spp[:2])
+    assert not csv.exists()
+    assert sorted(first.index.get_level_values(0).unique()) == sorted(spp[:2])
+    both = _Overlay(tmp_path, zoneFile, habDir, spp[1:], exportCSV=True)
+    assert sorted(both.index.get_level_values(0).unique()) == sorted(spp)
+    exported = pd.read_csv(str(csv), index_col=["GeoTiff", "Zone"])
+    assert np.array_equal(exported.loc[both.index, COUNTS].values,
+                          both[COUNTS].values)
+
+
+def test_merge_zones():
+    values = np.array([4, 2, 4, 2])
+    cells = np.array([3, 1, 2, 5])
+    boxes = np.array([[0, 0, 3, 1], [5, 5, 6, 6], [1, 4, 3, 5], [2, 7, 7, 8]])
+    values, cells, boxes = habitat._MergeZones(values, cells, boxes)
+    assert values.tolist() == [2, 4] and cells.tolist() == [6, 5]
+    assert boxes.tolist() == [[2, 5, 7, 8], [0, 0, 3, 5]]
+    values, cells, boxes = habitat._MergeZones(np.array([]), np.array([]),
+                                               np.zeros((0, 4)))
+    assert len(values) == 0 and boxes.shape == (0, 4)
+
+
+def test_zone_scan_is_saved_until_the_zones_change(tmp_path, monkeypatch):
+    pytest.importorskip("osgeo.gdal")
+    from gapanalysis import raster
+    zoneFile, zones, habDir, spp, maps, covers = _Inputs(tmp_path)
+    path = str(tmp_path / "zones.npz")
+    values, cells, boxes = habitat._ZoneScan(zoneFile, path, tileSize=TILE)
+    assert values.tolist() == [3, 7, 12]
+    for value, count, box in zip(values, cells, boxes):
+        rows, cols = np.nonzero(zones == value)
+        assert count == len(rows)
+        assert box.tolist() == [cols.min(), rows.min(), cols.max() + 1,
+                                rows.max() + 1]
+    # A saved scan is reused without reading the zones
+    monkeypatch.setattr(raster, "Open", lambda *args: 1/0)
+    saved = habitat._ZoneScan(zoneFile, path, tileSize=TILE)
+    assert all(np.array_equal(a, b) for a, b in zip(saved, (values, cells, boxes)))
+    monkeypatch.undo()
+    zones[zones == 12] = 0
+    WriteGeoTIFF(zoneFile, zones, nodata=255)
+    stat = os.stat(zoneFile)
+    os.utime(zoneFile, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert habitat._ZoneScan(zoneFile, path, tileSize=TILE)[0].tolist() == [3, 7]
+
+
+def test_zone_boxes_shrink_tiles_to_the_zones():
+    class Zones(object):
+        RasterXSize, RasterYSize = 40, 20
+    # Zone 5 sits in the first tile and zone 9 spans the second and third
+    scan = (np.array([5, 9]), np.array([6, 30]),
+            np.array([[2, 3, 5, 5], [18, 10, 35, 16]]))
+    cells, windows = habitat._ZoneBoxes(scan, np.array([5, 7, 9]), Zones(),
+                                        tileSize=16)
+    assert cells.tolist() == [6, 0, 30]
+    assert windows == [(2, 3, 3, 2), (18, 10, 14, 6), (32, 10, 3, 6)]
+
+
+@pytest.mark.parametrize("mode", ["species", "windows"])
+def test_percent_overlay_zone_boxes_match_the_zone_file(tmp_path, mode):
+    pytest.importorskip("osgeo.gdal")
+    zoneFile, zones, habDir, spp, maps, covers = _Inputs(tmp_path, seed=4)
+    expected = habitat.OverlayTable(spp, *_Expected(zones, maps, covers,
+                                                    "zoneFile"))
+    df = _Overlay(tmp_path, zoneFile, habDir, spp, extent="zoneBoxes", mode=mode,
+                  workers=2)
+    assert np.array_equal(df.loc[expected.index, COUNTS].values,
+                          expected[COUNTS].values)
+    assert os.path.exists(str(tmp_path / "work" / "Zones_zones.npz"))
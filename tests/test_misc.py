@@ -0,0 +1,76 @@
+"""
+Tests of the misc module's raster summaries.  Attribute tables are written next to
+the rasters with rat.WriteRAT, so those rasters are never read; RasterStats reads a
+GeoTIFF written with the _rasters helpers and needs GDAL.
+"""
+import math
+import numpy as np
+import pytest
+from gapanalysis import misc, rat
+from _rasters import WriteGeoTIFF
+
+
+def _Table(tmp_path):
+    # A richness-like table: zeros, a spread of values, and the counter cells
+    values = np.array([0, 1, 2, 3, 5, 40])
+    counts = np.array([50, 7, 12, 5, 3, 9])
+    raster = str(tmp_path / "richness.tif")
+    rat.WriteRAT(raster, values, counts)
+    return raster, np.repeat(values, counts)
+
+
+def test_rat_to_data_frame(tmp_path):
+    raster, cells = _Table(tmp_path)
+    df = misc.RATtoDataFrame(raster)
+    assert df.index.name == "value" and list(df.columns) == ["cell_count"]
+    assert df.index.tolist() == [0, 1, 2, 3, 5, 40]
+    assert df.cell_count.tolist() == [50, 7, 12, 5, 3, 9]
+    frame = misc._RATFrame(raster, dropMax=True, dropZero=True)
+    assert frame.index.tolist() == [1, 2, 3, 5]
+    assert frame.freq.tolist() == [7, 12, 5, 3]
+
+
+def test_rat_stats(tmp_path):
+    raster, cells = _Table(tmp_path)
+    stats = misc.RATStats(raster, [25, 50, 90], dropMax=True, dropZero=True)
+    cells = cells[(cells != 0) & (cells != 40)]
+    assert stats["count"] == cells.size
+    assert np.isclose(stats["mean"], cells.mean())
+    assert np.isclose(stats["standard_deviation"], cells.std())
+    assert stats["range"] == (1, 5)
+    # Percentiles are nearest ranks
+    for p in (25, 50, 90):
+        rank = int(math.ceil(cells.size*p/100.0))
+        assert stats["{0}th".format(p)] == np.sort(cells)[rank - 1], p
+
+
+def test_plot_rat(tmp_path):
+    pytest.importorskip("matplotlib")
+    import matplotlib
+    matplotlib.use("Agg")
+    raster, cells = _Table(tmp_path)
+    ogive, distribution = str(tmp_path / "ogive.png"), str(tmp_path / "dist.png")
+    misc.PlotRAT(raster, ogive, distribution, dropMax=True)
+    assert open(ogive, "rb").read(4) == b"\x89PNG"
+    assert open(distribution, "rb").read(4) == b"\x89PNG"
+
+
+def test_raster_stats(tmp_path):
+    pytest.importorskip("osgeo.gdal")
+    rng = np.random.default_rng(5)
+    array = rng.integers(0, 20, (40, 50)).astype(np.uint8)
+    array[:3, :3] = 99
+    array[10, :7] = 255
+    raster = WriteGeoTIFF(tmp_path / "r.tif", array, nodata=255)
+    stats = misc.RasterStats(raster, tileSize=16)
+    assert not any(key.endswith("th") for key in stats)
+    cells = array[array != 255]
+    assert stats["count"] == cells.size and stats["range"] == (0, 99)
+    percentiles = [50]
+    stats = misc.RasterStats(raster, percentiles, dropMax=True, dropZero=True,
+                             tileSize=16)
+    cells = cells[(cells != 0) & (cells != 99)]
+    assert np.isclose(stats["mean"], cells.mean()) and percentiles == [50]
+    assert stats["50th"] == np.sort(cells)[int(math.ceil(cells.size/2.)) - 1]
+    # Percentiles from one call don't carry into the next
+    assert "50th" not in misc.RasterStats(raster, tileSize=16)
@@ -0,0 +1,207 @@
+"""
+Tests of the raster module's windowing, footprints, and bit-sliced counter.  Tests
+that read rasters need GDAL and are skipped without it.
+"""
+import os
+import numpy as np
+import pytest
+from gapanalysis import raster
+from _rasters import WriteGeoTIFF
+
+
+def _Cells(window, scale, offset=0):
+    # Module level, so it can be sent to worker processes
+    return window[2]*window[3]*scale + offset
+
+
+def test_tile_windows_cover_the_grid():
+    windows = raster.TileWindows(40, 25, 16)
+    assert windows[:3] == [(0, 0, 16, 16), (16, 0, 16, 16), (32, 0, 8, 16)]
+    assert sum(w[2]*w[3] for w in windows) == 40*25
+
+
+def test_map_windows_serially_and_on_a_pool():
+    windows = raster.TileWindows(40, 25, 16)
+    serial = list(raster.MapWindows(_Cells, windows, args=(2,)))
+    assert serial == [(w, 2*w[2]*w[3]) for w in windows]
+    offsets = {w: (i,) for i, w in enumerate(windows)}
+    pooled = dict(raster.MapWindows(_Cells, windows, args=(2,), workers=2,
+                                    windowArgs=offsets))
+    assert pooled == {w: 2*w[2]*w[3] + offsets[w][0] for w in windows}
+
+
+def test_footprint_window():
+    occupancy = np.zeros((4, 4), dtype=bool)
+    occupancy[1, 2] = True
+    footprint = {"bbox": (40, 20, 60, 30), "blockSize": 16, "occupancy": occupancy}
+    # Clipped to the bbox
+    assert raster.FootprintWindow(footprint, (32, 16, 32, 16)) == (40, 20, 20, 10)
+    # Outside the bbox, or over blocks with no cells
+    assert raster.FootprintWindow(footprint, (0, 0, 32, 16)) is None
+    occupancy[1, 2] = False
+    assert raster.FootprintWindow(footprint, (32, 16, 32, 16)) is None
+    footprint["bbox"] = None
+    assert raster.FootprintWindow(footprint, (0, 0, 64, 64)) is None
+
+
+def _Map(path, boxes, nodata=None):
+    habmap = np.zeros((40, 56), dtype=np.uint8)
+    for x0, y0, x1, y1 in boxes:
+        habmap[y0:y1, x0:x1] = 1
+    return WriteGeoTIFF(path, habmap, nodata=nodata)
+
+
+def test_footprint(tmp_path):
+    pytest.importorskip("osgeo.gdal")
+    footprint = raster.Footprint(_Map(tmp_path / "a.tif", [(20, 5, 30, 12),
+                                                           (3, 30, 5, 33)]),
+                                 blockSize=8, tileSize=16)
+    assert footprint["bbox"] == (3, 5, 30, 33)
+    assert footprint["occupancy"].shape == (5, 7)
+    assert np.array_equal(np.argwhere(footprint["occupancy"]),
+                          [[0, 2], [0, 3], [1, 2], [1, 3], [3, 0], [4, 0]])
+    empty = raster.Footprint(_Map(tmp_path / "b.tif", []), blockSize=8, tileSize=16)
+    assert empty["bbox"] is None and not empty["occupancy"].any()
+
+
+def test_footprint_index_is_reused_until_a_map_changes(tmp_path, monkeypatch):
+    pytest.importorskip("osgeo.gdal")
+    os.makedirs(str(tmp_path / "Summer"))
+    os.makedirs(str(tmp_path / "Winter"))
+    summer = _Map(tmp_path / "Summer" / "a.tif", [(20, 5, 30, 12)])
+    winter = _Map(tmp_path / "Winter" / "a.tif", [(0, 0, 4, 4)])
+    indexDir = str(tmp_path / "index")
+    index = raster.FootprintIndex([summer, winter], indexDir)
+    # Maps with the same name in different directories get their own files
+    assert len(os.listdir(indexDir)) == 2
+    assert index[summer]["bbox"] == (20, 5, 30, 12)
+    assert index[winter]["bbox"] == (0, 0, 4, 4)
+
+    scanned = []
+    footprint = raster.Footprint
+    monkeypatch.setattr(raster, "Footprint", lambda path, *args, **kwargs:
+                        scanned.append(path) or footprint(path, *args, **kwargs))
+    again = raster.FootprintIndex([summer, winter], indexDir)
+    assert scanned == []
+    assert np.array_equal(again[summer]["occupancy"], index[summer]["occupancy"])
+    _Map(summer, [(40, 30, 50, 40)])
+    stat = os.stat(summer)
+    os.utime(summer, (stat.st_atime, stat.st_mtime + 10))
+    changed = raster.FootprintIndex([summer, winter], indexDir)
+    assert scanned == [summer]
+    assert changed[summer]["bbox"] == (40, 30, 50, 40)
+
+
+def test_packed_add_counts_binary_maps():
+    rng = np.random.default_rng(0)
+    maps = rng.random((40, 7, 21)) < 0.5
+    planes = []
+    for m in maps:
+        raster.PackedAdd(planes, np.packbits(m, axis=1))
+    assert np.array_equal(raster.UnpackCounts(planes, 21), maps.sum(axis=0))
+    # Planes are only added as the counts outgrow them
+    assert len(planes) == int(maps.sum(axis=0).max()).bit_length()
+
+
+def test_packed_add_to_part_of_the_counter():
+    rng = np.random.default_rng(1)
+    base = rng.random((6, 32)) < 0.5
+    part = rng.random((3, 11)) < 0.5
+    planes = raster.PackedAdd([], np.packbits(base, axis=1))
+    packed = np.packbits(part, axis=1)
+    raster.PackedAdd(planes, packed, rows=slice(2, 5),
+                     cols=slice(1, 1 + packed.shape[1]))
+    expected = base.astype(np.uint16)
+    expected[2:5, 8:19] += part
+    assert np.array_equal(raster.UnpackCounts(planes, 32), expected)
+
+
+def test_unpack_counts_needs_planes():
+    with pytest.raises(ValueError):
+        raster.UnpackCounts([], 8)
+
+
+def test_read_packed_window(tmp_path):
+    pytest.importorskip("osgeo.gdal")
+    rng = np.random.default_rng(5)
+    habmap = (rng.random((20, 30)) < 0.5).astype(np.uint8)*3
+    dataset = raster.Open(WriteGeoTIFF(tmp_path / "a.tif", habmap))
+    packed = raster.ReadPackedWindow(dataset, (5, 2, 17, 9), offset=3)
+    assert packed.shape == (9, 3)
+    unpacked = np.unpackbits(packed, axis=1, count=20)
+    assert not unpacked[:, :3].any()
+    assert np.array_equal(unpacked[:, 3:], habmap[2:11, 5:22] != 0)
+
+
+class _Dataset(object):
+    # Records the windows written to it in place of a GDAL dataset
+    def __init__(self, log, name="dataset"):
+        self.log, self.name = log, name
+
+    def GetRasterBand(self, band):
+        return self
+
+    def WriteArray(self, array, xoff, yoff):
+        self.log.append((self.name, array.tolist(), xoff, yoff))
+
+
+def test_background_writer_writes_in_order(monkeypatch):
+    log = []
+    opened = []
+    monkeypatch.setattr(raster, "Open", lambda path, update=False:
+                        opened.append((path, update)) or _Dataset(log, path))
+    writer = raster.BackgroundWriter(maxsize=1)
+    writer.Write(_Dataset(log), np.array([[1]]), 0, 0)
+    writer.Write("a.tif", np.array([[2]]), 3, 4)
+    writer.Call(log.append, "checkpoint")
+    writer.Write("a.tif", np.array([[3]]), 5, 6)
+    writer.Close()
+    assert log == [("dataset", [[1]], 0, 0), ("a.tif", [[2]], 3, 4), "checkpoint",
+                   ("a.tif", [[3]], 5, 6)]
+    # Paths are opened for each write, in update mode
+    assert opened == [("a.tif", True)]*2
+
+
+def test_background_writer_raises_errors():
+    def __Fail():
+        raise IOError("disk full")
+    log = []
+    writer = raster.BackgroundWriter()
+    writer.Call(__Fail)
+    writer.Call(log.append, "after")
+    with pytest.raises(IOError):
+        writer.Close()
+    # Work queued after an error is skipped
+    assert log == []
+    # The error is raised by the next Write, unless it's closed without raising
+    writer = raster.BackgroundWriter()
+    writer.Call(__Fail)
+    writer.Close(raise_errors=False)
+    with pytest.raises(IOError):
+        writer.Write(_Dataset(log), np.array([[1]]), 0, 0)
+    assert log == []
+
+
+def test_virtual_extent_reads_in_the_grid(tmp_path):
+    pytest.importorskip("osgeo.gdal")
+    from _rasters import Grid
+    template = WriteGeoTIFF(tmp_path / "grid.tif", np.zeros((30, 40), np.uint8))
+    codes = np.array([[1, 255, 3], [2, 2, 255]], np.uint8)
+    WriteGeoTIFF(tmp_path / "map.tif", codes, Grid(35, 20), nodata=255)
+    habmap = raster.OpenInGrid(str(tmp_path / "map.tif"), template)
+    assert isinstance(habmap, raster.VirtualExtent)
+    assert habmap.offset == (35, 20) and habmap.Window() == (35, 20, 3, 2)
+    assert (habmap.RasterXSize, habmap.RasterYSize) == (40, 30)
+    assert habmap.GetRasterBand(1).GetNoDataValue() is None
+    # Nodata cells and everything outside the map read as zero
+    expected = np.zeros((30, 40), np.uint8)
+    expected[20:22, 35:38] = np.where(codes == 255, 0, codes)
+    assert np.array_equal(raster.ReadWindow(habmap, (0, 0, 40, 30)), expected)
+    assert np.array_equal(raster.ReadWindow(habmap, (32, 16, 8, 8)),
+                          expected[16:24, 32:40])
+    assert raster.DataWindow(habmap, (0, 0, 16, 16)) is None
+    assert raster.DataWindow(habmap, (32, 16, 8, 8)) == (35, 20, 3, 2)
+    # Maps off the grid are refused
+    WriteGeoTIFF(tmp_path / "off.tif", codes, (15.0, 30.0, 0.0, 0.0, 0.0, -30.0))
+    with pytest.raises(ValueError):
+        raster.OpenInGrid(str(tmp_path / "off.tif"), template)
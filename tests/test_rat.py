@@ -0,0 +1,179 @@
+"""
+Tests of the rat module's value counts, table writers, and table readers.  Only
+counting a raster without a table needs GDAL.
+"""
+import math, struct
+import numpy as np
+import pytest
+from gapanalysis import rat
+from _rasters import WriteGeoTIFF
+
+
+def _Percentile(cells, p):
+    # The nearest-rank percentile
+    cells = np.sort(cells)
+    return cells[max(int(math.ceil(len(cells)*p/100.0)) - 1, 0)]
+
+
+def test_count_values():
+    values, counts = rat.CountValues(np.array([[0, 3], [3, 1]]))
+    assert list(values) == [0, 1, 3] and list(counts) == [1, 1, 2]
+    values, counts = rat.CountValues(np.array([0, 2**30, 5]), nodata=5)
+    assert list(values) == [0, 2**30] and list(counts) == [1, 1]
+    values, counts = rat.CountValues(np.array([-4, 7, -4], dtype=np.int16))
+    assert list(values) == [-4, 7] and list(counts) == [2, 1]
+    values, counts = rat.CountValues(np.full(3, 9), nodata=9)
+    assert values.size == 0 and counts.size == 0
+
+
+def test_histogram_matches_unique():
+    rng = np.random.default_rng(1)
+    array = rng.integers(0, 40, (30, 50))
+    histogram = rat.Histogram(nodata=0)
+    for rows in (slice(0, 7), slice(7, 30)):
+        histogram.Add(array[rows])
+    histogram.AddCounts([], [])
+    values, counts = histogram.Counts()
+    expected = np.unique(array[array != 0], return_counts=True)
+    assert np.array_equal(values, expected[0])
+    assert np.array_equal(counts, expected[1])
+    # Counts tallied elsewhere merge with the ones added
+    histogram.AddCounts(np.array([1, 100]), np.array([5, 2]))
+    merged = dict(zip(*histogram.Counts()))
+    assert merged[1] == expected[1][0] + 5 and merged[100] == 2
+
+
+def test_write_rat_round_trips(tmp_path):
+    raster = str(tmp_path / "r.tif")
+    values, counts = np.array([0, 2, 5]), np.array([3*10**9, 80, 1])
+    aux, csv = rat.WriteRAT(raster, values, counts)
+    assert aux == raster + ".aux.xml" and csv == raster + ".vat.csv"
+    # Counts past 2**31 survive the .aux.xml
+    assert list(rat._ReadAuxXML(aux)[1]) == [3*10**9, 80, 1]
+    read = rat.ReadRAT(raster, compute=False)
+    assert list(read[0]) == [0, 2, 5] and list(read[1]) == [3*10**9, 80, 1]
+    assert read[0].dtype == np.int64
+    # The csv is read when there's no .aux.xml
+    (tmp_path / "r.tif.aux.xml").unlink()
+    read = rat.ReadRAT(raster, compute=False)
+    assert list(read[1]) == [3*10**9, 80, 1]
+    (tmp_path / "r.tif.vat.csv").unlink()
+    with pytest.raises(ValueError):
+        rat.ReadRAT(raster, compute=False)
+
+
+def test_write_aux_xml_keeps_other_metadata(tmp_path):
+    raster = str(tmp_path / "r.tif")
+    (tmp_path / "r.tif.aux.xml").write_text(
+        '<PAMDataset><Metadata><MDI key="AREA_OR_POINT">Area</MDI></Metadata>'
+        '<PAMRasterBand band="1"><Metadata><MDI key="STATISTICS_MEAN">9</MDI>'
+        '<MDI key="LAYER_TYPE">thematic</MDI></Metadata></PAMRasterBand>'
+        '</PAMDataset>')
+    rat.WriteAuxXML(raster, [1, 3], [1, 3])
+    rat.WriteAuxXML(raster, [1, 4], [2, 2])
+    text = (tmp_path / "r.tif.aux.xml").read_text()
+    assert "AREA_OR_POINT" in text and "LAYER_TYPE" in text
+    assert text.count("GDALRasterAttributeTable") == 2
+    assert text.count("STATISTICS_MEAN") == 1 and ">2.5<" in text
+    assert [list(a) for a in rat.ReadRAT(raster)] == [[1, 4], [2, 2]]
+
+
+def test_read_rat_counts_rasters_without_tables(tmp_path):
+    pytest.importorskip("osgeo.gdal")
+    array = np.array([[0, 1, 1], [2, 1, 9]], dtype=np.uint8)
+    raster = WriteGeoTIFF(tmp_path / "r.tif", array, nodata=9)
+    values, counts = rat.ReadRAT(raster, tileSize=2)
+    assert list(values) == [0, 1, 2] and list(counts) == [1, 3, 1]
+
+
+def _WriteDBF(path, fields, rows, deleted=()):
+    # A dBASE table of numeric fields, like the .vat.dbf ArcGIS writes
+    headerLength = 32 + 32*len(fields) + 1
+    recordLength = 1 + sum(size for name, size in fields)
+    header = struct.pack("<BBBBIHH20x", 3, 24, 1, 1, len(rows) + len(deleted),
+                         headerLength, recordLength)
+    for name, size in fields:
+        header += name.encode().ljust(11, b"\0") + b"N" + b"\0"*4 + \
+                  bytes([size, 0]) + b"\0"*14
+    header += b"\r"
+    records = b""
+    for flag, row in [(b" ", row) for row in rows] + [(b"*", row) for row in deleted]:
+        records += flag + b"".join(str(v).rjust(size).encode()
+                                   for v, (name, size) in zip(row, fields))
+    path.write_bytes(header + records + b"\x1a")
+    return str(path)
+
+
+def test_read_dbf(tmp_path):
+    fields = [("OID", 11), ("VALUE", 11), ("COUNT", 19)]
+    # A deleted record is left out
+    path = _WriteDBF(tmp_path / "r.tif.vat.dbf", fields,
+                     [(0, 3, 120), (1, 7, 45), (2, 9, 5)], deleted=[(3, 99, 1)])
+    values, counts = rat._ReadDBF(path, ["Value", "Count"])
+    assert list(values) == [3, 7, 9] and list(counts) == [120, 45, 5]
+    assert rat._ReadDBF(path, ["VALUE", "AREA"]) is None
+
+
+def test_read_rat_prefers_the_arcgis_table(tmp_path):
+    raster = str(tmp_path / "r.tif")
+    rat.WriteRAT(raster, [0, 1], [10, 10])
+    _WriteDBF(tmp_path / "r.tif.vat.dbf", [("OID", 11), ("VALUE", 11),
+                                           ("COUNT", 19)],
+              [(0, 4, 3*10**10), (1, 2, 6)])
+    values, counts = rat.ReadRAT(raster, compute=False)
+    assert list(values) == [2, 4] and list(counts) == [6, 3*10**10]
+
+
+def test_raster_statistics_match_numpy():
+    rng = np.random.default_rng(2)
+    array = rng.integers(0, 60, (50, 70))
+    array[0, :5] = 255
+    stats = rat.RasterStatistics(nodata=255)
+    for rows in (slice(0, 20), slice(20, 50)):
+        stats.Add(array[rows])
+    cells = array[array != 255]
+    result = stats.Result([10, 50, 90])
+    assert result["count"] == cells.size
+    assert np.isclose(result["mean"], cells.mean())
+    assert np.isclose(result["standard_deviation"], cells.std())
+    assert result["range"] == (cells.min(), cells.max())
+    for p in (10, 50, 90):
+        assert result["{0}th".format(p)] == _Percentile(cells, p)
+
+
+def test_raster_statistics_drop_max_and_zero():
+    rng = np.random.default_rng(3)
+    array = rng.integers(0, 20, 1000)
+    array[:9] = 99
+    stats = rat.RasterStatistics(dropZero=True)
+    stats.Add(array)
+    cells = array[(array != 0) & (array != 99)]
+    result = stats.Result([50], dropMax=True)
+    assert result["count"] == cells.size
+    assert np.isclose(result["mean"], cells.mean())
+    assert np.isclose(result["standard_deviation"], cells.std())
+    assert result["range"] == (cells.min(), cells.max())
+    assert result["50th"] == _Percentile(cells, 50)
+
+
+def test_raster_statistics_from_counts():
+    rng = np.random.default_rng(4)
+    array = rng.integers(0, 30, 500)
+    cells, tallied = rat.RasterStatistics(), rat.RasterStatistics()
+    cells.Add(array)
+    tallied.AddCounts(*rat.CountValues(array))
+    a, b = cells.Result([25, 75]), tallied.Result([25, 75])
+    assert a["count"] == b["count"] and a["25th"] == b["25th"]
+    assert np.isclose(a["mean"], b["mean"])
+    assert np.isclose(a["standard_deviation"], b["standard_deviation"])
+
+
+def test_raster_statistics_of_floats():
+    array = np.array([1.5, np.nan, 2.5, 4.0])
+    stats = rat.RasterStatistics()
+    stats.Add(array)
+    result = stats.Result()
+    assert result["count"] == 3
+    assert np.isclose(result["mean"], 8/3.)
+    with pytest.raises(ValueError):
+        stats.Result([50])
@@ -0,0 +1,435 @@
+"""
+Tests of the richness module's NumPy engines, on small GeoTIFFs written with the
+_rasters helpers.  The expected rasters are summed with plain NumPy.  Tests that read
+rasters need GDAL and are skipped without it.
+"""
+import os
+import numpy as np, pandas as pd
+import pytest
+from gapanalysis import richness, raster, rat
+from _rasters import WriteGeoTIFF, Grid
+
+# The size of the test grid; windows of 16 cells leave partial tiles on two edges
+HEIGHT, WIDTH, TILE = 40, 56, 16
+
+
+def _Extent(tmp_path):
+    # A CONUS extent raster of zeros with the 3x3 square of counter cells
+    extent = np.zeros((HEIGHT, WIDTH), dtype=np.uint8)
+    extent[:3, :3] = 1
+    return WriteGeoTIFF(tmp_path / "CONUS_extent.tif", extent), extent
+
+
+def _Species(tmp_path, n, seed=0, season="Any"):
+    # CONUS extent binary maps with habitat in a random box and the counter cells
+    rng = np.random.default_rng(seed)
+    os.makedirs(str(tmp_path / "maps" / season), exist_ok=True)
+    names, maps = [], []
+    for i in range(n):
+        habmap = np.zeros((HEIGHT, WIDTH), dtype=np.uint8)
+        h, w = rng.integers(5, 20), rng.integers(5, 30)
+        y, x = rng.integers(3, HEIGHT - h), rng.integers(3, WIDTH - w)
+        habmap[y:y + h, x:x + w] = rng.random((h, w)) < 0.6
+        habmap[:3, :3] = 1
+        names.append("bSPP{0}x_CONUS.tif".format(i))
+        maps.append(habmap)
+        WriteGeoTIFF(tmp_path / "maps" / season / names[-1], habmap)
+    return names, maps
+
+
+def _Read(path):
+    dataset = raster.Open(path)
+    return raster.ReadWindow(dataset, (0, 0, dataset.RasterXSize,
+                                       dataset.RasterYSize))
+
+
+def _Run(tmp_path, spp, **kwargs):
+    settings = dict(groupName="g", outLoc=str(tmp_path / "out"),
+                    modelDir=str(tmp_path / "maps") + "/", season="Any",
+                    intervalSize=2, CONUSExtent=str(tmp_path / "CONUS_extent.tif"),
+                    engine="numpy", tileSize=TILE)
+    settings.update(kwargs)
+    return richness.MapRichness(spp, **settings)
+
+
+def _Area(extent, maps):
+    # The area weighted tally, leaving the counter cells out of each map's area
+    tally = extent.astype(np.float64)
+    for habmap in maps:
+        tally += habmap/(habmap.sum() - 9.)
+    return np.floor(tally*10000 + 0.5)
+
+
+def test_map_richness_sums_the_maps(tmp_path):
+    pytest.importorskip("osgeo.gdal")
+    path, extent = _Extent(tmp_path)
+    spp, maps = _Species(tmp_path, 5)
+    outFile, outTable = _Run(tmp_path, spp)
+    richness_ = _Read(outFile)
+    assert np.array_equal(richness_, extent + np.sum(maps, axis=0))
+    # Counter cells hold 1 plus the number of species
+    assert (richness_[:3, :3] == 6).all()
+    # Intermediates are numbered like the arcpy engine's, every 2 species
+    intDir = tmp_path / "out" / "g" / "Richness_intermediates"
+    for counter in (3, 5):
+        intermediate = _Read(str(intDir / "Intermediate_{0}.tif".format(counter)))
+        assert np.array_equal(intermediate, extent + np.sum(maps[:counter - 1], axis=0))
+    values, counts = rat.ReadRAT(outFile, compute=False)
+    assert np.array_equal(np.stack([values, counts]),
+                          np.unique(richness_, return_counts=True))
+    assert not os.path.exists(str(tmp_path / "out" / "g" / "Richness_checkpoint"))
+    assert [line.split(",")[0] for line in open(outTable)] == spp
+
+
+def test_map_richness_area_weights(tmp_path):
+    pytest.importorskip("osgeo.gdal")
+    path, extent = _Extent(tmp_path)
+    spp, maps = _Species(tmp_path, 4, seed=1)
+    outFile, outTable = _Run(tmp_path, spp, weight="area")
+    assert np.array_equal(_Read(outFile), _Area(extent, maps))
+    table = pd.read_csv(outTable, index_col=0)
+    assert table.weight.tolist() == [habmap.sum() - 9. for habmap in maps]
+
+
+def test_map_richness_on_a_pool_matches_serial(tmp_path):
+    pytest.importorskip("osgeo.gdal")
+    _Extent(tmp_path)
+    spp, maps = _Species(tmp_path, 5, seed=2)
+    serial = _Read(_Run(tmp_path, spp, weight="area", groupName="serial")[0])
+    pooled = _Read(_Run(tmp_path, spp, weight="area", groupName="pooled",
+                        workers=2)[0])
+    assert np.array_equal(serial, pooled)
+
+
+def test_map_richness_with_a_footprint_index(tmp_path):
+    pytest.importorskip("osgeo.gdal")
+    path, extent = _Extent(tmp_path)
+    spp, maps = _Species(tmp_path, 5, seed=3)
+    for weight in ("None", "area"):
+        outFile, outTable = _Run(tmp_path, spp, weight=weight, groupName=weight,
+                                 indexDir=str(tmp_path / "index"))
+        expected = extent + np.sum(maps, axis=0)
+        if weight == "area":
+            expected = _Area(extent, maps)
+        assert np.array_equal(_Read(outFile), expected)
+
+
+def test_checkpoints_round_trip(tmp_path):
+    window = (16, 32, 16, 8)
+    tally = np.arange(128, dtype=np.uint16).reshape(8, 16)
+    counts = [(3, (np.array([0, 2]), np.array([100, 28]))),
+              (5, (np.array([1]), np.array([128])))]
+    richness._WriteCheckpoint(str(tmp_path), window, tally, counts)
+    assert sorted(os.listdir(str(tmp_path))) == ["Window_16_32_16_8.counts.npz",
+                                                 "Window_16_32_16_8.npy"]
+    saved, savedCounts = richness._ReadCheckpoint(str(tmp_path), window)
+    assert isinstance(saved, np.memmap) and np.array_equal(saved, tally)
+    assert [(c, v.tolist(), n.tolist()) for c, (v, n) in savedCounts] == \
+           [(c, v.tolist(), n.tolist()) for c, (v, n) in counts]
+
+
+def test_open_checkpoint_reuses_only_matching_runs(tmp_path):
+    checkDir = str(tmp_path / "Richness_checkpoint")
+    manifest = {"species": ["a.tif"], "interval": 2}
+    assert richness._OpenCheckpoint(checkDir, manifest, True, print) == []
+    for window in [(16, 0, 16, 16), (0, 16, 16, 16), (0, 0, 16, 16)]:
+        richness._WriteCheckpoint(checkDir, window, np.zeros((16, 16)), [])
+    assert richness._OpenCheckpoint(checkDir, manifest, True, print) == \
+           [(0, 0, 16, 16), (16, 0, 16, 16), (0, 16, 16, 16)]
+    # Without resume, or with another run's manifest, the windows are cleared
+    assert richness._OpenCheckpoint(checkDir, dict(manifest, interval=3), True,
+                                    print) == []
+    assert os.listdir(checkDir) == ["manifest.json"]
+    richness._WriteCheckpoint(checkDir, (0, 0, 16, 16), np.zeros((16, 16)), [])
+    assert richness._OpenCheckpoint(checkDir, manifest, False, print) == []
+
+
+def test_map_richness_resumes_from_a_checkpoint(tmp_path, monkeypatch):
+    pytest.importorskip("osgeo.gdal")
+    path, extent = _Extent(tmp_path)
+    spp, maps = _Species(tmp_path, 5, seed=4)
+    summed, stop = [], [4]
+    sumWindow = richness._SumWindow
+    def __SumWindow(window, *args):
+        if len(summed) == stop[0]:
+            raise RuntimeError("stopped")
+        summed.append(window)
+        return sumWindow(window, *args)
+    monkeypatch.setattr(richness, "_SumWindow", __SumWindow)
+    with pytest.raises(RuntimeError):
+        _Run(tmp_path, spp, weight="area")
+    checkDir = tmp_path / "out" / "g" / "Richness_checkpoint"
+    assert len([n for n in os.listdir(str(checkDir)) if n.endswith(".npy")]) == 4
+
+    # The rerun only sums the windows that weren't finished
+    first, summed[:], stop[0] = list(summed), [], None
+    outFile, outTable = _Run(tmp_path, spp, weight="area")
+    windows = raster.TileWindows(WIDTH, HEIGHT, TILE)
+    assert sorted(summed + first) == sorted(windows)
+    assert np.array_equal(_Read(outFile), _Area(extent, maps))
+    intermediate = _Read(str(tmp_path / "out" / "g" / "Richness_intermediates" /
+                             "Intermediate_5.tif"))
+    assert np.array_equal(intermediate, _Area(extent, maps[:4]))
+    values, counts = rat.ReadRAT(outFile, compute=False)
+    assert counts.sum() == HEIGHT*WIDTH
+    assert not os.path.exists(str(checkDir))
+
+
+def test_map_richness_without_checkpoints(tmp_path, monkeypatch):
+    pytest.importorskip("osgeo.gdal")
+    path, extent = _Extent(tmp_path)
+    spp, maps = _Species(tmp_path, 3, seed=5)
+    written = []
+    monkeypatch.setattr(richness, "_WriteCheckpoint", lambda *args:
+                        written.append(args))
+    outFile, outTable = _Run(tmp_path, spp, checkpoint=False)
+    assert np.array_equal(_Read(outFile), extent + np.sum(maps, axis=0))
+    assert written == []
+    assert not os.path.exists(str(tmp_path / "out" / "g" / "Richness_checkpoint"))
+
+
+def _UpdateRun(tmp_path, spp, weight, **kwargs):
+    # A richness raster of the first three species, updated to the last four
+    existing, table = _Run(tmp_path, spp[:3], weight=weight, **kwargs)
+    read = []
+    updateWindow = richness._UpdateWindow
+    def __UpdateWindow(window, existing, paths, *args):
+        read.append([os.path.basename(path) for path in paths])
+        return updateWindow(window, existing, paths, *args)
+    return existing, read, __UpdateWindow
+
+
+def test_update_richness_adds_and_removes_maps(tmp_path, monkeypatch):
+    pytest.importorskip("osgeo.gdal")
+    path, extent = _Extent(tmp_path)
+    spp, maps = _Species(tmp_path, 5, seed=6)
+    for weight in ("None", "area"):
+        existing, read, updateWindow = _UpdateRun(tmp_path, spp, weight,
+                                                  groupName=weight)
+        with monkeypatch.context() as m:
+            m.setattr(richness, "_UpdateWindow", updateWindow)
+            outFile, outTable = richness.UpdateRichness(
+                existing, str(tmp_path / "maps") + "/", "Any", add=spp[3:],
+                remove=spp[:1], weight=weight, tileSize=TILE, CONUSExtent=path)
+        # Only the maps whose values changed are read
+        assert all(paths == [spp[0], spp[3], spp[4]] for paths in read)
+        updated = _Read(outFile)
+        if weight == "None":
+            assert np.array_equal(updated, extent + np.sum(maps[1:], axis=0))
+            assert [line.split(",")[0] for line in open(outTable)] == spp[1:]
+        else:
+            # Rounded values can be a unit off a fresh run
+            assert np.abs(updated - _Area(extent, maps[1:])).max() <= 1
+            assert list(pd.read_csv(outTable, index_col=0).index) == spp[1:]
+        values, counts = rat.ReadRAT(outFile, compute=False)
+        assert np.array_equal(np.stack([values, counts]),
+                              np.unique(updated, return_counts=True))
+
+
+def test_update_richness_percentile_sums_all_maps(tmp_path):
+    pytest.importorskip("osgeo.gdal")
+    path, extent = _Extent(tmp_path)
+    spp, maps = _Species(tmp_path, 5, seed=7)
+    existing, table = _Run(tmp_path, spp[:3], weight="percentile")
+    with pytest.raises(ValueError):
+        richness.UpdateRichness(existing, str(tmp_path / "maps") + "/", "Any",
+                                add=spp[3:], weight="percentile", tileSize=TILE)
+    outFile, outTable = richness.UpdateRichness(existing, str(tmp_path / "maps") + "/",
+                                                "Any", add=spp[3:], remove=spp[:1],
+                                                weight="percentile", tileSize=TILE,
+                                                CONUSExtent=path)
+    fresh, freshTable = _Run(tmp_path, spp[1:], weight="percentile",
+                             groupName="fresh")
+    assert np.array_equal(_Read(outFile), _Read(fresh))
+    assert pd.read_csv(outTable, index_col=0).equals(pd.read_csv(freshTable,
+                                                                 index_col=0))
+    assert not [name for name in os.listdir(os.path.dirname(outFile))
+                if "_updating" in name]
+
+
+def test_update_richness_custom_weights(tmp_path):
+    pytest.importorskip("osgeo.gdal")
+    path, extent = _Extent(tmp_path)
+    spp, maps = _Species(tmp_path, 5, seed=8)
+    weights = pd.DataFrame({"strUC": [sp[:6] for sp in spp], "weight": [2, 3, 1, 4, 5]})
+    existing, table = _Run(tmp_path, spp[:3], weight="custom",
+                           weights_df=weights.copy())
+    # Species can only be added with their weights
+    with pytest.raises(ValueError):
+        richness.UpdateRichness(existing, str(tmp_path / "maps") + "/", "Any",
+                                add=spp[3:], weight="custom", tileSize=TILE)
+    outFile, outTable = richness.UpdateRichness(existing, str(tmp_path / "maps") + "/",
+                                                "Any", add=spp[3:],
+                                                weight="custom", tileSize=TILE,
+                                                weights_df=weights.copy(),
+                                                CONUSExtent=path)
+    expected = extent + sum(w*m for w, m in zip(weights.weight, maps))
+    assert np.array_equal(_Read(outFile), expected)
+    # Removing species doesn't need the weights
+    outFile, outTable = richness.UpdateRichness(existing, str(tmp_path / "maps") + "/",
+                                                "Any", remove=spp[:2],
+                                                weight="custom", tileSize=TILE,
+                                                CONUSExtent=path)
+    expected = extent + sum(w*m for w, m in zip(weights.weight[2:], maps[2:]))
+    assert np.array_equal(_Read(outFile), expected)
+    assert pd.read_csv(outTable, index_col=0).weight.to_dict() == \
+           {spp[2]: 1., spp[3]: 4., spp[4]: 5.}
+
+
+def test_weights():
+    counts = pd.Series([109., 9., 30.], index=["a.tif", "b.tif", "c.tif"])
+    area = richness._Weights(counts, "area", np.array([9, 9, 0]))
+    assert area.weight.tolist() == [100., 0., 30.]
+    # No habitat but the counters gives no weight rather than an infinite one
+    assert area.weighted_value.tolist() == [0.01, 0., 1/30.]
+    percentile = richness._Weights(counts, "percentile", 9)
+    assert np.allclose(percentile.weight, 100*np.array([3, 1, 2])/3.)
+    assert np.allclose(percentile.weighted_value, 1/percentile.weight)
+
+
+def test_counter_cells_come_from_the_catalog(tmp_path, monkeypatch):
+    pytest.importorskip("osgeo.gdal")
+    path, extent = _Extent(tmp_path)
+    spp, maps = _Species(tmp_path, 2, seed=9)
+    small = WriteGeoTIFF(tmp_path / "maps" / "Any" / "small.tif",
+                         np.ones((5, 7), np.uint8), Grid(10, 12))
+    paths = [str(tmp_path / "maps" / "Any" / sp) for sp in spp] + [small]
+    catalog = str(tmp_path / "PixelCounts.csv")
+    counters = richness._CounterCells(paths, path, catalog, path)
+    assert counters.tolist() == [9, 9, 0]
+    # With a warm catalog only the template is opened
+    opened = []
+    open_ = raster.Open
+    monkeypatch.setattr(raster, "Open", lambda path, *args:
+                        opened.append(path) or open_(path, *args))
+    assert richness._CounterCells(paths, path, catalog, path).tolist() == [9, 9, 0]
+    assert opened == [path]
+    assert richness._CounterCells(paths, None, catalog).tolist() == [9, 9, 9]
+
+
+def test_map_richness_groups_match_map_richness(tmp_path):
+    pytest.importorskip("osgeo.gdal")
+    path, extent = _Extent(tmp_path)
+    spp, maps = _Species(tmp_path, 5, seed=10)
+    groups = {"first": spp[:3], "last": spp[2:]}
+    outputs = richness.MapRichnessGroups(
+        groups, str(tmp_path / "groups"), str(tmp_path / "maps") + "/", "Any",
+        path, weight={"first": "None", "last": "area"}, tileSize=TILE,
+        scale={"last": 100})
+    assert sorted(outputs) == ["first", "last"]
+    assert np.array_equal(_Read(outputs["first"][0]),
+                          extent + np.sum(maps[:3], axis=0))
+    single = _Run(tmp_path, spp[2:], groupName="last", weight="area", scale=100)
+    assert np.array_equal(_Read(outputs["last"][0]), _Read(single[0]))
+    assert np.array_equal(pd.read_csv(outputs["last"][1]).values,
+                          pd.read_csv(single[1]).values)
+    # No intermediates are written for groups
+    assert not os.path.exists(str(tmp_path / "groups" / "first" /
+                                  "Richness_intermediates"))
+
+
+def _RawMaps(tmp_path, n, seed=0):
+    # Range-extent maps coded 1 (summer), 2 (winter), and 3 (year-round), each
+    # snapped to the test grid away from the counter cells, and their CONUS copies
+    rng = np.random.default_rng(seed)
+    os.makedirs(str(tmp_path / "raw"), exist_ok=True)
+    names, maps = [], []
+    for i in range(n):
+        h, w = rng.integers(5, 20), rng.integers(5, 30)
+        y, x = rng.integers(3, HEIGHT - h), rng.integers(3, WIDTH - w)
+        codes = rng.integers(0, 4, (h, w)).astype(np.uint8)
+        names.append("bSPP{0}x_CONUS_HabMap.tif".format(i))
+        WriteGeoTIFF(tmp_path / "raw" / names[-1], codes, Grid(x, y))
+        habmap = np.zeros((HEIGHT, WIDTH), dtype=np.uint8)
+        habmap[y:y + h, x:x + w] = codes
+        maps.append(habmap)
+    return names, maps
+
+
+def test_map_richness_seasons_matches_seasonal_copies(tmp_path):
+    pytest.importorskip("osgeo.gdal")
+    path, extent = _Extent(tmp_path)
+    spp, maps = _RawMaps(tmp_path, 4, seed=11)
+    masks = {"Summer": [np.isin(habmap, (1, 3)) for habmap in maps],
+             "Winter": [np.isin(habmap, (2, 3)) for habmap in maps],
+             "Any": [habmap > 0 for habmap in maps]}
+    outputs = richness.MapRichnessSeasons(spp, "g", str(tmp_path / "out"),
+                                          str(tmp_path / "raw") + "/", path,
+                                          tileSize=TILE)
+    assert sorted(outputs) == ["Any", "Summer", "Winter"]
+    for season in outputs:
+        # The counter cells are counted once for every species
+        expected = extent*(1 + len(spp)) + np.sum(masks[season], axis=0)
+        assert np.array_equal(_Read(outputs[season][0]), expected), season
+    # Area weights come from the seasonal pixel counts
+    outputs = richness.MapRichnessSeasons(spp, "area", str(tmp_path / "out"),
+                                          str(tmp_path / "raw") + "/", path,
+                                          weight="area", seasons=["Winter"],
+                                          tileSize=TILE, workers=2)
+    tally = extent.astype(np.float64)
+    for mask in masks["Winter"]:
+        tally += (mask + extent)/float(mask.sum())
+    assert np.array_equal(_Read(outputs["Winter"][0]),
+                          np.floor(tally*10000 + 0.5))
+    table = pd.read_csv(outputs["Winter"][1], index_col=0)
+    assert table.weight.tolist() == [mask.sum() for mask in masks["Winter"]]
+
+
+def test_kahan_add_keeps_the_lost_bits():
+    total = np.zeros(3, dtype=np.float32)
+    compensation = np.zeros_like(total)
+    naive = np.zeros_like(total)
+    mask = np.array([True, True, False])
+    for i in range(20000):
+        richness._KahanAdd(total, compensation, np.float32(0.1), mask)
+        naive[mask] += np.float32(0.1)
+    compensated = total - compensation
+    assert compensated[2] == 0
+    assert abs(compensated[0] - 2000.) < abs(naive[0] - 2000.)
+    assert abs(compensated[0] - 2000.) < 1e-3
+
+
+def test_quantized_type():
+    assert richness._QuantizedType([], "None") == np.uint16
+    assert richness._QuantizedType([0.01]*3, "area") == np.uint16
+    assert richness._QuantizedType([0.01]*3, "area", scale=100) == np.uint8
+    assert richness._QuantizedType([1, 2], "custom") == np.uint8
+    assert richness._QuantizedType([-3, 1], "custom") == np.int16
+    assert richness._QuantizedType([1.]*100, "percentile") == np.uint32
+    with pytest.raises(ValueError):
+        richness._QuantizedType([1.]*10**6, "area")
+
+
+def test_quantize():
+    area = richness._Quantize(np.array([0.00004, 0.00005, 1.23456]), "area",
+                              dtype="uint16")
+    assert area.dtype == np.uint16 and area.tolist() == [0, 1, 12346]
+    assert richness._Quantize(np.array([2.9, -0.5]), "custom").tolist() == [2, 0]
+    assert richness._Quantize(np.array([2., 1.]), "custom", scale=10).tolist() == \
+        [20, 10]
+
+
+def test_map_richness_float32_accumulator(tmp_path):
+    pytest.importorskip("osgeo.gdal")
+    path, extent = _Extent(tmp_path)
+    spp, maps = _Species(tmp_path, 6, seed=12)
+    single = _Read(_Run(tmp_path, spp, weight="area", groupName="single",
+                        accumulator="float32")[0])
+    assert np.array_equal(single, _Area(extent, maps))
+
+
+def test_map_richness_of_range_extent_maps(tmp_path):
+    pytest.importorskip("osgeo.gdal")
+    path, extent = _Extent(tmp_path)
+    spp, maps = _Species(tmp_path, 4, seed=14)
+    full = _Read(_Run(tmp_path, spp, weight="area", groupName="full")[0])
+    # The same habitat as range-extent maps, which carry no counter cells
+    os.makedirs(str(tmp_path / "range" / "Any"))
+    for sp, habmap in zip(spp, maps):
+        rows = np.flatnonzero(habmap[3:].any(axis=1)) + 3
+        cols = np.flatnonzero(habmap[:, 3:].any(axis=0)) + 3
+        box = habmap[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+        WriteGeoTIFF(tmp_path / "range" / "Any" / sp, box, Grid(cols[0], rows[0]))
+    ranged = _Run(tmp_path, spp, weight="area", groupName="range",
+                  modelDir=str(tmp_path / "range") + "/")
+    assert np.array_equal(_Read(ranged[0]), full)
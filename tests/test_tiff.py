@@ -0,0 +1,89 @@
+"""
+Tests of the GeoTIFF header reader, on small TIFFs built with struct.
+"""
+import struct
+import numpy as np
+import pytest
+from gapanalysis import tiff
+from _rasters import WriteGeoTIFF
+
+
+def _WriteTIFF(path, order="<", geoKeys=(1, 1, 0, 1, 3072, 0, 1, 5070)):
+    # Entries of (tag, type, values); values that don't fit in 4 bytes go after the IFD
+    entries = [(256, 3, [300]), (257, 3, [200]), (258, 3, [8]), (259, 3, [5]),
+               (277, 3, [1]), (339, 3, [1]),
+               (33550, 12, [30.0, 30.0, 0.0]),
+               (33922, 12, [0.0, 0.0, 0.0, -2361585.0, 3177435.0, 0.0]),
+               (34735, 3, list(geoKeys)),
+               (42113, 2, b"255\0")]
+    formats = {2: "s", 3: "H", 12: "d"}
+    sizes = {2: 1, 3: 2, 12: 8}
+    ifd = 8
+    data = ifd + 2 + 12*len(entries) + 4
+    head = (b"II" if order == "<" else b"MM") + struct.pack(order + "HI", 42, ifd)
+    body, extra = struct.pack(order + "H", len(entries)), b""
+    for tag, ftype, values in entries:
+        n = len(values)
+        if ftype == 2:
+            raw = values
+        else:
+            raw = struct.pack(order + formats[ftype]*n, *values)
+        body += struct.pack(order + "HHI", tag, ftype, n)
+        if sizes[ftype]*n <= 4:
+            body += raw.ljust(4, b"\0")
+        else:
+            body += struct.pack(order + "I", data + len(extra))
+            extra += raw
+    path.write_bytes(head + body + struct.pack(order + "I", 0) + extra)
+    return str(path)
+
+
+def test_read_header(tmp_path):
+    for order in ("<", ">"):
+        header = tiff.ReadHeader(_WriteTIFF(tmp_path / "map.tif", order))
+        assert (header["width"], header["height"]) == (300, 200)
+        assert header["bitsPerSample"] == 8 and header["compression"] == 5
+        assert header["tileWidth"] is None and not header["bigTIFF"]
+        assert header["geoTransform"] == (-2361585.0, 30.0, 0.0, 3177435.0, 0.0,
+                                          -30.0)
+        assert header["geoKeys"][3072] == 5070
+        assert header["nodata"] == 255.0
+
+
+def test_read_header_reads_past_the_first_bytes(tmp_path):
+    header = tiff.ReadHeader(_WriteTIFF(tmp_path / "map.tif"), size=16)
+    assert header["width"] == 300 and header["geoTransform"][1] == 30.0
+
+
+def test_read_header_rejects_other_files(tmp_path):
+    path = tmp_path / "map.tif"
+    path.write_bytes(b"GIF89a" + b"\0"*20)
+    with pytest.raises(ValueError):
+        tiff.ReadHeader(str(path))
+
+
+def test_describe_names_projections_like_arcpy(tmp_path):
+    path = WriteGeoTIFF(tmp_path / "a.tif", np.zeros((2, 2), np.uint8), nodata=0)
+    described = tiff.Describe(path)
+    assert described == {"projectionName": "Albers", "format": "TIFF",
+                         "pixelType": "U8", "nodataValue": 0.0}
+    # ArcGIS writes user-defined projections with an explicit transformation
+    userDefined = [1, 1, 0, 2, 3072, 0, 1, 32767, 3075, 0, 1, 11]
+    path = _WriteTIFF(tmp_path / "b.tif", geoKeys=userDefined)
+    assert tiff.Describe(path)["projectionName"] == "Albers"
+    for epsg, projection in ((26913, "Transverse_Mercator"), (3857, None)):
+        path = WriteGeoTIFF(tmp_path / "c.tif", np.zeros((2, 2), np.uint8),
+                            epsg=epsg)
+        assert tiff.Describe(path)["projectionName"] == projection, epsg
+    geographic = [1, 1, 0, 2, 1024, 0, 1, 2, 2048, 0, 1, 4326]
+    path = _WriteTIFF(tmp_path / "d.tif", geoKeys=geographic)
+    assert tiff.Describe(path)["projectionName"] == ""
+
+
+def test_describe_codes_pixel_types_like_arcpy(tmp_path):
+    for dtype, pixelType in (("uint16", "U16"), ("int16", "S16"),
+                             ("float32", "F32")):
+        path = WriteGeoTIFF(tmp_path / "a.tif", np.zeros((2, 2), dtype))
+        described = tiff.Describe(path)
+        assert described["pixelType"] == pixelType
+        assert described["nodataValue"] is None